@@ -0,0 +1,181 @@
+# =========================================================
+# THIS FILE CONTAINS THE FOLLOWING FUNCTIONS:
+# 1. load_price_paths
+# 2. forward_returns
+# 3. backtest_stats
+# 4. backtest_report
+# =========================================================
+# Backtest statistics for any set of signals: (symbol_id, date) pairs,
+# e.g. scanner results.
+#
+# The final daily bars of the signalled symbols are read once into flat
+# NumPy arrays sorted by (symbol_id, date). A signal is located by a
+# binary search on a (symbol_id, day number) key, and the bar h trading
+# days later is simply row + h (valid while it stays within the symbol's
+# rows), so every horizon is an array lookup on the same load:
+#   ret_<h>d  close h bars ahead vs the signal close, %
+#              (same as the ret_<n>d of the scanner queries, unrounded)
+#   mae_<h>d  max adverse excursion: lowest low of bars 1..h vs the
+#              signal close, %, capped at 0
+# backtest_stats aggregates per horizon (and per year / sector) in one
+# groupby: trades, win rate, expectancy, avg win / loss, return
+# percentiles and MAE.
+# =========================================================
+import time
+import traceback
+import numpy as np
+import pandas as pd
+from helper import (
+    log,
+    BACKTEST_HORIZONS,
+    BACKTEST_PERCENTILES,
+    BACKTEST_SIGNAL_BATCH
+)
+
+# day numbers stay below this (year 2243), so symbol_id * DAY_SPAN + day
+# orders like (symbol_id, date)
+DAY_SPAN = 100000
+
+def _signal_keys(symbol_ids, dates):
+    days = pd.to_datetime(pd.Series(dates), format="%Y-%m-%d").to_numpy("datetime64[D]").astype(np.int64)
+    return np.asarray(symbol_ids, dtype=np.int64) * DAY_SPAN + days
+
+# =========================================================
+# load_price_paths Function
+# Final daily bars of symbol_ids from `starts` ({symbol_id: first date},
+# one index seek per symbol) to the latest bar, as flat arrays sorted by
+# (symbol_id, date): {"key", "close", "low", "end"}; end[i] is the row
+# past the last row of row i's symbol.
+# =========================================================
+def load_price_paths(conn, starts):
+    conn.execute("DROP TABLE IF EXISTS temp.backtest_bounds")
+    conn.execute("CREATE TEMP TABLE backtest_bounds (id INTEGER PRIMARY KEY, lo TEXT)")
+    conn.executemany("INSERT INTO temp.backtest_bounds (id, lo) VALUES (?, ?)",
+                     [(int(symbol_id), str(date)) for symbol_id, date in starts.items()])
+    prices = pd.read_sql("""
+        SELECT p.symbol_id, p.date, p.close, p.low
+        FROM temp.backtest_bounds b
+        CROSS JOIN equity_price_data p
+          ON p.symbol_id = b.id AND p.timeframe = '1d' AND p.date >= b.lo
+        WHERE p.is_final = 1
+        ORDER BY p.symbol_id, p.date
+    """, conn)
+
+    symbol_ids = prices["symbol_id"].to_numpy(np.int64)
+    return {
+        "key": _signal_keys(symbol_ids, prices["date"]),
+        "close": prices["close"].to_numpy(float),
+        "low": prices["low"].to_numpy(float),
+        "end": np.searchsorted(symbol_ids, symbol_ids, side="right"),
+    }
+
+# =========================================================
+# forward_returns Function
+# ret_<h>d / mae_<h>d columns for every horizon, appended to a copy of
+# signals (symbol_id and date columns). Signals without a bar on their
+# date or without h later bars get NaN for that horizon.
+# =========================================================
+def forward_returns(paths, signals, horizons=BACKTEST_HORIZONS):
+    keys = _signal_keys(signals["symbol_id"], signals["date"])
+    pos = np.searchsorted(paths["key"], keys)
+    found = pos < len(paths["key"])
+    found[found] = paths["key"][pos[found]] == keys[found]
+    pos = np.where(found, pos, 0)
+
+    steps = np.arange(1, max(horizons) + 1)
+    columns = {f"{kind}_{days}d": np.full(len(keys), np.nan) for days in horizons for kind in ("ret", "mae")}
+
+    # blocks of signals x max(horizons) lookups
+    for i in range(0, len(keys) if len(paths["key"]) else 0, BACKTEST_SIGNAL_BATCH):
+        block = slice(i, i + BACKTEST_SIGNAL_BATCH)
+        entry = np.where(found[block], paths["close"][pos[block]], np.nan)
+        entry[entry == 0] = np.nan                    # x / 0 is NULL in SQLite
+        ahead = pos[block, None] + steps
+        inside = found[block, None] & (ahead < paths["end"][pos[block], None])
+        ahead = np.where(inside, ahead, 0)
+        closes = np.where(inside, paths["close"][ahead], np.nan)
+        lows = np.fmin.accumulate(np.where(inside, paths["low"][ahead], np.nan), axis=1)
+
+        for days in horizons:
+            ret = (closes[:, days - 1] - entry) / entry * 100
+            mae = np.minimum((lows[:, days - 1] - entry) / entry * 100, 0)
+            columns[f"ret_{days}d"][block] = ret
+            columns[f"mae_{days}d"][block] = np.where(np.isnan(ret), np.nan, mae)
+
+    return signals.reset_index(drop=True).assign(**columns)
+
+# =========================================================
+# backtest_stats Function
+# Per horizon (and per `by` column, e.g. "year" / "sector") statistics of
+# forward_returns output: trades, win_rate, expectancy (mean return),
+# avg_win, avg_loss, p<q> return percentiles, mae_mean, mae_worst; all in %.
+# Indexed by horizon (trading days), or (by, horizon).
+# =========================================================
+def backtest_stats(returns, horizons=BACKTEST_HORIZONS, by=None):
+    keys = ([by] if by else []) + ["horizon"]
+    long = pd.concat([
+        pd.DataFrame({
+            **({by: returns[by]} if by else {}),
+            "horizon": days,
+            "ret": returns[f"ret_{days}d"],
+            "mae": returns[f"mae_{days}d"],
+        })
+        for days in horizons
+    ], ignore_index=True).dropna(subset=["ret"])
+    long["win"] = long["ret"] > 0
+    long["gain"] = long["ret"].where(long["win"])
+    long["loss"] = long["ret"].where(long["ret"] < 0)   # flat trades are neither
+
+    groups = long.groupby(keys)
+    stats = groups.agg(
+        trades=("ret", "count"),
+        win_rate=("win", "mean"),
+        expectancy=("ret", "mean"),
+        avg_win=("gain", "mean"),
+        avg_loss=("loss", "mean"),
+        mae_mean=("mae", "mean"),
+        mae_worst=("mae", "min"),
+    )
+    stats["win_rate"] *= 100
+    quantiles = [q / 100 for q in BACKTEST_PERCENTILES]
+    percentiles = groups["ret"].quantile(quantiles).unstack().reindex(columns=quantiles)
+    percentiles.columns = [f"p{q}" for q in BACKTEST_PERCENTILES]
+    stats = stats.join(percentiles)
+    return stats[["trades", "win_rate", "expectancy", "avg_win", "avg_loss",
+                  *percentiles.columns, "mae_mean", "mae_worst"]]
+
+# =========================================================
+# backtest_report Function
+# Forward returns and statistics of signals (symbol_id or symbol, and
+# date columns) for every horizon: {"signals": forward_returns output
+# with year / sector, "overall", "year", "sector": backtest_stats}.
+# =========================================================
+def backtest_report(conn, signals, horizons=BACKTEST_HORIZONS):
+    try:
+        begin = time.time()
+        symbols = pd.read_sql("SELECT symbol_id, symbol, sector FROM equity_symbols", conn)
+        on = "symbol_id" if "symbol_id" in signals else "symbol"
+        signals = signals.drop(columns=[c for c in ("symbol", "symbol_id", "sector") if c != on and c in signals])
+        signals = signals.merge(symbols, on=on, how="left")
+        signals = signals.assign(
+            date=signals["date"].astype(str).str[:10],
+            year=signals["date"].astype(str).str[:4],
+            sector=signals["sector"].fillna("Unknown"),
+        ).dropna(subset=["symbol_id"])
+        signals["symbol_id"] = signals["symbol_id"].astype(np.int64)
+
+        paths = load_price_paths(conn, signals.groupby("symbol_id")["date"].min())
+        returns = forward_returns(paths, signals, horizons)
+        report = {
+            "signals": returns,
+            "overall": backtest_stats(returns, horizons),
+            "year": backtest_stats(returns, horizons, by="year"),
+            "sector": backtest_stats(returns, horizons, by="sector"),
+        }
+        print(f"✅ Backtest | {len(returns)} signals | horizons {', '.join(map(str, horizons))} | "
+              f"{time.time()-begin:.1f}s")
+        return report
+
+    except Exception as e:
+        log(f"BACKTEST FAILED | {e}")
+        traceback.print_exc()
@@ -0,0 +1,149 @@
+# =========================================================
+# THIS FILE CONTAINS THE FOLLOWING FUNCTIONS:
+# 1. read_price_changes
+# 2. advance_change_cursor
+# 3. compact_price_changes
+# 4. log_price_changes
+# 5. overlay_digest
+# 6. overlay_unchanged
+# 7. save_overlay_digest
+# =========================================================
+# Dirty tracking for the derived stages: (id, timeframe, min_date) entries
+# in *_price_changes. The ingest logs one entry per inserted batch
+# (log_price_changes, from data_manager); triggers log out-of-band updates
+# and deletes of final rows (see create_derived_tables). Writers inserting
+# prices elsewhere must log their batches the same way. A consumer stage
+# reads the entries after its cursor, recomputes what they touch — from
+# min_date on, so back-dated corrections are covered — and advances its
+# cursor in the same transaction as its own writes.
+# A consumer without a cursor has never run against the log and falls back
+# to its own full / watermark logic once.
+# The partial overlays (*_price_partial / *_indicator_partial) are
+# rewritten in place rather than logged; a consumer reading them stores a
+# digest of the overlay rows it last processed (equity_overlay_marks) to
+# tell whether they moved.
+# =========================================================
+import hashlib
+from helper import (
+    log
+)
+
+def _change_tables(is_indexs):
+    prefix = "index" if is_indexs else "equity"
+    col_id = "index_id" if is_indexs else "symbol_id"
+    return f"{prefix}_price_changes", f"{prefix}_price_change_cursors", col_id
+
+# =========================================================
+# read_price_changes Function
+# Returns (last_seq, changes) for `consumer`:
+#   last_seq -> newest log entry at the time of reading; pass it to
+#               advance_change_cursor once the changes are processed
+#   changes  -> {timeframe: {id: earliest changed date}} after the cursor,
+#               or None when the consumer has no cursor yet
+# upstream=<consumer> stops at that consumer's cursor, for stages that read
+# what another stage derives from the prices (e.g. the indicator tables).
+# =========================================================
+def read_price_changes(conn, is_indexs, consumer, upstream=None):
+    table, cursors, col_id = _change_tables(is_indexs)
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name=?", (table,)).fetchone()
+    last_seq = row[0] if row else 0
+    if upstream is not None:
+        row = conn.execute(f"SELECT last_seq FROM {cursors} WHERE consumer=?", (upstream,)).fetchone()
+        last_seq = min(last_seq, row[0] if row else 0)
+
+    row = conn.execute(f"SELECT last_seq FROM {cursors} WHERE consumer=?", (consumer,)).fetchone()
+    if row is None:
+        return last_seq, None
+
+    changes = {}
+    for symbol_id, timeframe, min_date in conn.execute(f"""
+        SELECT {col_id}, timeframe, MIN(min_date)
+        FROM {table}
+        WHERE seq > ? AND seq <= ?
+        GROUP BY {col_id}, timeframe
+    """, (row[0], last_seq)):
+        changes.setdefault(timeframe, {})[symbol_id] = min_date
+    return last_seq, changes
+
+# =========================================================
+# advance_change_cursor Function
+# Moves the consumer's cursor to last_seq. Caller commits, together with
+# the writes the changes produced.
+# =========================================================
+def advance_change_cursor(conn, is_indexs, consumer, last_seq):
+    _, cursors, _ = _change_tables(is_indexs)
+    conn.execute(f"""
+        INSERT INTO {cursors} (consumer, last_seq) VALUES (?, ?)
+        ON CONFLICT(consumer) DO UPDATE SET last_seq = MAX(last_seq, excluded.last_seq)
+    """, (consumer, last_seq))
+
+# =========================================================
+# compact_price_changes Function
+# Drops entries every consumer has read and folds the rest into one entry
+# per (id, timeframe) at its newest seq with the earliest min_date. A
+# consumer whose cursor sits between merged entries may see a change twice,
+# never miss one. Caller commits.
+# =========================================================
+def compact_price_changes(conn, is_indexs):
+    table, cursors, col_id = _change_tables(is_indexs)
+    try:
+        min_seq = conn.execute(f"SELECT MIN(last_seq) FROM {cursors}").fetchone()[0]
+        if min_seq is not None:
+            conn.execute(f"DELETE FROM {table} WHERE seq <= ?", (min_seq,))
+        conn.execute(f"""
+            UPDATE {table} SET min_date = (
+                SELECT MIN(c.min_date) FROM {table} c
+                WHERE c.{col_id} = {table}.{col_id} AND c.timeframe = {table}.timeframe
+            )
+            WHERE seq IN (SELECT MAX(seq) FROM {table} GROUP BY {col_id}, timeframe)
+        """)
+        conn.execute(f"""
+            DELETE FROM {table}
+            WHERE seq NOT IN (SELECT MAX(seq) FROM {table} GROUP BY {col_id}, timeframe)
+        """)
+    except Exception as e:
+        log(f"CHANGE LOG COMPACTION FAILED | {table} | {e}")
+        raise
+
+# =========================================================
+# log_price_changes Function
+# Appends (id, timeframe, min_date) entries: one per ingested batch of
+# price rows, or the pairs a consumer failed on, handed back to the log
+# after advancing its cursor. Caller commits.
+# =========================================================
+def log_price_changes(conn, is_indexs, rows):
+    table, _, col_id = _change_tables(is_indexs)
+    conn.executemany(f"""
+        INSERT INTO {table} ({col_id}, timeframe, min_date) VALUES (?, ?, ?)
+    """, rows)
+
+# =========================================================
+# overlay_digest Function
+# Digest of the rows of the given overlay tables (one row per id and
+# timeframe, so a cheap read).
+# =========================================================
+def overlay_digest(conn, overlays):
+    digest = hashlib.sha1()
+    for overlay in overlays:
+        for row in conn.execute(f"SELECT * FROM {overlay} ORDER BY 1, timeframe"):
+            digest.update(repr(row).encode())
+    return digest.hexdigest()
+
+# =========================================================
+# overlay_unchanged Function
+# True when `consumer` last ran against overlays with this digest.
+# =========================================================
+def overlay_unchanged(conn, consumer, digest):
+    row = conn.execute("SELECT digest FROM equity_overlay_marks WHERE consumer=?", (consumer,)).fetchone()
+    return row is not None and row[0] == digest
+
+# =========================================================
+# save_overlay_digest Function
+# Records the overlay digest `consumer` has processed. Caller commits,
+# together with the writes.
+# =========================================================
+def save_overlay_digest(conn, consumer, digest):
+    conn.execute("""
+        INSERT INTO equity_overlay_marks (consumer, digest) VALUES (?, ?)
+        ON CONFLICT(consumer) DO UPDATE SET digest = excluded.digest
+    """, (consumer, digest))
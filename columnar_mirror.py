@@ -0,0 +1,361 @@
+# =========================================================
+# THIS FILE CONTAINS THE FOLLOWING FUNCTIONS:
+# 1. sync_columnar_mirror
+# 2. read_columnar
+# 3. columnar_arrays
+# 4. read_columnar_pandas
+# =========================================================
+# Columnar mirror of the price and indicator tables for analytical scans.
+#
+# Layout (Arrow IPC files, uncompressed so they can be memory-mapped):
+#   {COLUMNAR_DIR}/{table}/timeframe={tf}/year={yyyy}/part-00000.arrow
+#   {COLUMNAR_DIR}/{table}/_manifest.json   -> {tf: {id: last mirrored date}}
+#                                              (+ "_generations" for indicators)
+#
+# Only final rows are mirrored (partial candles are replaced intraday).
+# Each sync first follows the price change log (one consumer per mirrored
+# table, columnar_<table>; the indicator table only up to the indicator
+# stage's cursor): for every logged (id, timeframe, min_date) the rows from
+# min_date on are dropped from the partitions holding them and the id's
+# watermark is set back to its last final row before min_date. Then the
+# rows past every watermark are appended as one new part per touched
+# partition; partitions with more than COLUMNAR_MAX_PARTS parts are
+# compacted into one file sorted by (id, date).
+# Indicator rows rewritten without a price change (columns= backfills, a
+# full indicator rebuild) are not logged but bump the indicator generation:
+# the indicator mirror keeps the generations it was synced at and is rebuilt
+# when they moved. So is an existing mirror that has no change log cursor yet.
+#
+# pyarrow is optional: only this module needs it.
+# =========================================================
+import os
+import json
+import time
+import shutil
+import traceback
+import numpy as np
+from helper import (
+    log,
+    FREQUENCIES,
+    PRICE_CHUNK_ROWS,
+    COLUMNAR_DIR,
+    COLUMNAR_MAX_PARTS
+)
+from change_log import (
+    read_price_changes,
+    advance_change_cursor,
+    compact_price_changes
+)
+from indicator_state import indicator_generations
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+# Non-value columns of the mirrored tables
+KEY_COLUMNS = ("timeframe", "date", "is_final")
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("pyarrow is required for the columnar mirror: pip install pyarrow")
+
+def _table_dir(table_name):
+    return os.path.join(COLUMNAR_DIR, table_name)
+
+def _partition_dir(table_name, timeframe, year):
+    return os.path.join(_table_dir(table_name), f"timeframe={timeframe}", f"year={year}")
+
+def _part_files(path):
+    if not os.path.isdir(path):
+        return []
+    return sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith(".arrow"))
+
+def _load_manifest(table_name):
+    path = os.path.join(_table_dir(table_name), "_manifest.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def _save_manifest(table_name, manifest):
+    path = os.path.join(_table_dir(table_name), "_manifest.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(path + ".tmp", path)
+
+def _read_file(path):
+    # memory-mapped: buffers point into the page cache, nothing is copied
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+def _write_file(path, table):
+    try:
+        with pa.OSFile(path + ".tmp", "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    except BaseException:
+        if os.path.exists(path + ".tmp"):
+            os.remove(path + ".tmp")
+        raise
+    os.replace(path + ".tmp", path)
+
+# =========================================================
+# _compact_partition Function
+# Rewrites a partition with too many parts as a single (id, date) sorted file.
+# =========================================================
+def _compact_partition(path, col_id):
+    parts = _part_files(path)
+    if len(parts) <= COLUMNAR_MAX_PARTS:
+        return
+    table = pa.concat_tables([_read_file(p) for p in parts], promote_options="default")
+    table = table.sort_by([(col_id, "ascending"), ("date", "ascending")])
+    _write_file(os.path.join(path, "part-00000.arrow.new"), table)
+    for p in parts:
+        os.remove(p)
+    os.replace(os.path.join(path, "part-00000.arrow.new"), os.path.join(path, "part-00000.arrow"))
+
+# =========================================================
+# _drop_changed_rows Function
+# Removes the rows of every changed id from its min_date on from the
+# mirrored partitions of one timeframe (each touched partition is
+# rewritten as one sorted file) and sets those ids' watermarks back to
+# their last final row before min_date (never forward). Returns the rows
+# dropped.
+# =========================================================
+def _drop_changed_rows(conn, table_name, col_id, timeframe, has_final, changes, watermarks):
+    if not changes:
+        return 0
+    final_only = "AND is_final=1" if has_final else ""
+    changed = np.array(sorted(changes), dtype=np.int64)
+    # a re-queued entry without a date ("") covers the whole history
+    cutoffs = np.array([changes[i] or "0001-01-01" for i in changed], dtype=str).astype("datetime64[s]")
+    first_year = int(cutoffs.min().astype("datetime64[Y]").astype(int)) + 1970
+
+    dropped = 0
+    base = os.path.join(_table_dir(table_name), f"timeframe={timeframe}")
+    years = sorted(int(name[5:]) for name in os.listdir(base) if name.startswith("year=")) if os.path.isdir(base) else []
+    for year in years:
+        if year < first_year:
+            continue
+        path = _partition_dir(table_name, timeframe, year)
+        parts = _part_files(path)
+        if not parts:
+            continue
+        table = pa.concat_tables([_read_file(p) for p in parts], promote_options="default")
+        ids = table.column(col_id).to_numpy()
+        dates = table.column("date").to_numpy()
+        pos = np.minimum(np.searchsorted(changed, ids), len(changed) - 1)
+        stale = (changed[pos] == ids) & (dates >= cutoffs[pos])
+        if not stale.any():
+            continue
+        kept = table.filter(pa.array(~stale))
+        kept = kept.sort_by([(col_id, "ascending"), ("date", "ascending")])
+        _write_file(os.path.join(path, "part-00000.arrow.new"), kept)
+        for p in parts:
+            os.remove(p)
+        os.replace(os.path.join(path, "part-00000.arrow.new"), os.path.join(path, "part-00000.arrow"))
+        dropped += int(stale.sum())
+
+    for symbol_id, min_date in changes.items():
+        row = conn.execute(f"""
+            SELECT MAX(date) FROM {table_name}
+            WHERE {col_id}=? AND timeframe=? AND date < ? {final_only}
+        """, (symbol_id, timeframe, min_date)).fetchone()
+        if str(symbol_id) in watermarks:
+            watermarks[str(symbol_id)] = min(watermarks[str(symbol_id)], row[0] or "")
+    return dropped
+
+# =========================================================
+# _mirror_timeframe Function
+# Streams the rows of one timeframe past the watermarks (ORDER BY id, date,
+# fetchmany) and writes one record batch per chunk and year into a new part
+# per partition. Returns (rows written, updated watermarks).
+# =========================================================
+def _mirror_timeframe(conn, table_name, table_symbols, col_id, timeframe, value_columns,
+                      has_final, watermarks):
+    conn.execute("DROP TABLE IF EXISTS temp.columnar_bounds")
+    conn.execute("CREATE TEMP TABLE columnar_bounds (id INTEGER PRIMARY KEY, last_date TEXT)")
+    conn.executemany("INSERT INTO temp.columnar_bounds (id, last_date) VALUES (?, ?)",
+                     [(int(k), v) for k, v in watermarks.items()])
+    final_only = "AND t.is_final=1" if has_final else ""
+
+    # CROSS JOIN pins the symbol table as the outer loop → per-symbol index seeks, no sort
+    cur = conn.execute(f"""
+        SELECT sym.{col_id}, t.date, {", ".join("t." + c for c in value_columns)}
+        FROM {table_symbols} sym
+        LEFT JOIN temp.columnar_bounds b ON b.id = sym.{col_id}
+        CROSS JOIN {table_name} t
+          ON t.{col_id} = sym.{col_id} AND t.timeframe = ? AND t.date > COALESCE(b.last_date, '')
+        WHERE 1=1 {final_only}
+        ORDER BY sym.{col_id}, t.date
+    """, (timeframe,))
+
+    schema = pa.schema(
+        [(col_id, pa.int64()), ("date", pa.timestamp("s"))]
+        + [(c, pa.float64()) for c in value_columns]
+    )
+    writers, written = {}, 0   # year -> (path, sink, writer)
+    complete = False
+    try:
+        while True:
+            rows = cur.fetchmany(PRICE_CHUNK_ROWS)
+            if not rows:
+                break
+            ids, dates, *cols = zip(*rows)
+            ids = np.array(ids, dtype=np.int64)
+            date_text = np.array(dates, dtype=str)
+            dates = date_text.astype("datetime64[s]")
+            values = np.array(cols, dtype=float).reshape(len(value_columns), len(ids))   # NULL → NaN
+            years = dates.astype("datetime64[Y]").astype(int) + 1970
+
+            for year in np.unique(years):
+                mask = years == year
+                if year not in writers:
+                    path = _partition_dir(table_name, timeframe, int(year))
+                    os.makedirs(path, exist_ok=True)
+                    part = os.path.join(path, f"part-{time.time_ns()}.arrow")
+                    sink = pa.OSFile(part + ".tmp", "wb")
+                    writers[year] = (part, sink, pa.ipc.new_file(sink, schema))
+                batch = pa.record_batch(
+                    [pa.array(ids[mask]), pa.array(dates[mask])]
+                    + [pa.array(values[i][mask]) for i in range(len(value_columns))],
+                    schema=schema,
+                )
+                writers[year][2].write_batch(batch)
+
+            # ids are ascending, so the last date seen per id is its new watermark
+            last = np.concatenate([np.flatnonzero(ids[1:] != ids[:-1]), [len(ids) - 1]])
+            for i in last:
+                watermarks[str(ids[i])] = str(date_text[i])
+            written += len(ids)
+        complete = True
+    finally:
+        for part, sink, writer in writers.values():
+            writer.close()
+            sink.close()
+            if not complete:
+                os.remove(part + ".tmp")    # a failed sync leaves no half-written part
+
+    # parts only become visible once complete
+    for part, _, _ in writers.values():
+        os.replace(part + ".tmp", part)
+        _compact_partition(os.path.dirname(part), col_id)
+    return written, watermarks
+
+# =========================================================
+# sync_columnar_mirror Function
+# Brings the columnar mirror of the price and indicator tables up to date
+# from the change log and their watermarks. rebuild=True drops the mirror
+# and rewrites it.
+# =========================================================
+def sync_columnar_mirror(conn, is_indexs=False, rebuild=False):
+    _require_pyarrow()
+    table_symbols = "index_symbols" if is_indexs else "equity_symbols"
+    col_id        = "index_id"      if is_indexs else "symbol_id"
+    tables = ["index_price_data", "index_indicators"] if is_indexs else ["equity_price_data", "equity_indicators"]
+    indicator_table = tables[1]
+
+    for table_name in tables:
+        start = time.time()
+        try:
+            columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")]
+            value_columns = [c for c in columns if c != col_id and c not in KEY_COLUMNS]
+            has_final = "is_final" in columns
+
+            consumer = f"columnar_{table_name}"
+            upstream = indicator_table if table_name == indicator_table else None
+            change_seq, changes = read_price_changes(conn, is_indexs, consumer, upstream=upstream)
+            generations = indicator_generations(conn, is_indexs) if upstream else None
+            mirrored = _load_manifest(table_name)
+            fresh = rebuild
+            if changes is None and mirrored:
+                print(f"🧹 {table_name} mirror has no change log cursor yet — rebuilding")
+                fresh = True
+            elif upstream and mirrored and mirrored.get("_generations") != generations:
+                print(f"🧹 {table_name} rewritten outside the change log — rebuilding")
+                fresh = True
+
+            if fresh and os.path.isdir(_table_dir(table_name)):
+                shutil.rmtree(_table_dir(table_name))
+            os.makedirs(_table_dir(table_name), exist_ok=True)
+            manifest = _load_manifest(table_name)
+
+            total = 0
+            for timeframe in FREQUENCIES:
+                dropped = _drop_changed_rows(
+                    conn, table_name, col_id, timeframe, has_final,
+                    {} if fresh else (changes or {}).get(timeframe, {}), manifest.setdefault(timeframe, {})
+                )
+                if dropped:
+                    print(f"  ✔ {table_name} {timeframe} | {dropped} changed rows dropped")
+                written, manifest[timeframe] = _mirror_timeframe(
+                    conn, table_name, table_symbols, col_id, timeframe, value_columns,
+                    has_final, manifest.get(timeframe, {})
+                )
+                # manifest after the parts: a crash re-appends, never skips rows
+                _save_manifest(table_name, manifest)
+                total += written
+                print(f"  ✔ {table_name} {timeframe} | {written} rows appended")
+
+            if upstream:
+                manifest["_generations"] = generations
+                _save_manifest(table_name, manifest)
+            advance_change_cursor(conn, is_indexs, consumer, change_seq)
+            compact_price_changes(conn, is_indexs)
+            conn.commit()
+            print(f"✅ Columnar mirror {table_name} synced | {total} rows | {time.time()-start:.1f}s")
+
+        except Exception as e:
+            print(f"❌ COLUMNAR MIRROR FAILED {table_name} | {e}")
+            traceback.print_exc()
+
+# =========================================================
+# read_columnar Function
+# Memory-maps the mirrored partitions of one table/timeframe (optionally
+# a list of years) into a pyarrow Table without copying. `columns` limits
+# the columns returned (id and date are always included).
+# =========================================================
+def read_columnar(table_name, timeframe, columns=None, years=None):
+    _require_pyarrow()
+    base = os.path.join(_table_dir(table_name), f"timeframe={timeframe}")
+    if not os.path.isdir(base):
+        return None
+    tables = []
+    for name in sorted(os.listdir(base)):
+        if not name.startswith("year=") or (years is not None and int(name[5:]) not in years):
+            continue
+        tables.extend(_read_file(p) for p in _part_files(os.path.join(base, name)))
+    if not tables:
+        return None
+    table = pa.concat_tables(tables, promote_options="default")
+    if columns is not None:
+        keys = [table.column_names[0], "date"]
+        table = table.select(keys + [c for c in columns if c not in keys])
+    return table
+
+# =========================================================
+# columnar_arrays Function
+# {column: NumPy array} of a Table from read_columnar. A column backed by
+# a single chunk is a view on the mapped file; several chunks are joined.
+# =========================================================
+def columnar_arrays(table):
+    arrays = {}
+    for name in table.column_names:
+        column = table.column(name)
+        if column.num_chunks == 1:
+            arrays[name] = column.chunk(0).to_numpy(zero_copy_only=True)
+        else:
+            arrays[name] = column.to_numpy()
+    return arrays
+
+# =========================================================
+# read_columnar_pandas Function
+# read_columnar as a DataFrame; numeric single-chunk columns are not copied.
+# =========================================================
+def read_columnar_pandas(table_name, timeframe, columns=None, years=None):
+    table = read_columnar(table_name, timeframe, columns, years)
+    if table is None:
+        log(f"No columnar mirror for {table_name} {timeframe}")
+        return None
+    return table.to_pandas(split_blocks=True, self_destruct=False)
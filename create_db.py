@@ -1,12 +1,322 @@
 # =========================================================
 # THIS FILE CONTAINS THE FOLLOWING FUNCTIONS:
+# mtf_daily_columns()
+# create_derived_tables(cur)
 # create_stock_database(drop_existing=True)
 # =========================================================
 import sqlite3
 import os
 from helper import (
-    log, DB_FILE
+    log, DB_FILE,
+    MTF_COLUMNS, MTF_FORWARD_DAYS
 )
+from indicator_registry import indicator_column_types
+
+# =========================================================
+# MULTI-TIMEFRAME DAILY COLUMNS
+# Value columns of equity_mtf_daily, in table order:
+# {column: (source, expression)} where source is "1d" (daily indicator or
+# price row), "1wk" / "1mo" (indicator row of the mapped week / month),
+# "lag" (previous trading day) or "lead" (n trading days ahead).
+# =========================================================
+def mtf_daily_columns():
+    columns = {"close": ("1d", "p.close"), "prev_close": ("lag", "close")}
+    for column in MTF_COLUMNS["1d"]:
+        columns[column] = ("1d", f"i.{column}")
+        columns[f"prev_{column}"] = ("lag", column)
+    for timeframe, prefix in (("1wk", "w_"), ("1mo", "m_")):
+        for column in MTF_COLUMNS[timeframe]:
+            columns[prefix + column] = (timeframe, column)
+    for days in MTF_FORWARD_DAYS:
+        columns[f"close_{days}d"] = ("lead", ("close", days))
+    return columns
+
+# =========================================================
+# DERIVED TABLES
+# Tables maintained by the refresh jobs. Safe to run against an existing
+# database, so the jobs call this before touching them.
+# =========================================================
+def create_derived_tables(cur):
+    # =========================================================
+    # EQUITY / INDEX INDICATOR STATE (DERIVED)
+    # Recursive indicator state as of last_date, used to advance
+    # indicators by new bars only.
+    # =========================================================
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS equity_indicator_state (
+        symbol_id INTEGER NOT NULL,
+        timeframe TEXT NOT NULL,
+        last_date DATE NOT NULL,
+        state TEXT NOT NULL,
+        PRIMARY KEY (symbol_id, timeframe),
+        FOREIGN KEY (symbol_id) REFERENCES equity_symbols(symbol_id),
+        FOREIGN KEY (timeframe) REFERENCES timeframes(timeframe)
+    );
+    """)
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS index_indicator_state (
+        index_id INTEGER NOT NULL,
+        timeframe TEXT NOT NULL,
+        last_date DATE NOT NULL,
+        state TEXT NOT NULL,
+        PRIMARY KEY (index_id, timeframe),
+        FOREIGN KEY (index_id) REFERENCES index_symbols(index_id),
+        FOREIGN KEY (timeframe) REFERENCES timeframes(timeframe)
+    );
+    """)
+
+    # =========================================================
+    # EQUITY / INDEX INDICATOR GENERATION (DERIVED)
+    # Write counter per timeframe, bumped whenever indicator rows are
+    # rewritten outside the change log (indicator_state.bump_indicator_generation).
+    # =========================================================
+    for prefix in ("equity", "index"):
+        cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {prefix}_indicator_generation (
+            timeframe TEXT PRIMARY KEY,
+            generation INTEGER NOT NULL
+        );
+        """)
+
+    # =========================================================
+    # EQUITY / INDEX PRICE CHANGE LOG (DERIVED)
+    # (id, timeframe, min_date) entries for changed final price rows. The
+    # ingest logs one entry per inserted batch (change_log.log_price_changes
+    # from data_manager); out-of-band updates / deletes of final rows are
+    # logged by the triggers below. Each consumer stage keeps its own
+    # cursor (last seq read) in *_price_change_cursors.
+    # =========================================================
+    for prefix, col_id, has_final, final_old in (
+        ("equity", "symbol_id", True, "WHEN OLD.is_final = 1"),
+        ("index", "index_id", False, ""),
+    ):
+        cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {prefix}_price_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            {col_id} INTEGER NOT NULL,
+            timeframe TEXT NOT NULL,
+            min_date DATE NOT NULL
+        );
+        """)
+        cur.execute(f"""
+        CREATE INDEX IF NOT EXISTS idx_{prefix}_price_changes
+        ON {prefix}_price_changes({col_id}, timeframe);
+        """)
+        cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {prefix}_price_change_cursors (
+            consumer TEXT PRIMARY KEY,
+            last_seq INTEGER NOT NULL
+        );
+        """)
+
+        # triggers need the price table (missing only before create_stock_database)
+        if not cur.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (f"{prefix}_price_data",)
+        ).fetchone():
+            continue
+        final_any = "WHEN OLD.is_final = 1 OR NEW.is_final = 1" if has_final else ""
+        # a row-level insert trigger doubled the writes of every bulk ingest
+        if cur.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='trigger' AND name=?", (f"trg_{prefix}_price_insert",)
+        ).fetchone():
+            cur.execute(f"DROP TRIGGER trg_{prefix}_price_insert")
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{prefix}_price_update
+        AFTER UPDATE ON {prefix}_price_data {final_any}
+        BEGIN
+            INSERT INTO {prefix}_price_changes ({col_id}, timeframe, min_date)
+            VALUES (NEW.{col_id}, NEW.timeframe, MIN(OLD.date, NEW.date));
+        END;
+        """)
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{prefix}_price_delete
+        AFTER DELETE ON {prefix}_price_data {final_old}
+        BEGIN
+            INSERT INTO {prefix}_price_changes ({col_id}, timeframe, min_date)
+            VALUES (OLD.{col_id}, OLD.timeframe, OLD.date);
+        END;
+        """)
+
+    # =========================================================
+    # EQUITY / INDEX PARTIAL OVERLAY (DERIVED)
+    # The in-progress 1wk / 1mo candle and its indicators, one row per
+    # (id, timeframe), rewritten by the intraday partial refresh instead
+    # of churning partial rows through the main tables.
+    # =========================================================
+    def table_exists(name):
+        return cur.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)
+        ).fetchone() is not None
+
+    indicator_ddl = ",\n        ".join(
+        f"{column} {sql_type}" for column, sql_type in indicator_column_types().items()
+    )
+    first_overlay = {}
+    for prefix, col_id, table_symbols, volume_ddl in (
+        ("equity", "symbol_id", "equity_symbols", "\n        volume REAL,"),
+        ("index", "index_id", "index_symbols", ""),
+    ):
+        first_overlay[prefix] = not table_exists(f"{prefix}_price_partial")
+        cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {prefix}_price_partial (
+            {col_id} INTEGER NOT NULL,
+            timeframe TEXT NOT NULL,
+            date DATE NOT NULL,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL,
+            adj_close REAL,{volume_ddl}
+            PRIMARY KEY ({col_id}, timeframe),
+            FOREIGN KEY ({col_id}) REFERENCES {table_symbols}({col_id}),
+            FOREIGN KEY (timeframe) REFERENCES timeframes(timeframe)
+        );
+        """)
+        cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {prefix}_indicator_partial (
+            {col_id} INTEGER NOT NULL,
+            timeframe TEXT NOT NULL,
+            date DATE NOT NULL,
+            {indicator_ddl},
+            PRIMARY KEY ({col_id}, timeframe),
+            FOREIGN KEY ({col_id}) REFERENCES {table_symbols}({col_id}),
+            FOREIGN KEY (timeframe) REFERENCES timeframes(timeframe)
+        );
+        """)
+
+    # overlay digest each consumer stage last processed (change_log)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS equity_overlay_marks (
+        consumer TEXT PRIMARY KEY,
+        digest TEXT NOT NULL
+    );
+    """)
+
+    # =========================================================
+    # EQUITY TIMEFRAME MAP (DERIVED)
+    # Daily date -> date of the 1wk / 1mo bar in force that day (latest bar
+    # dated on or before it, partial candles included), so scanners align
+    # timeframes with equi-joins. is_partial marks rows pointing at an
+    # overlay candle; they are recomputed whenever the overlay moves.
+    # =========================================================
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS equity_timeframe_map (
+        symbol_id INTEGER NOT NULL,
+        date DATE NOT NULL,
+        weekly_date DATE,
+        monthly_date DATE,
+        is_partial INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (symbol_id, date),
+        FOREIGN KEY (symbol_id) REFERENCES equity_symbols(symbol_id)
+    ) WITHOUT ROWID;
+    """)
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_equity_timeframe_map_partial
+    ON equity_timeframe_map(symbol_id, date) WHERE is_partial = 1;
+    """)
+
+    # =========================================================
+    # EQUITY MULTI-TIMEFRAME DAILY TABLE (DERIVED)
+    # One row per symbol and final trading day with the day's close and
+    # indicators, its week's / month's indicators (through the timeframe
+    # map), previous-day values and forward closes. Clustered by date so
+    # scanners read it as one filtered range scan. Dropped and rebuilt by
+    # refresh_mtf_daily when MTF_COLUMNS change.
+    # =========================================================
+    mtf_ddl = ",\n        ".join(f"{column} REAL" for column in mtf_daily_columns())
+    existing = [row[1] for row in cur.execute("PRAGMA table_info(equity_mtf_daily)")]
+    expected = ["date", "symbol_id", *mtf_daily_columns(), "is_partial"]
+    if existing and existing != expected:
+        log("equity_mtf_daily columns changed — dropping it for a rebuild")
+        cur.execute("DROP TABLE equity_mtf_daily")
+        cur.execute("DELETE FROM equity_price_change_cursors WHERE consumer='equity_mtf_daily'")
+    cur.execute(f"""
+    CREATE TABLE IF NOT EXISTS equity_mtf_daily (
+        date DATE NOT NULL,
+        symbol_id INTEGER NOT NULL,
+        {mtf_ddl},
+        is_partial INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (date, symbol_id),
+        FOREIGN KEY (symbol_id) REFERENCES equity_symbols(symbol_id)
+    ) WITHOUT ROWID;
+    """)
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_equity_mtf_daily_symbol
+    ON equity_mtf_daily(symbol_id, date);
+    """)
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_equity_mtf_daily_partial
+    ON equity_mtf_daily(symbol_id, date) WHERE is_partial = 1;
+    """)
+
+    # =========================================================
+    # INDICATOR COLUMNS
+    # Indicators registered after the database was created get their
+    # column added here; the refresh backfills them with columns=[...].
+    # =========================================================
+    for table in ("equity_indicators", "index_indicators",
+                  "equity_indicator_partial", "index_indicator_partial"):
+        existing = {row[1] for row in cur.execute(f"PRAGMA table_info({table})")}
+        if not existing:
+            continue
+        for column, sql_type in indicator_column_types().items():
+            if column not in existing:
+                cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {sql_type}")
+                log(f"Added indicator column {table}.{column}")
+
+    # =========================================================
+    # FINAL + PARTIAL VIEWS
+    # *_price_all / *_indicators_all = final rows (is_final = 1) plus the
+    # overlay (is_final = 0). A partial row dated like a stored final row
+    # is hidden. Rebuilt only when their columns change (new indicator
+    # columns), so read paths calling this never write the schema.
+    # =========================================================
+    def create_view(name, view_columns, select):
+        existing = [row[1] for row in cur.execute(f"PRAGMA table_info({name})")]
+        if existing == view_columns:
+            return
+        if existing:
+            cur.execute(f"DROP VIEW {name}")
+        cur.execute(f"CREATE VIEW {name} AS {select}")
+
+    columns = list(indicator_column_types())
+    for prefix, col_id, final_flag, volume, partial_volume in (
+        ("equity", "symbol_id", "is_final", "volume, ", "o.volume, "),
+        ("index", "index_id", "1 AS is_final", "", ""),
+    ):
+        if not (table_exists(f"{prefix}_price_data") and table_exists(f"{prefix}_indicators")):
+            continue
+        if prefix == "equity" and first_overlay[prefix]:
+            # partial rows used to live in the main tables: move out once
+            cur.execute("DELETE FROM equity_price_data WHERE is_final=0")
+            cur.execute("DELETE FROM equity_indicators WHERE is_final=0")
+
+        price_columns = [col_id, "timeframe", "date", "open", "high", "low", "close", "adj_close",
+                         *(["volume"] if volume else []), "is_final"]
+        create_view(f"{prefix}_price_all", price_columns, f"""
+        SELECT {col_id}, timeframe, date, open, high, low, close, adj_close, {volume}{final_flag}
+        FROM {prefix}_price_data
+        UNION ALL
+        SELECT o.{col_id}, o.timeframe, o.date, o.open, o.high, o.low, o.close, o.adj_close, {partial_volume}0
+        FROM {prefix}_price_partial o
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {prefix}_price_data f
+            WHERE f.{col_id} = o.{col_id} AND f.timeframe = o.timeframe AND f.date = o.date
+        );
+        """)
+        create_view(f"{prefix}_indicators_all", [col_id, "timeframe", "date", *columns, "is_final"], f"""
+        SELECT {col_id}, timeframe, date, {", ".join(columns)}, {final_flag}
+        FROM {prefix}_indicators
+        UNION ALL
+        SELECT o.{col_id}, o.timeframe, o.date, {", ".join("o." + c for c in columns)}, 0
+        FROM {prefix}_indicator_partial o
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {prefix}_indicators f
+            WHERE f.{col_id} = o.{col_id} AND f.timeframe = o.timeframe AND f.date = o.date
+        );
+        """)
+
 
 def create_stock_database(drop_existing=True):
     # -----------------------------
@@ -25,6 +335,11 @@ def create_stock_database(drop_existing=True):
     conn.execute("PRAGMA foreign_keys=ON;")
     cur = conn.cursor()
 
+    # indicator columns come from the indicator registry
+    indicator_ddl = ",\n            ".join(
+        f"{column} {sql_type}" for column, sql_type in indicator_column_types().items()
+    )
+
     try:
         # =========================================================
         # EQUITY SYMBOLS
@@ -110,28 +425,12 @@ def create_stock_database(drop_existing=True):
         # =========================================================
         # EQUITY INDICATORS
         # =========================================================
-        cur.execute("""
+        cur.execute(f"""
         CREATE TABLE IF NOT EXISTS equity_indicators (
             symbol_id INTEGER NOT NULL,
             timeframe TEXT NOT NULL,
             date DATE NOT NULL,
-            sma_20 REAL,
-            sma_50 REAL,
-            sma_200 REAL,
-            rsi_3 REAL,
-            rsi_9 REAL,
-            rsi_14 REAL,
-            macd REAL,
-            macd_signal REAL,
-            bb_upper REAL,
-            bb_middle REAL,
-            bb_lower REAL,
-            atr_14 REAL,
-            supertrend REAL,
-            supertrend_dir INTEGER,
-            ema_rsi_9_3 REAL,
-            wma_rsi_9_21 REAL,
-            pct_price_change REAL,
+            {indicator_ddl},
             is_final BOOLEAN NOT NULL DEFAULT TRUE,
             PRIMARY KEY (symbol_id, timeframe, date),
             FOREIGN KEY (symbol_id) REFERENCES equity_symbols(symbol_id),
@@ -142,28 +441,12 @@ def create_stock_database(drop_existing=True):
         # =========================================================
         # INDEX INDICATORS
         # =========================================================
-        cur.execute("""
+        cur.execute(f"""
         CREATE TABLE IF NOT EXISTS index_indicators (
             index_id INTEGER NOT NULL,
             timeframe TEXT NOT NULL,
             date DATE NOT NULL,
-            sma_20 REAL,
-            sma_50 REAL,
-            sma_200 REAL,
-            rsi_3 REAL,
-            rsi_9 REAL,
-            rsi_14 REAL,
-            macd REAL,
-            macd_signal REAL,
-            bb_upper REAL,
-            bb_middle REAL,
-            bb_lower REAL,
-            atr_14 REAL,
-            supertrend REAL,
-            supertrend_dir INTEGER,
-            ema_rsi_9_3 REAL,
-            wma_rsi_9_21 REAL,
-            pct_price_change REAL,
+            {indicator_ddl},
             PRIMARY KEY (index_id, timeframe, date),
             FOREIGN KEY (index_id) REFERENCES index_symbols(index_id),
             FOREIGN KEY (timeframe) REFERENCES timeframes(timeframe)
@@ -196,6 +479,11 @@ def create_stock_database(drop_existing=True):
         );
         """)
 
+        # =========================================================
+        # DERIVED TABLES
+        # =========================================================
+        create_derived_tables(cur)
+
         # =========================================================
         # INDEXES
         # =========================================================
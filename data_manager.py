@@ -30,6 +30,13 @@ from helper import (
 from sql import (
     SQL_MAP
 )
+from create_db import create_derived_tables
+from change_log import (
+    read_price_changes,
+    advance_change_cursor,
+    compact_price_changes,
+    log_price_changes
+)
 
 # OPEN DATABSE CONNECTION
 def get_db_connection():
@@ -123,6 +130,10 @@ def insert_equity_price_data(df, symbol_id, timeframe, conn):
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, rows)
 
+        # one change log entry for the batch (derived stages recompute from its first date)
+        if cur.rowcount > 0:
+            log_price_changes(conn, False, [(symbol_id, timeframe, min(row[2] for row in rows))])
+
         conn.commit()
 
     except Exception as e:
@@ -522,6 +533,8 @@ def download_index_price_data_all_timeframes(conn,daily_dt,weekly_dt,monthly_dt,
                     (index_id, timeframe, date, open, high, low, close, adj_close)
                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)
                 """, records)
+                if cur.rowcount > 0:
+                    log_price_changes(conn, True, [(index_id, timeframe, min(row[2] for row in records))])
 
                 conn.commit()
                 total_rows += len(records)
@@ -557,21 +570,28 @@ def refresh_52week_stats(conn, type_):
             table_52w = "equity_52week_stats"
             col_id = "symbol_id"
 
+        create_derived_tables(cur)
+        conn.commit()
+        # daily price changes since this stage last ran (None = no cursor yet)
+        change_seq, changes = read_price_changes(conn, type_ == 'index', table_52w)
+
         # -----------------------------------------------------
         # Detect first run
         # -----------------------------------------------------
         first_run = cur.execute(f"SELECT COUNT(*) FROM {table_52w}").fetchone()[0] == 0
 
-        if first_run:
+        if first_run or changes is None:
             log(f"📊 52W STATS ({type_}): FIRST RUN (full rebuild)")
             cur.execute(f"SELECT DISTINCT {col_id} FROM {table_price} WHERE timeframe='1d'")
+            symbol_ids = [r[0] for r in cur.fetchall()]
         else:
             log(f"📊 52W STATS ({type_}): INCREMENTAL UPDATE")
-            # incremental = only symbols updated today
-            cur.execute(f"SELECT DISTINCT {col_id} FROM {table_price} WHERE timeframe='1d' AND date=date('now')")
+            # incremental = only symbols whose daily prices changed (incl. back-dated fixes)
+            symbol_ids = list(changes.get("1d", {}))
 
-        symbol_ids = [r[0] for r in cur.fetchall()]
         if not symbol_ids:
+            advance_change_cursor(conn, type_ == 'index', table_52w, change_seq)
+            conn.commit()
             log("📊 52W STATS: nothing to update")
             return
 
@@ -593,6 +613,8 @@ def refresh_52week_stats(conn, type_):
                 rows_to_upsert.append((symbol_id, high_52, low_52))
 
         if not rows_to_upsert:
+            advance_change_cursor(conn, type_ == 'index', table_52w, change_seq)
+            conn.commit()
             log("📊 52W STATS: no data to update after 1-year filter")
             return
 
@@ -609,6 +631,8 @@ def refresh_52week_stats(conn, type_):
                     as_of_date  = excluded.as_of_date
             """, (symbol_id, high_52, low_52))
 
+        advance_change_cursor(conn, type_ == 'index', table_52w, change_seq)
+        compact_price_changes(conn, type_ == 'index')
         conn.commit()
         log(f"✅ 52W STATS UPDATED: {len(rows_to_upsert)} symbols")
 
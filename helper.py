@@ -1,11 +1,52 @@
+import os
 from datetime import datetime, date, timezone
 LOG_FILE = "price_loader.log"
 DB_FILE = "./database/stocks.db"
 FREQUENCIES = ["1d", "1wk", "1mo"]
 CSV_FILE = "data.csv"
 SCANNER_FOLDER = "./scanner_files/"
+# Declarative scanner definitions compiled by scanner_spec (shipped with the
+# code, so resolved next to this file rather than from the working directory)
+SCANNER_SPECS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scanner_specs.json")
 MISSING_EQUITY = "./yahoo_failure/missing_equity_symbols.csv"
 MISSING_INDEX = "./yahoo_failure/missing_index_symbols.csv"
+# Process-pool size for full indicator rebuilds (one core left for the writer)
+INDICATOR_WORKERS = max((os.cpu_count() or 1) - 1, 1)
+# Indicator rows per write transaction in refresh_indicators
+INDICATOR_COMMIT_ROWS = 50000
+# Rows per fetchmany when streaming price data
+PRICE_CHUNK_ROWS = 50000
+# On-demand indicator cache (indicator_query): memory LRU size and disk folder
+INDICATOR_CACHE_ENTRIES = 256
+INDICATOR_CACHE_DIR = "./database/indicator_cache/"
+# Columnar (Arrow) mirror of price/indicator tables and parts per partition before compaction
+COLUMNAR_DIR = "./database/columnar/"
+COLUMNAR_MAX_PARTS = 32
+# Parquet cache of scanner results, keyed by scanner / mode / dates + data version
+SCANNER_CACHE_DIR = "./database/scanner_cache/"
+# Streaming scanner output: rows per fetchmany / cache batch, latest signals
+# kept for the preview table, and the output file format ("csv" / "parquet")
+SCANNER_FETCH_ROWS = 50000
+SCANNER_PREVIEW_ROWS = 10
+SCANNER_OUTPUT_FORMAT = "csv"
+# Process-pool size for parallel (date-partitioned) sql scanner runs
+SCANNER_WORKERS = max((os.cpu_count() or 1) - 1, 1)
+# Symbols per batch when (re)building equity_timeframe_map / equity_mtf_daily
+# and per in-memory batch of vector_scanner
+TIMEFRAME_MAP_SYMBOLS = 250
+# Indicator columns carried into equity_mtf_daily per timeframe (weekly / monthly
+# ones get a w_ / m_ prefix) and the forward closes it stores (close_<n>d)
+MTF_COLUMNS = {
+    "1d": ["rsi_3", "rsi_9", "ema_rsi_9_3", "wma_rsi_9_21", "pct_price_change"],
+    "1wk": ["rsi_3", "rsi_9", "ema_rsi_9_3", "wma_rsi_9_21"],
+    "1mo": ["rsi_3", "rsi_9"],
+}
+MTF_FORWARD_DAYS = [5, 10]
+# Backtest statistics (backtest_stats): forward horizons in trading days,
+# return percentiles reported, and signals per block of horizon lookups
+BACKTEST_HORIZONS = [1, 5, 10, 20]
+BACKTEST_PERCENTILES = [5, 25, 50, 75, 95]
+BACKTEST_SIGNAL_BATCH = 100000
 FREQ_COLORS = {
     "Run Once": "bold blue",
     "Run Daily": "bold white",
@@ -27,6 +68,7 @@ MAIN_MENU_ITEMS = [
     ("12", "Update Partial Week and Month Data", "Run Daily", "yellow"),
     ("13", "Update Partial Week and Month Data Based on Date supplied", "Run As Required", "yellow"),
     ("14", "Update Partial Week and Month Indicators", "Run Daily", "yellow"),
+    ("15", "Sync Columnar Mirror", "Run Daily", "yellow"),
     ("0", "Exit", "", "white"),
 ]
 NSE_INDICES = [
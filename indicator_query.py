@@ -0,0 +1,165 @@
+# =========================================================
+# THIS FILE CONTAINS THE FOLLOWING FUNCTIONS:
+# 1. price_watermark
+# 2. query_indicator
+# 3. clear_indicator_cache
+# =========================================================
+# On-demand indicators with parameters that are not stored in
+# *_indicators (RSI(5), SMA(100), Bollinger 2.5σ ...), computed from
+# *_price_data with the same kernels as the stored ones.
+#
+# The full history of a (symbol, timeframe, kind, params) is computed once
+# and cached twice:
+#   memory -> LRU of INDICATOR_CACHE_ENTRIES series
+#   disk   -> one .npz per key in INDICATOR_CACHE_DIR
+# Both carry the price watermark (last final date, final bar count and a
+# date-weighted checksum of the bar values) they were computed at; a
+# different watermark means new, deleted or corrected bars, and the entry
+# is recomputed. Date ranges are sliced from the cached series.
+# =========================================================
+import os
+import json
+import hashlib
+import traceback
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from helper import (
+    log,
+    INDICATOR_CACHE_ENTRIES,
+    INDICATOR_CACHE_DIR
+)
+from indicator_registry import (
+    make_indicator,
+    compute_indicators
+)
+from indicators import iter_symbol_bars
+
+# key -> (watermark, dates, {column: values}), most recently used last
+_MEMORY_CACHE = OrderedDict()
+
+def _resolve_symbol(conn, is_indexs, symbol):
+    if isinstance(symbol, (int, np.integer)):
+        return int(symbol)
+    table_symbols = "index_symbols" if is_indexs else "equity_symbols"
+    col_id        = "index_id"      if is_indexs else "symbol_id"
+    col_symbol    = "index_code"    if is_indexs else "symbol"
+    row = conn.execute(f"SELECT {col_id} FROM {table_symbols} WHERE {col_symbol}=?", (symbol,)).fetchone()
+    if row is None:
+        raise KeyError(f"Unknown symbol: {symbol}")
+    return row[0]
+
+# =========================================================
+# price_watermark Function
+# [last date, bar count, checksum] of the final bars of one (id,
+# timeframe). The checksum weights each bar's OHLC / adj_close by its day
+# number, so a back-dated correction (same dates, same count) or a value
+# moved to another date changes it too. One pass over the symbol's rows.
+# =========================================================
+def price_watermark(conn, is_indexs, symbol_id, timeframe):
+    price_table = "index_price_data" if is_indexs else "equity_price_data"
+    col_id      = "index_id"         if is_indexs else "symbol_id"
+    final_only  = ""                 if is_indexs else "AND is_final=1"
+    last_date, bars, checksum = conn.execute(f"""
+        SELECT MAX(date), COUNT(*),
+               TOTAL((IFNULL(open, 0) + IFNULL(high, 0) + IFNULL(low, 0) + IFNULL(close, 0)
+                      + IFNULL(adj_close, 0)) * (julianday(date) - 2440000))
+        FROM {price_table}
+        WHERE {col_id}=? AND timeframe=? {final_only}
+    """, (symbol_id, timeframe)).fetchone()
+    return [last_date, bars, checksum]
+
+def _cache_path(key):
+    digest = hashlib.sha1(json.dumps(key).encode()).hexdigest()
+    return os.path.join(INDICATOR_CACHE_DIR, f"{digest}.npz")
+
+def _load_disk(key, watermark):
+    path = _cache_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if json.loads(str(data["watermark"])) != watermark:
+                return None
+            columns = {name[4:]: data[name] for name in data.files if name.startswith("col_")}
+            return data["dates"], columns
+    except Exception as e:
+        log(f"INDICATOR CACHE READ FAILED | {path} | {e}")
+        return None
+
+def _save_disk(key, watermark, dates, columns):
+    os.makedirs(INDICATOR_CACHE_DIR, exist_ok=True)
+    path = _cache_path(key)
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            np.savez(f, watermark=json.dumps(watermark), dates=dates,
+                     **{f"col_{name}": values for name, values in columns.items()})
+        os.replace(tmp_path, path)   # readers never see a half-written file
+    except Exception as e:
+        log(f"INDICATOR CACHE WRITE FAILED | {path} | {e}")
+
+# =========================================================
+# query_indicator Function
+# Returns a DataFrame (date + the kind's output columns) of indicator
+# `kind` with `params` for one symbol (id or symbol / index code) between
+# start and end (inclusive, None = open). Warm-up always runs over the
+# full history, so values match what a stored column would hold.
+#   query_indicator(conn, "INFY", "1d", "rsi", {"period": 5}, start="2024-01-01")
+#   query_indicator(conn, "INFY", "1wk", "bollinger", {"std_mult": 2.5})
+# =========================================================
+def query_indicator(conn, symbol, timeframe, kind, params=None, start=None, end=None,
+                    is_indexs=False, inputs=None):
+    registry = make_indicator(kind, params, inputs)
+    spec = registry[kind]
+    symbol_id = _resolve_symbol(conn, is_indexs, symbol)
+    key = [bool(is_indexs), symbol_id, timeframe, kind,
+           sorted(spec["params"].items()), spec["inputs"]]
+    memory_key = json.dumps(key)
+    watermark = price_watermark(conn, is_indexs, symbol_id, timeframe)
+
+    cached = _MEMORY_CACHE.get(memory_key)
+    if cached is not None and cached[0] == watermark:
+        _MEMORY_CACHE.move_to_end(memory_key)
+        dates, columns = cached[1], cached[2]
+    else:
+        found = _load_disk(key, watermark)
+        if found is not None:
+            dates, columns = found
+        else:
+            # --- Cache miss or stale watermark: compute from the price table ---
+            dates, columns = np.array([], dtype=str), {c: np.array([]) for c in spec["outputs"]}
+            try:
+                for _, bars in iter_symbol_bars(conn, is_indexs, timeframe, symbol_ids=[symbol_id]):
+                    columns, _ = compute_indicators(bars, state=None, registry=registry)
+                    dates = bars["date"]
+            except Exception as e:
+                log(f"INDICATOR QUERY FAILED | {symbol} {timeframe} {kind} {params} | {e}")
+                traceback.print_exc()
+                raise
+            _save_disk(key, watermark, dates, columns)
+
+        _MEMORY_CACHE[memory_key] = (watermark, dates, columns)
+        _MEMORY_CACHE.move_to_end(memory_key)
+        while len(_MEMORY_CACHE) > INDICATOR_CACHE_ENTRIES:
+            _MEMORY_CACHE.popitem(last=False)
+
+    # --- Slice the requested range (dates are sorted ISO strings) ---
+    lo = np.searchsorted(dates, start, side="left") if start else 0
+    hi = np.searchsorted(dates, end, side="right") if end else len(dates)
+    df = pd.DataFrame({"date": dates[lo:hi]})
+    for name, values in columns.items():
+        df[name] = values[lo:hi]
+    return df
+
+# =========================================================
+# clear_indicator_cache Function
+# Empties the memory cache and, with disk=True, the on-disk cache too.
+# =========================================================
+def clear_indicator_cache(disk=False):
+    _MEMORY_CACHE.clear()
+    if disk and os.path.isdir(INDICATOR_CACHE_DIR):
+        for name in os.listdir(INDICATOR_CACHE_DIR):
+            if name.endswith(".npz"):
+                os.remove(os.path.join(INDICATOR_CACHE_DIR, name))
+        print(f"🧹 Cleared indicator cache {INDICATOR_CACHE_DIR}")
@@ -0,0 +1,320 @@
+# =========================================================
+# THIS FILE CONTAINS THE FOLLOWING FUNCTIONS:
+# 1. resolve_indicators
+# 2. indicator_columns
+# 3. indicator_column_types
+# 4. compute_indicators
+# 5. compute_last_indicators
+# 6. make_indicator
+# =========================================================
+# Every stored indicator is declared once in INDICATORS:
+#   kind    -> kernel in KINDS that computes it
+#   inputs  -> price columns or output columns of other indicators
+#   params  -> kernel parameters
+#   outputs -> {column: SQL type} stored in *_indicators
+# The table DDL, the upsert SQL and calculate_indicators are all generated
+# from this dict, so a new indicator is one entry here.
+# =========================================================
+import numpy as np
+from indicators_helper import (
+    ewm_mean,
+    window_tail,
+    rolling_mean,
+    rolling_std,
+    rolling_sum,
+    rsi_kernel,
+    atr_kernel,
+    supertrend_kernel
+)
+
+PRICE_INPUTS = ["open", "high", "low", "close", "adj_close"]
+
+INDICATORS = {
+    "sma_20":  {"kind": "sma", "inputs": ["adj_close"], "params": {"period": 20},
+                "outputs": {"sma_20": "REAL"}},
+    "sma_50":  {"kind": "sma", "inputs": ["adj_close"], "params": {"period": 50},
+                "outputs": {"sma_50": "REAL"}},
+    "sma_200": {"kind": "sma", "inputs": ["adj_close"], "params": {"period": 200},
+                "outputs": {"sma_200": "REAL"}},
+    "rsi_3":   {"kind": "rsi", "inputs": ["close"], "params": {"period": 3},
+                "outputs": {"rsi_3": "REAL"}},
+    "rsi_9":   {"kind": "rsi", "inputs": ["close"], "params": {"period": 9},
+                "outputs": {"rsi_9": "REAL"}},
+    "rsi_14":  {"kind": "rsi", "inputs": ["close"], "params": {"period": 14},
+                "outputs": {"rsi_14": "REAL"}},
+    "macd":    {"kind": "macd", "inputs": ["close"], "params": {"fast": 12, "slow": 26, "signal": 9},
+                "outputs": {"macd": "REAL", "macd_signal": "REAL"}},
+    "bollinger": {"kind": "bollinger", "inputs": ["close"], "params": {"period": 20, "std_mult": 2},
+                  "outputs": {"bb_upper": "REAL", "bb_middle": "REAL", "bb_lower": "REAL"}},
+    "atr_14":  {"kind": "atr", "inputs": ["high", "low", "close"], "params": {"period": 14},
+                "outputs": {"atr_14": "REAL"}},
+    "supertrend": {"kind": "supertrend", "inputs": ["high", "low", "close"],
+                   "params": {"atr_period": 10, "multiplier": 3},
+                   "outputs": {"supertrend": "REAL", "supertrend_dir": "INTEGER"}},
+    "ema_rsi_9_3":  {"kind": "ema", "inputs": ["rsi_9"], "params": {"period": 3},
+                     "outputs": {"ema_rsi_9_3": "REAL"}},
+    "wma_rsi_9_21": {"kind": "wma", "inputs": ["rsi_9"], "params": {"period": 21},
+                     "outputs": {"wma_rsi_9_21": "REAL"}},
+    "pct_price_change": {"kind": "pct_change", "inputs": ["adj_close"], "params": {},
+                         "outputs": {"pct_price_change": "REAL"}},
+}
+
+# ---------------------------------------------
+# Kernels by kind
+# kernel(inputs, params, state) -> (outputs in declared order, new_state)
+# state is the entry's own state from the previous call (None at start).
+# ---------------------------------------------
+def _last(values, previous):
+    return float(values[-1]) if len(values) else previous
+
+def _sma(inputs, params, state):
+    values, = inputs
+    tail = (state or {}).get("tail")
+    sma = np.round(rolling_mean(values, params["period"], tail), 2)
+    return [sma], {"tail": window_tail(values, tail, params["period"] - 1).tolist()}
+
+def _rsi(inputs, params, state):
+    close, = inputs
+    state = state or {}
+    prev = state.get("prev", np.nan)
+    rsi, seeds = rsi_kernel(close, params["period"], prev, state.get("ewm"))
+    return [rsi], {"prev": _last(close, prev), "ewm": seeds}
+
+def _ema(inputs, params, state):
+    values, = inputs
+    ema, seed = ewm_mean(values, (state or {}).get("ewm"), span=params["period"])
+    return [np.round(ema, 2)], {"ewm": seed}
+
+def _wma(inputs, params, state):
+    values, = inputs
+    tail = (state or {}).get("tail")
+    weights = np.arange(1, params["period"] + 1)
+    wma = rolling_sum(values, params["period"], tail, weights) / weights.sum()
+    return [np.round(wma, 2)], {"tail": window_tail(values, tail, params["period"] - 1).tolist()}
+
+def _macd(inputs, params, state):
+    close, = inputs
+    state = state or {}
+    fast, fast_seed = ewm_mean(close, state.get("fast"), span=params["fast"])
+    slow, slow_seed = ewm_mean(close, state.get("slow"), span=params["slow"])
+    macd = fast - slow
+    signal, signal_seed = ewm_mean(macd, state.get("signal"), span=params["signal"])
+    return ([np.round(macd, 2), np.round(signal, 2)],
+            {"fast": fast_seed, "slow": slow_seed, "signal": signal_seed})
+
+def _bollinger(inputs, params, state):
+    close, = inputs
+    tail = (state or {}).get("tail")
+    mid = rolling_mean(close, params["period"], tail)
+    std = rolling_std(close, params["period"], tail)
+    upper = mid + params["std_mult"] * std
+    lower = mid - params["std_mult"] * std
+    return ([np.round(upper, 2), np.round(mid, 2), np.round(lower, 2)],
+            {"tail": window_tail(close, tail, params["period"] - 1).tolist()})
+
+def _atr(inputs, params, state):
+    high, low, close = inputs
+    state = state or {}
+    prev = state.get("prev", np.nan)
+    atr, seed = atr_kernel(high, low, close, params["period"], prev, state.get("ewm"))
+    return [atr], {"prev": _last(close, prev), "ewm": seed}
+
+def _supertrend(inputs, params, state):
+    high, low, close = inputs
+    state = state or {}
+    (atr,), atr_state = _atr(inputs, {"period": params["atr_period"]}, state.get("atr"))
+    supertrend, direction, bands = supertrend_kernel(
+        high, low, close, atr, params["multiplier"], state.get("bands")
+    )
+    return [supertrend, direction], {"atr": atr_state, "bands": bands}
+
+def _pct_change(inputs, params, state):
+    values, = inputs
+    prev = (state or {}).get("prev", np.nan)
+    shifted = np.concatenate([[prev], values[:-1]])
+    return [np.round((values / shifted - 1) * 100, 2)], {"prev": _last(values, prev)}
+
+KINDS = {
+    "sma": _sma,
+    "rsi": _rsi,
+    "ema": _ema,
+    "wma": _wma,
+    "macd": _macd,
+    "bollinger": _bollinger,
+    "atr": _atr,
+    "supertrend": _supertrend,
+    "pct_change": _pct_change,
+}
+
+# Kinds whose last value only depends on the last N inputs: kind -> N.
+# The rest are recursions (EWM seeds, SuperTrend bands) and need the
+# whole history or a stored state.
+LAST_WINDOW = {
+    "sma": lambda params: params["period"],
+    "bollinger": lambda params: params["period"],
+    "wma": lambda params: params["period"],
+    "pct_change": lambda params: 2,
+}
+
+# Defaults per kind for ad-hoc (non-stored) indicators built by make_indicator
+KIND_DEFAULTS = {
+    "sma":        {"inputs": ["adj_close"], "params": {"period": 20}, "outputs": ["sma"]},
+    "rsi":        {"inputs": ["close"], "params": {"period": 14}, "outputs": ["rsi"]},
+    "ema":        {"inputs": ["close"], "params": {"period": 20}, "outputs": ["ema"]},
+    "wma":        {"inputs": ["close"], "params": {"period": 20}, "outputs": ["wma"]},
+    "macd":       {"inputs": ["close"], "params": {"fast": 12, "slow": 26, "signal": 9},
+                   "outputs": ["macd", "macd_signal"]},
+    "bollinger":  {"inputs": ["close"], "params": {"period": 20, "std_mult": 2},
+                   "outputs": ["bb_upper", "bb_middle", "bb_lower"]},
+    "atr":        {"inputs": ["high", "low", "close"], "params": {"period": 14}, "outputs": ["atr"]},
+    "supertrend": {"inputs": ["high", "low", "close"], "params": {"atr_period": 10, "multiplier": 3},
+                   "outputs": ["supertrend", "supertrend_dir"]},
+    "pct_change": {"inputs": ["adj_close"], "params": {}, "outputs": ["pct_price_change"]},
+}
+
+# output column -> indicator producing it
+_PRODUCER = {col: name for name, spec in INDICATORS.items() for col in spec["outputs"]}
+
+# =========================================================
+# resolve_indicators Function
+# Maps requested indicator or column names (None = everything) to the
+# indicators to compute, dependencies first, in registry order.
+# =========================================================
+def resolve_indicators(names=None, registry=INDICATORS):
+    producer = {col: name for name, spec in registry.items() for col in spec["outputs"]}
+    if names is None:
+        return list(registry)
+
+    needed = set()
+    def visit(name):
+        entry = name if name in registry else producer.get(name)
+        if entry is None:
+            raise KeyError(f"Unknown indicator: {name}")
+        if entry in needed:
+            return
+        needed.add(entry)
+        for dep in registry[entry]["inputs"]:
+            if dep not in PRICE_INPUTS:
+                visit(dep)
+
+    for name in names:
+        visit(name)
+    # registry order already lists dependencies before their dependants
+    return [name for name in registry if name in needed]
+
+# =========================================================
+# indicator_columns / indicator_column_types Functions
+# Output columns of the requested indicators (None = all), table order.
+# =========================================================
+def indicator_columns(names=None):
+    return list(indicator_column_types(names))
+
+def indicator_column_types(names=None):
+    if names is None:
+        entries = list(INDICATORS)
+    else:
+        entries = [n if n in INDICATORS else _PRODUCER.get(n) for n in names]
+        if None in entries:
+            raise KeyError(f"Unknown indicator in {names}")
+    types = {}
+    for name in INDICATORS:
+        if name in entries:
+            types.update(INDICATORS[name]["outputs"])
+    return types
+
+# =========================================================
+# compute_indicators Function
+# Computes the requested indicators (None = all) plus their dependencies
+# over date-ordered `bars`, continuing from `state` (the dict returned by a
+# previous call, None = start of history). Returns (columns, new_state)
+# where columns only holds the requested output columns.
+# =========================================================
+def compute_indicators(bars, names=None, state=None, registry=INDICATORS):
+    entry_states = (state or {}).get("indicators", {})
+    series = {col: np.asarray(bars[col], dtype=float) for col in PRICE_INPUTS if col in bars}
+
+    new_states = {}
+    for name in resolve_indicators(names, registry):
+        spec = registry[name]
+        outputs, new_states[name] = KINDS[spec["kind"]](
+            [series[col] for col in spec["inputs"]], spec["params"], entry_states.get(name)
+        )
+        series.update(zip(spec["outputs"], outputs))
+
+    wanted = list(registry) if names is None else [n if n in registry else _PRODUCER[n] for n in names]
+    columns = {
+        col: series[col]
+        for name in registry if name in wanted
+        for col in registry[name]["outputs"]
+    }
+    dates = np.asarray(bars["date"])
+    new_state = {
+        "last_date": str(dates[-1]) if len(dates) else (state or {}).get("last_date"),
+        "indicators": new_states,
+    }
+    return columns, new_state
+
+# =========================================================
+# compute_last_indicators Function
+# compute_indicators evaluated at the last bar only. Returns (record,
+# new_state) with record = {column: value at the last bar}; new_state is
+# the same as compute_indicators would return.
+# Window kinds (LAST_WINDOW) only see their last N inputs. Recursive kinds
+# run over `bars`: pass the stored state and just the new bars (usually
+# one) and every indicator costs O(1); without state they cover the
+# whole history once.
+# =========================================================
+def compute_last_indicators(bars, names=None, state=None, registry=INDICATORS):
+    entries = resolve_indicators(names, registry)
+    entry_states = (state or {}).get("indicators", {})
+    series = {col: np.asarray(bars[col], dtype=float) for col in PRICE_INPUTS if col in bars}
+
+    # a window output feeding a recursion has to stay a full series
+    full_inputs = {
+        col for name in entries if registry[name]["kind"] not in LAST_WINDOW
+        for col in registry[name]["inputs"]
+    }
+
+    new_states = {}
+    for name in entries:
+        spec = registry[name]
+        inputs = [series[col] for col in spec["inputs"]]
+        window = LAST_WINDOW.get(spec["kind"])
+        if window is not None and not full_inputs & set(spec["outputs"]):
+            inputs = [values[-window(spec["params"]):] for values in inputs]
+        outputs, new_states[name] = KINDS[spec["kind"]](inputs, spec["params"], entry_states.get(name))
+        series.update(zip(spec["outputs"], outputs))
+
+    wanted = list(registry) if names is None else [n if n in registry else _PRODUCER[n] for n in names]
+    record = {
+        col: float(series[col][-1]) if len(series[col]) else np.nan
+        for name in registry if name in wanted
+        for col in registry[name]["outputs"]
+    }
+    dates = np.asarray(bars["date"])
+    new_state = {
+        "last_date": str(dates[-1]) if len(dates) else (state or {}).get("last_date"),
+        "indicators": new_states,
+    }
+    return record, new_state
+
+# =========================================================
+# make_indicator Function
+# Builds a one-off registry {name: spec} for an indicator that is not
+# stored, e.g. make_indicator("rsi", {"period": 5}). Missing params and
+# inputs fall back to KIND_DEFAULTS; outputs keep the kind's column names.
+# =========================================================
+def make_indicator(kind, params=None, inputs=None):
+    if kind not in KIND_DEFAULTS:
+        raise KeyError(f"Unknown indicator kind: {kind}")
+    defaults = KIND_DEFAULTS[kind]
+    params = {**defaults["params"], **(params or {})}
+    unknown = set(params) - set(defaults["params"])
+    if unknown:
+        raise KeyError(f"Unknown {kind} params: {sorted(unknown)}")
+    return {kind: {
+        "kind": kind,
+        "inputs": list(inputs or defaults["inputs"]),
+        "params": params,
+        "outputs": {column: "REAL" for column in defaults["outputs"]},
+    }}
@@ -0,0 +1,82 @@
+# =========================================================
+# THIS FILE CONTAINS THE FOLLOWING FUNCTIONS:
+# 1. load_indicator_states
+# 2. save_indicator_state
+# 3. bump_indicator_generation
+# 4. indicator_generations
+# =========================================================
+# The state row for (id, timeframe) holds everything needed to advance the
+# indicators past last_date without re-reading history:
+#   indicators -> {registry name: that indicator's own state}, e.g. window
+#                 tail (SMA, Bollinger, WMA), previous close and EWM seeds
+#                 (RSI, ATR, EMA, MACD), final bands (SuperTrend)
+# The generation row per timeframe counts the indicator writes the price
+# change log does not explain (*_indicator_generation): columns= backfills,
+# full rebuilds and watermark-planned runs. Readers caching derived results
+# (scan cache, columnar mirror) can tell that indicator values changed even
+# when no price did; incremental runs reach them through the change log.
+# =========================================================
+import json
+from helper import (
+    log
+)
+
+def _generation_table(is_indexs):
+    return "index_indicator_generation" if is_indexs else "equity_indicator_generation"
+
+def _state_table(is_indexs):
+    table = "index_indicator_state" if is_indexs else "equity_indicator_state"
+    col_id = "index_id" if is_indexs else "symbol_id"
+    return table, col_id
+
+# =========================================================
+# load_indicator_states Function
+# All stored states of one timeframe in a single query: {id: state}.
+# =========================================================
+def load_indicator_states(conn, is_indexs, timeframe):
+    table, col_id = _state_table(is_indexs)
+    states = {}
+    for symbol_id, last_date, payload in conn.execute(f"""
+        SELECT {col_id}, last_date, state FROM {table}
+        WHERE timeframe=?
+    """, (timeframe,)):
+        states[symbol_id] = json.loads(payload)
+        states[symbol_id]["last_date"] = last_date
+    return states
+
+# =========================================================
+# save_indicator_state Function
+# Upserts the state reached after the last processed bar. Caller commits.
+# =========================================================
+def save_indicator_state(conn, is_indexs, symbol_id, timeframe, state):
+    table, col_id = _state_table(is_indexs)
+    payload = {k: v for k, v in state.items() if k != "last_date"}
+    try:
+        conn.execute(f"""
+            INSERT INTO {table} ({col_id}, timeframe, last_date, state)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT({col_id}, timeframe) DO UPDATE SET
+                last_date=excluded.last_date,
+                state=excluded.state
+        """, (symbol_id, timeframe, state["last_date"], json.dumps(payload)))
+    except Exception as e:
+        log(f"INDICATOR STATE SAVE FAILED | {symbol_id} {timeframe} | {e}")
+        raise
+
+# =========================================================
+# bump_indicator_generation Function
+# Marks the indicator rows of `timeframe` as rewritten. Caller commits,
+# together with the indicator writes.
+# =========================================================
+def bump_indicator_generation(conn, is_indexs, timeframe):
+    conn.execute(f"""
+        INSERT INTO {_generation_table(is_indexs)} (timeframe, generation) VALUES (?, 1)
+        ON CONFLICT(timeframe) DO UPDATE SET generation = generation + 1
+    """, (timeframe,))
+
+# =========================================================
+# indicator_generations Function
+# {timeframe: generation} of the indicator table.
+# =========================================================
+def indicator_generations(conn, is_indexs):
+    return dict(conn.execute(f"SELECT timeframe, generation FROM {_generation_table(is_indexs)} ORDER BY timeframe"))
@@ -1,61 +1,89 @@
 # =========================================================
 # THIS FILE CONTAINS THE FOLLOWING FUNCTIONS:
-# 1. calculate_indicators
-# 2. update_indicators
-# 3. refresh_equity_partial_prices
-# 4. refresh_equity_partial_indicators
+# 1. advance_indicators
+# 2. calculate_indicators
+# 3. iter_symbol_bars
+# 4. compute_indicator_blocks
+# 5. plan_indicator_refresh
+# 6. plan_indicator_changes
+# 7. refresh_indicators
+# 8. compute_partial_indicators
+# 9. refresh_partial_indicators
 # =========================================================
 import pandas as pd
 import numpy as np
 import traceback
 from datetime import datetime, timedelta, date, timezone
 import time
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from helper import (
     log, 
     DB_FILE,NSE_INDICES,
     FREQUENCIES,CSV_FILE,
-    SKIP_MONTHLY,SKIP_WEEKLY
+    SKIP_MONTHLY,SKIP_WEEKLY,
+    INDICATOR_COMMIT_ROWS,PRICE_CHUNK_ROWS
 )
-from indicators_helper import (
-    calculate_rsi_series,
-    calculate_bollinger,
-    calculate_atr,
-    calculate_macd,
-    calculate_supertrend,
-    calculate_ema,
-    calculate_wma
+from indicator_registry import (
+    resolve_indicators,
+    indicator_columns,
+    compute_indicators,
+    compute_last_indicators
 )
+from indicator_state import (
+    load_indicator_states,
+    save_indicator_state,
+    bump_indicator_generation
+)
+from change_log import (
+    read_price_changes,
+    advance_change_cursor,
+    compact_price_changes,
+    log_price_changes
+)
+from create_db import create_derived_tables
+from mtf_daily import refresh_mtf_daily
+
+# Indicator columns in equity_indicators / index_indicators, from the registry
+INDICATOR_COLUMNS = indicator_columns()
+
+# Price columns fed to the indicators (after id and date)
+BAR_COLUMNS = ["open", "high", "low", "close", "adj_close"]
+
+# =========================================================
+# advance_indicators Function
+# Computes the indicators in `names` (None = every registered indicator)
+# for `bars` (date-ordered OHLC) continuing from `state` (None = start of
+# history). Returns (columns, new_state) where columns maps indicator
+# column -> array aligned with bars. Running it over the whole history in
+# one go or bar-by-bar from stored state gives identical results.
+# =========================================================
+def advance_indicators(bars, state=None, names=None):
+    return compute_indicators(bars, names, state)
 
 # =========================================================
 # calculate_indicators Function
 # This function calculates various technical indicators for a given DataFrame
 # containing price data. It can compute indicators for the entire DataFrame or
-# just the latest row based on the 'latest_only' flag.
+# just the latest row based on the 'latest_only' flag. `names` restricts it
+# to some indicators (plus whatever they are computed from).
+# latest_only=True evaluates the last bar only (compute_last_indicators) and
+# returns a single-row DataFrame; with `state` (stored indicator state) df
+# only needs the bars after state["last_date"].
 # =========================================================
-def calculate_indicators(df, latest_only=False):
+def calculate_indicators(df, latest_only=False, names=None, state=None):
     try:
-        # ---------------- SMA ----------------
-        df["sma_20"] = df["adj_close"].rolling(20).mean().round(2)
-        df["sma_50"] = df["adj_close"].rolling(50).mean().round(2)
-        df["sma_200"] = df["adj_close"].rolling(200).mean().round(2)
-        # ---------------- RSI ----------------
-        df["rsi_3"] = calculate_rsi_series(df["close"], 3)
-        df["rsi_9"] = calculate_rsi_series(df["close"], 9)
-        df["rsi_14"] = calculate_rsi_series(df["close"], 14)
-        # ---------------- Other Indicators ----------------
-        df["ema_rsi_9_3"] = calculate_ema(df["rsi_9"], 3)
-        df["wma_rsi_9_21"] = calculate_wma(df["rsi_9"], 21)
-        # --------------- Bollinger Bands, ATR, Supertrend, MACD ----------------
-        df["bb_upper"], df["bb_middle"], df["bb_lower"] = calculate_bollinger(df["close"])
-        df["atr_14"] = calculate_atr(df)
-        df["supertrend"], df["supertrend_dir"] = calculate_supertrend(df)
-        df["macd"], df["macd_signal"] = calculate_macd(df["close"])
-        # --------------- Percentage Price Change ----------------
-        df["pct_price_change"] = (df["adj_close"].pct_change() * 100).round(2)
-
         # ---- Return only last row if requested ----
         if latest_only:
-            return df.iloc[[-1]].reset_index(drop=True)
+            record, _ = compute_last_indicators(df, names, state)
+            row = df.iloc[[-1]].reset_index(drop=True)
+            for name, value in record.items():
+                row[name] = value
+            return row
+
+        columns, _ = advance_indicators(df, state, names)
+        for name, values in columns.items():
+            df[name] = values
 
         return df
 
@@ -237,18 +265,327 @@ def calculate_indicators(df, latest_only=False):
 #         log(f"INDICATOR UPDATE FAILED | {e}")
 #         traceback.print_exc()
 
-def refresh_indicators(conn, is_indexs=False, incremental=False, max_lookback=210):
+# =========================================================
+# iter_symbol_bars Function
+# One ordered scan of a timeframe's prices (ORDER BY id, date) read with
+# fetchmany. Yields (symbol_id, bars) per symbol where bars is a dict of
+# NumPy arrays; memory stays bounded by one chunk plus one symbol.
+# bounds={id: last_date} only returns bars after each id's last_date
+# (ids missing from bounds are read from the start of history).
+# =========================================================
+def iter_symbol_bars(conn, is_indexs, timeframe, bounds=None, symbol_ids=None,
+                     chunk_rows=PRICE_CHUNK_ROWS):
+    table_symbols = "index_symbols"    if is_indexs else "equity_symbols"
+    price_table   = "index_price_data" if is_indexs else "equity_price_data"
+    col_id        = "index_id"         if is_indexs else "symbol_id"
+    # partial (is_final=0) candles are replaced intraday, never fold them into state
+    final_only    = ""                 if is_indexs else "AND p.is_final=1"
+
+    bounds_join, since = "", "''"
+    if bounds is not None:
+        # bounds live in a temp table so writing state during the scan can't disturb them
+        conn.execute("DROP TABLE IF EXISTS temp.indicator_bounds")
+        conn.execute("CREATE TEMP TABLE indicator_bounds (id INTEGER PRIMARY KEY, last_date TEXT)")
+        conn.executemany("INSERT INTO temp.indicator_bounds (id, last_date) VALUES (?, ?)", bounds.items())
+        bounds_join = f"LEFT JOIN temp.indicator_bounds b ON b.id = sym.{col_id}"
+        since = "COALESCE(b.last_date, '')"
+
+    id_filter = ""
+    if symbol_ids is not None:
+        conn.execute("DROP TABLE IF EXISTS temp.indicator_symbols")
+        conn.execute("CREATE TEMP TABLE indicator_symbols (id INTEGER PRIMARY KEY)")
+        conn.executemany("INSERT INTO temp.indicator_symbols (id) VALUES (?)", [(i,) for i in symbol_ids])
+        id_filter = f"AND sym.{col_id} IN (SELECT id FROM temp.indicator_symbols)"
+
+    # CROSS JOIN pins the symbol table as the outer loop → per-symbol index seeks, no sort
+    cur = conn.execute(f"""
+        SELECT sym.{col_id}, p.date, p.open, p.high, p.low, p.close, p.adj_close
+        FROM {table_symbols} sym
+        {bounds_join}
+        CROSS JOIN {price_table} p
+          ON p.{col_id} = sym.{col_id} AND p.timeframe = ? AND p.date > {since}
+        WHERE 1=1 {final_only} {id_filter}
+        ORDER BY sym.{col_id}, p.date
+    """, (timeframe,))
+
+    def bars_of(dates, values, start, end):
+        bars = {"date": dates[start:end]}
+        for i, name in enumerate(BAR_COLUMNS):
+            bars[name] = values[i, start:end]
+        return bars
+
+    carry = None    # (ids, dates, values) of the symbol still being read
+    while True:
+        rows = cur.fetchmany(chunk_rows)
+        if not rows:
+            break
+        ids, dates, *cols = zip(*rows)
+        ids = np.array(ids, dtype=np.int64)
+        dates = np.array(dates, dtype=str)
+        values = np.array(cols, dtype=float)    # NULL → NaN
+        if carry is not None:
+            ids = np.concatenate([carry[0], ids])
+            dates = np.concatenate([carry[1], dates])
+            values = np.concatenate([carry[2], values], axis=1)
+
+        starts = np.concatenate([[0], np.flatnonzero(ids[1:] != ids[:-1]) + 1])
+        # every group but the last is complete; the last may continue next chunk
+        for start, end in zip(starts[:-1], starts[1:]):
+            yield int(ids[start]), bars_of(dates, values, start, end)
+        last = starts[-1]
+        carry = (ids[last:], dates[last:], values[:, last:])
+
+    if carry is not None:
+        yield int(carry[0][0]), bars_of(carry[1], carry[2], 0, len(carry[0]))
+
+# =========================================================
+# compute_indicator_blocks Function
+# Streams one timeframe through iter_symbol_bars and yields a compact block
+# (symbol_id, dates, values, new_state) per symbol with new bars, values
+# ordered like indicator_columns(names). names=None computes everything;
+# a subset (e.g. backfilling one new indicator) always runs over the full
+# history and its state is merged into the stored one.
+# Failed symbols are reported and skipped; their ids go to `errors` if given.
+# =========================================================
+def compute_indicator_blocks(conn, is_indexs, timeframe, incremental=False, symbol_ids=None,
+                             names=None, errors=None):
+    indicator_table = "index_indicators" if is_indexs else "equity_indicators"
+    col_id          = "index_id"         if is_indexs else "symbol_id"
+    columns_out     = indicator_columns(names)
+    entries         = resolve_indicators(names)
+
+    states = load_indicator_states(conn, is_indexs, timeframe) if incremental or names else {}
+    bounds = None
+    if incremental:
+        # a state only resumes a pair if it carries every indicator being computed
+        # (older or partial states are recomputed from full history)
+        states = {
+            symbol_id: state for symbol_id, state in states.items()
+            if all(name in state.get("indicators", {}) for name in entries)
+        }
+        bounds = {symbol_id: state["last_date"] for symbol_id, state in states.items()}
+
+    for symbol_id, bars in iter_symbol_bars(conn, is_indexs, timeframe, bounds, symbol_ids):
+        try:
+            state, last_date = (states.get(symbol_id) if incremental else None), None
+            if incremental and state is None:
+                # no usable state: computed from full history, only rows past the
+                # last stored indicator are written
+                last_date = conn.execute(f"""
+                    SELECT MAX(date) FROM {indicator_table}
+                    WHERE {col_id}=? AND timeframe=?
+                """, (symbol_id, timeframe)).fetchone()[0]
+
+            # --- Calculate indicators ---
+            columns, new_state = advance_indicators(bars, state, names)
+            dates = bars["date"]
+            values = np.column_stack([columns[name] for name in columns_out])
+
+            # --- Subset run: keep the other indicators' state if it is at the same bar ---
+            stored = states.get(symbol_id)
+            if names is not None and stored and stored["last_date"] == new_state["last_date"]:
+                new_state["indicators"] = {**stored.get("indicators", {}), **new_state["indicators"]}
+
+            # --- Keep only new rows when incremental without state ---
+            if last_date:
+                keep = dates > last_date
+                dates, values = dates[keep], values[keep]
+
+        except Exception as e:
+            print(f"❌ ERROR SYMBOL {symbol_id} T={timeframe} | {e}")
+            traceback.print_exc()
+            if errors is not None:
+                errors.append(symbol_id)
+            continue
+
+        yield symbol_id, dates, values, new_state
+
+# =========================================================
+# _indicator_shard Function
+# Process-pool worker: computes a shard of symbols on its own read-only
+# connection and hands the blocks (and failed ids) back to the single writer.
+# =========================================================
+def _indicator_shard(db_path, is_indexs, timeframe, incremental, symbol_ids, names=None):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=30)
+    try:
+        errors = []
+        blocks = list(compute_indicator_blocks(conn, is_indexs, timeframe, incremental,
+                                               symbol_ids, names, errors))
+        return blocks, errors
+    finally:
+        conn.close()
+
+# =========================================================
+# plan_indicator_refresh Function
+# Compares the price watermark with the indicator watermark (stored state,
+# else MAX(date) of the indicator table) for every (id, timeframe) in one
+# query and returns {timeframe: [ids]} for the pairs whose prices are ahead.
+# =========================================================
+def plan_indicator_refresh(conn, is_indexs):
+    table_symbols   = "index_symbols"    if is_indexs else "equity_symbols"
+    price_table     = "index_price_data" if is_indexs else "equity_price_data"
+    indicator_table = "index_indicators" if is_indexs else "equity_indicators"
+    state_table     = "index_indicator_state" if is_indexs else "equity_indicator_state"
+    col_id          = "index_id"         if is_indexs else "symbol_id"
+    final_only      = ""                 if is_indexs else "AND p.is_final=1"
+
+    # Each watermark is an index seek from the top (ORDER BY date DESC LIMIT 1)
+    rows = conn.execute(f"""
+        SELECT sym.{col_id}, tf.timeframe,
+            (SELECT p.date FROM {price_table} p
+              WHERE p.{col_id} = sym.{col_id} AND p.timeframe = tf.timeframe {final_only}
+              ORDER BY p.date DESC LIMIT 1) AS price_mark,
+            COALESCE(st.last_date,
+              (SELECT MAX(i.date) FROM {indicator_table} i
+                WHERE i.{col_id} = sym.{col_id} AND i.timeframe = tf.timeframe)) AS indicator_mark
+        FROM {table_symbols} sym
+        CROSS JOIN timeframes tf
+        LEFT JOIN {state_table} st
+          ON st.{col_id} = sym.{col_id} AND st.timeframe = tf.timeframe
+    """).fetchall()
+
+    plan = {timeframe: [] for timeframe in FREQUENCIES}
+    pairs = {timeframe: 0 for timeframe in FREQUENCIES}
+    for symbol_id, timeframe, price_mark, indicator_mark in rows:
+        if timeframe not in plan:
+            continue
+        pairs[timeframe] += 1
+        if price_mark is not None and (indicator_mark is None or price_mark > indicator_mark):
+            plan[timeframe].append(symbol_id)
+
+    for timeframe, ids in plan.items():
+        print(f"📋 {timeframe}: {len(ids)} pairs with new bars, {pairs[timeframe] - len(ids)} skipped")
+    return plan
+
+# =========================================================
+# plan_indicator_changes Function
+# Turns the price change log ({timeframe: {id: min_date}}) into a refresh
+# plan {timeframe: [ids]}. A change at or before a pair's indicator state
+# (back-dated correction, deleted bar) drops the state and the final
+# indicator rows from min_date on, so the pair is recomputed from full
+# history and rewritten from there. Caller commits.
+# =========================================================
+def plan_indicator_changes(conn, is_indexs, changes):
+    indicator_table = "index_indicators" if is_indexs else "equity_indicators"
+    state_table     = "index_indicator_state" if is_indexs else "equity_indicator_state"
+    col_id          = "index_id"         if is_indexs else "symbol_id"
+    final_only      = ""                 if is_indexs else "AND is_final=1"
+
+    plan = {timeframe: [] for timeframe in FREQUENCIES}
+    for timeframe in FREQUENCIES:
+        changed = changes.get(timeframe, {})
+        plan[timeframe] = sorted(changed)
+        rows = [(min_date, symbol_id, timeframe) for symbol_id, min_date in changed.items()]
+
+        reset = 0
+        for row in rows:
+            reset += conn.execute(f"""
+                DELETE FROM {state_table}
+                WHERE last_date >= ? AND {col_id}=? AND timeframe=?
+            """, row).rowcount
+        conn.executemany(f"""
+            DELETE FROM {indicator_table}
+            WHERE date >= ? AND {col_id}=? AND timeframe=? {final_only}
+        """, rows)
+        print(f"📋 {timeframe}: {len(changed)} pairs changed, {reset} back-dated")
+    return plan
+
+# =========================================================
+# _flush_indicator_blocks Function
+# Writes pending blocks (rows + state) in one transaction with executemany.
+# If the batch fails it is rolled back and replayed row by row, so failing
+# rows are still reported individually. Returns the number of rows written.
+# rewrite=True (writes the change log does not explain: full rebuilds,
+# columns= backfills, watermark plans) bumps the indicator generation in
+# the same transaction.
+# =========================================================
+def _flush_indicator_blocks(conn, insert_sql, is_indexs, timeframe, blocks, rewrite=True):
+    def records(symbol_id, dates, values):
+        return [(symbol_id, timeframe, d, *v) for d, v in zip(dates.tolist(), values.tolist())]
+
+    try:
+        for symbol_id, dates, values, new_state in blocks:
+            conn.executemany(insert_sql, records(symbol_id, dates, values))
+            save_indicator_state(conn, is_indexs, symbol_id, timeframe, new_state)
+        if rewrite:
+            bump_indicator_generation(conn, is_indexs, timeframe)
+        conn.commit()
+        return sum(len(block[1]) for block in blocks)
+
+    except Exception as e:
+        conn.rollback()
+        print(f"⚠️ BATCH INSERT FAILED T={timeframe} | {e} — retrying row by row")
+
+    written = 0
+    for symbol_id, dates, values, new_state in blocks:
+        for record in records(symbol_id, dates, values):
+            try:
+                conn.execute(insert_sql, record)
+                written += 1
+            except Exception as ie:
+                print(f"❌ DB INSERT FAILED | {symbol_id} {timeframe} {record[2]} | {ie}")
+        try:
+            save_indicator_state(conn, is_indexs, symbol_id, timeframe, new_state)
+        except Exception:
+            traceback.print_exc()
+    if rewrite:
+        bump_indicator_generation(conn, is_indexs, timeframe)
+    conn.commit()
+    return written
+
+# =========================================================
+# _indicator_upsert_sql Function
+# INSERT ... ON CONFLICT DO UPDATE for (id, timeframe, date) + `columns`.
+# Columns not listed keep their stored values on conflict.
+# =========================================================
+def _indicator_upsert_sql(is_indexs, columns):
+    indicator_table = "index_indicators" if is_indexs else "equity_indicators"
+    col_id          = "index_id"         if is_indexs else "symbol_id"
+    placeholders = ",".join("?" * (len(columns) + 3))
+    updates = ",\n                ".join(f"{c}=excluded.{c}" for c in columns)
+    return f"""
+            INSERT INTO {indicator_table} (
+                {col_id}, timeframe, date, {", ".join(columns)}
+            )
+            VALUES ({placeholders})
+            ON CONFLICT({col_id}, timeframe, date)
+            DO UPDATE SET
+                {updates}
+        """
+
+def refresh_indicators(conn, is_indexs=False, incremental=False, workers=1,
+                       commit_rows=INDICATOR_COMMIT_ROWS, columns=None):
     """
     Calculates technical indicators for all symbols and writes directly to DB,
     without storing everything in memory. No data loss, and errors per-symbol are visible.
+
+    incremental=True refreshes the (symbol, timeframe) pairs whose prices changed
+    since the last run (price change log; the first run compares watermarks)
+    and advances each from its stored indicator state over the new bars only.
+    Back-dated changes drop the state and are rewritten from the changed date;
+    pairs without state are computed from full history once.
+
+    workers=N (N > 1) shards the symbols over a process pool; the workers only
+    read, this connection stays the single writer.
+
+    Rows are written with executemany and committed every `commit_rows` rows.
+
+    columns=[...] (indicator or column names from the registry) computes and
+    writes only those indicators plus their dependencies over the full
+    history, e.g. to backfill a newly added indicator. Other columns are left
+    untouched.
+
+    Equity runs end by bringing equity_mtf_daily up to date (rebuilt after
+    a full run or a columns= backfill, which the change log does not carry).
     """
 
     try:
         cur = conn.cursor()
+        create_derived_tables(cur)
+        conn.commit()
 
         # --- Table and ID names ---
         table_symbols  = "index_symbols"   if is_indexs else "equity_symbols"
-        price_table    = "index_price_data" if is_indexs else "equity_price_data"
         indicator_table = "index_indicators" if is_indexs else "equity_indicators"
         col_id         = "index_id"        if is_indexs else "symbol_id"
         symbol_type    = "indexes"         if is_indexs else "equities"
@@ -258,40 +595,28 @@ def refresh_indicators(conn, is_indexs=False, incremental=False, max_lookback=21
         symbol_ids = [row[0] for row in cur.fetchall()]
         print(f"\n🔢 Loaded {len(symbol_ids)} {symbol_type}")
 
+        if columns is not None and incremental:
+            print("⚠️ columns= backfills over full history — ignoring incremental=True")
+            incremental = False
+
+        # --- Incremental: only schedule pairs whose prices changed since the last run ---
+        change_seq, changes = read_price_changes(conn, is_indexs, indicator_table)
+        plan = None
+        if incremental and changes is not None:
+            plan = plan_indicator_changes(conn, is_indexs, changes)
+            conn.commit()
+        elif incremental:
+            # no cursor yet: compare price and indicator watermarks once
+            plan = plan_indicator_refresh(conn, is_indexs)
+        # only writes planned from the change log are seen by its consumers;
+        # everything else bumps the indicator generation
+        rewrite = plan is None or changes is None
+        failed = []    # (id, timeframe) pairs that could not be computed
+
         # TIMEFRAMES = ["1d", "1wk", "1mo"]
 
-        # --- UPSERT SQL (row-by-row) ---
-        insert_sql = f"""
-            INSERT INTO {indicator_table} (
-                {col_id}, timeframe, date,
-                sma_20, sma_50, sma_200,
-                rsi_3, rsi_9, rsi_14,
-                bb_upper, bb_middle, bb_lower,
-                atr_14, supertrend, supertrend_dir,
-                ema_rsi_9_3, wma_rsi_9_21, pct_price_change,
-                macd, macd_signal
-            )
-            VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-            ON CONFLICT({col_id}, timeframe, date)
-            DO UPDATE SET
-                sma_20=excluded.sma_20,
-                sma_50=excluded.sma_50,
-                sma_200=excluded.sma_200,
-                rsi_3=excluded.rsi_3,
-                rsi_9=excluded.rsi_9,
-                rsi_14=excluded.rsi_14,
-                bb_upper=excluded.bb_upper,
-                bb_middle=excluded.bb_middle,
-                bb_lower=excluded.bb_lower,
-                atr_14=excluded.atr_14,
-                supertrend=excluded.supertrend,
-                supertrend_dir=excluded.supertrend_dir,
-                ema_rsi_9_3=excluded.ema_rsi_9_3,
-                wma_rsi_9_21=excluded.wma_rsi_9_21,
-                pct_price_change=excluded.pct_price_change,
-                macd=excluded.macd,
-                macd_signal=excluded.macd_signal
-        """
+        # --- UPSERT SQL (executemany per batch), only the columns being computed ---
+        insert_sql = _indicator_upsert_sql(is_indexs, indicator_columns(columns))
 
         # ---------------------------------------------------------
         # MAIN LOOP — timeframe × symbol
@@ -302,84 +627,89 @@ def refresh_indicators(conn, is_indexs=False, incremental=False, max_lookback=21
 
             inserted_rows = 0
             processed_symbols = 0
-
-            for idx, symbol_id in enumerate(symbol_ids, start=1):
-
-                # --- Progress logs ---
-                if idx <= 3 or idx % 250 == 0:
-                    print(f"  → {idx}/{len(symbol_ids)} symbols...", flush=True)
-
-                try:
-                    # --- load the last indicator date for incremental mode ---
-                    last_date = None
-                    if incremental:
-                        cur.execute(f"""
-                            SELECT MAX(date) FROM {indicator_table}
-                            WHERE {col_id}=? AND timeframe=?
-                        """, (symbol_id, timeframe))
-                        last_date = cur.fetchone()[0]
-
-                    # --- Load raw price data ---
-                    if incremental and last_date:
-                        df = pd.read_sql(f"""
-                            SELECT date, open, high, low, close, adj_close
-                            FROM {price_table}
-                            WHERE {col_id}=? AND timeframe=? AND date >= (
-                                SELECT date FROM {price_table}
-                                WHERE {col_id}=? AND timeframe=? AND date<=?
-                                ORDER BY date DESC LIMIT ?
-                            )
-                            ORDER BY date
-                        """, conn, params=(symbol_id, timeframe,
-                                           symbol_id, timeframe, last_date, max_lookback))
-                    else:
-                        df = pd.read_sql(f"""
-                            SELECT date, open, high, low, close, adj_close
-                            FROM {price_table}
-                            WHERE {col_id}=? AND timeframe=?
-                            ORDER BY date
-                        """, conn, params=(symbol_id, timeframe))
-
-                    if df.empty:
-                        continue
-
-                    # --- Calculate indicators ---
-                    calculate_indicators(df, False)
-
-                    # --- Keep only new rows when incremental ---
-                    if incremental and last_date:
-                        df = df[df["date"] > last_date]
-                        if df.empty:
-                            continue
-
-                    # --- DIRECT INSERT ---
-                    for _, row in df.iterrows():
-                        record = (
-                            symbol_id, timeframe, row["date"],
-                            row["sma_20"], row["sma_50"], row["sma_200"],
-                            row["rsi_3"], row["rsi_9"], row["rsi_14"],
-                            row["bb_upper"], row["bb_middle"], row["bb_lower"],
-                            row["atr_14"], row["supertrend"], row["supertrend_dir"],
-                            row.get("ema_rsi_9_3"), row.get("wma_rsi_9_21"), row.get("pct_price_change"),
-                            row.get("macd"), row.get("macd_signal")
-                        )
-
+            # blocks computed but not yet written, flushed every commit_rows rows
+            pending, pending_rows = [], 0
+
+            tf_ids = plan[timeframe] if plan is not None else symbol_ids
+            if not tf_ids:
+                print(f"  ✔ {timeframe} up to date — nothing to compute")
+                continue
+
+            if workers > 1:
+                # --- Shard symbols over the pool, parent streams blocks into SQLite ---
+                db_path = conn.execute("PRAGMA database_list").fetchone()[2]
+                shard_size = max(len(tf_ids) // (workers * 8), 1)
+                shards = [tf_ids[i:i + shard_size] for i in range(0, len(tf_ids), shard_size)]
+
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    futures = [
+                        pool.submit(_indicator_shard, db_path, is_indexs, timeframe, incremental, shard, columns)
+                        for shard in shards
+                    ]
+                    for done, future in enumerate(as_completed(futures), start=1):
                         try:
-                            cur.execute(insert_sql, record)
-                            inserted_rows += 1
-                        except Exception as ie:
-                            print(f"❌ DB INSERT FAILED | {symbol_id} {timeframe} {row['date']} | {ie}")
-
-                    # Commit after each symbol → no data loss
-                    conn.commit()
+                            blocks, errors = future.result()
+                        except Exception as e:
+                            print(f"❌ SHARD FAILED T={timeframe} | {e}")
+                            traceback.print_exc()
+                            failed.extend((symbol_id, timeframe) for symbol_id in shards[futures.index(future)])
+                            continue
+                        failed.extend((symbol_id, timeframe) for symbol_id in errors)
+
+                        pending.extend(blocks)
+                        pending_rows += sum(len(block[1]) for block in blocks)
+                        processed_symbols += len(blocks)
+                        if pending_rows >= commit_rows:
+                            inserted_rows += _flush_indicator_blocks(conn, insert_sql, is_indexs, timeframe, pending, rewrite)
+                            pending, pending_rows = [], 0
+
+                        if done <= 3 or done % 25 == 0:
+                            print(f"  → {done}/{len(shards)} shards...", flush=True)
+
+            else:
+                errors = []
+                blocks = compute_indicator_blocks(conn, is_indexs, timeframe, incremental,
+                                                  tf_ids if plan is not None else None, columns, errors)
+                for idx, block in enumerate(blocks, start=1):
+
+                    # --- Progress logs ---
+                    if idx <= 3 or idx % 250 == 0:
+                        print(f"  → {idx} symbols with new bars...", flush=True)
+
+                    pending.append(block)
+                    pending_rows += len(block[1])
                     processed_symbols += 1
+                    if pending_rows >= commit_rows:
+                        inserted_rows += _flush_indicator_blocks(conn, insert_sql, is_indexs, timeframe, pending, rewrite)
+                        pending, pending_rows = [], 0
+
+                failed.extend((symbol_id, timeframe) for symbol_id in errors)
 
-                except Exception as e:
-                    print(f"❌ ERROR SYMBOL {symbol_id} T={timeframe} | {e}")
-                    traceback.print_exc()
+            if pending:
+                inserted_rows += _flush_indicator_blocks(conn, insert_sql, is_indexs, timeframe, pending, rewrite)
 
             print(f"  ✔ {timeframe} DONE | {processed_symbols} symbols | {inserted_rows} rows | {time.time()-tf_start_time:.1f}s")
 
+        # --- Price changes up to change_seq are now reflected: move this stage's cursor ---
+        if columns is None:
+            if failed and changes is None:
+                print(f"⚠️ {len(failed)} pairs failed — change log cursor not set, next run compares watermarks")
+            else:
+                if failed:
+                    # hand the failed pairs back to the log so the next run retries them
+                    log_price_changes(conn, is_indexs, [
+                        (symbol_id, timeframe, changes.get(timeframe, {}).get(symbol_id, ""))
+                        for symbol_id, timeframe in failed
+                    ])
+                    print(f"⚠️ {len(failed)} pairs failed — re-queued in the change log")
+                advance_change_cursor(conn, is_indexs, indicator_table, change_seq)
+                compact_price_changes(conn, is_indexs)
+                conn.commit()
+
+        # --- The scanners' aligned table follows; rewrites are not in the log ---
+        if not is_indexs:
+            refresh_mtf_daily(conn, rebuild=rewrite)
+
         print("\n🎉 ALL TIMEFRAMES COMPLETE — indicators refreshed safely!")
 
     except Exception as e:
@@ -387,334 +717,107 @@ def refresh_indicators(conn, is_indexs=False, incremental=False, max_lookback=21
         traceback.print_exc()
 
 # =========================================================
-# refresh_equity_partial_prices Function
-# This function refreshes partial weekly and monthly equity price data
-# based on the latest daily data.
-# Refresh partial weekly and monthly equity candles based on daily data.
-# Logic:
-# 1. Fetch last completed weekly & monthly candles from equity_price_data (is_final=True)
-# 2. Clear any previous partial candles (is_final=False)
-# 3. Load daily rows after or equal to last completed weekly/monthly (is_final=True)
-# 4. Aggregate daily rows into partial weekly/monthly candles
-# 5. Insert partial candles using latest daily date with is_final=False
+# compute_partial_indicators Function
+# Indicator values of one in-progress bar per id, seeded from the stored
+# indicator state so only the partial bar (plus any final bars the state
+# has not reached yet) is evaluated. Pairs without a usable state fall
+# back to their full final history.
+#   partials -> {id: {"date": ..., "open": ..., ..., "adj_close": ...}}
+# Returns [(id, date, values)] with values ordered like INDICATOR_COLUMNS
+# (NaN → None); a partial not after the last final bar is skipped.
 # =========================================================
-def refresh_equity_partial_prices(conn):
-
-    cur = conn.cursor()
-    try:
-        print("🔍 Fetching last completed weekly & monthly candles...")
-
-        # ---- completed weekly high-water mark (is_final=True) ----
-        last_week_str = cur.execute("""
-            SELECT MAX(date) FROM equity_price_data 
-            WHERE timeframe='1wk' AND is_final=1
-        """).fetchone()[0]
-
-        # ---- completed monthly high-water mark (is_final=True) ----
-        last_month_str = cur.execute("""
-            SELECT MAX(date) FROM equity_price_data 
-            WHERE timeframe='1mo' AND is_final=1
-        """).fetchone()[0]
-
-        # ---- latest daily date (is_final=True) -> this becomes partial candle date ----
-        latest_daily_str = cur.execute("""
-            SELECT MAX(date) FROM equity_price_data 
-            WHERE timeframe='1d' AND is_final=1
-        """).fetchone()[0]
-
-        last_week = datetime.strptime(last_week_str, "%Y-%m-%d").date()
-        last_month = datetime.strptime(last_month_str, "%Y-%m-%d").date()
-
-        print(f"📌 Last completed weekly:  {last_week}")
-        print(f"📌 Last completed monthly: {last_month}")
-        print(f"📅 Partial candle date:   {latest_daily_str}")
-
-        # --------------------------------------------------------
-        # Always clear previous partial candles (is_final=False)
-        # --------------------------------------------------------
-        print("🧹 Clearing previous partial candles...")
-        cur.execute("DELETE FROM equity_price_data WHERE is_final=0")
-        conn.commit()
-
-        # --------------------------------------------------------
-        # Load daily rows from last completed weekly/monthly (inclusive) (is_final=True)
-        # --------------------------------------------------------
-        print("📥 Loading daily raw candles from last complete periods...")
-
-        daily_rows = cur.execute("""
-            SELECT symbol_id, date, open, high, low, close, adj_close
-            FROM equity_price_data
-            WHERE timeframe='1d' AND is_final=1
-            AND (date >= ? OR date >= ?)
-            ORDER BY symbol_id, date
-        """, (last_week_str, last_month_str)).fetchall()
-
-        # --------------------------------------------------------
-        # Aggregate into ONE partial weekly & ONE partial monthly candle
-        # --------------------------------------------------------
-        weekly = {}
-        monthly = {}
-
-        for sid, ds, o, h, l, c, adj in daily_rows:
-            d = datetime.strptime(ds, "%Y-%m-%d").date()
-
-            if d >= last_week:
-                w = weekly.setdefault(sid, dict(open=o, high=h, low=l, close=c, adj_close=adj))
-                w["high"] = max(w["high"], h)
-                w["low"]  = min(w["low"], l)
-                w["close"] = c
-                w["adj_close"] = adj
-
-            if d >= last_month:
-                m = monthly.setdefault(sid, dict(open=o, high=h, low=l, close=c, adj_close=adj))
-                m["high"] = max(m["high"], h)
-                m["low"]  = min(m["low"], l)
-                m["close"] = c
-                m["adj_close"] = adj
-
-        # --------------------------------------------------------
-        # Insert partial candles using **latest daily date** (is_final=False)
-        # --------------------------------------------------------
-        rows = []
-
-        for sid, v in weekly.items():
-            rows.append((sid, "1wk", latest_daily_str, v["open"], v["high"],
-                        v["low"], v["close"], v["adj_close"], 0))  # is_final=False
-
-        for sid, v in monthly.items():
-            rows.append((sid, "1mo", latest_daily_str, v["open"], v["high"],
-                        v["low"], v["close"], v["adj_close"], 0))  # is_final=False
-
-        print(f"💾 Partial weekly candles:  {len(weekly)}")
-        print(f"💾 Partial monthly candles: {len(monthly)}")
-
-        if rows:
-            cur.executemany("""
-                INSERT INTO equity_price_data
-                (symbol_id, timeframe, date, open, high, low, close, adj_close, is_final)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, rows)
-            conn.commit()
-
-        print("🎉 Partial price update COMPLETE – one partial candle per symbol!")
-
-    except Exception as e:
-        log(f"REFRESH PARTIAL PRICES FAILED | {e}")
-        traceback.print_exc()
-
-def refresh_equity_partial_prices_datewise(conn,partial_date_str=None):
-
-    cur = conn.cursor()
-    try:
-        print("🔍 Fetching last completed weekly & monthly candles...")
-
-        # ---- completed weekly high-water mark (is_final=True) ----
-        last_week_str = cur.execute("""
-            SELECT MAX(date) FROM equity_price_data 
-            WHERE timeframe='1wk' AND is_final=1
-        """).fetchone()[0]
-
-        # ---- completed monthly high-water mark (is_final=True) ----
-        last_month_str = cur.execute("""
-            SELECT MAX(date) FROM equity_price_data 
-            WHERE timeframe='1mo' AND is_final=1
-        """).fetchone()[0]
-
-        # ---- latest daily date (is_final=True) -> this becomes partial candle date ----
-
-        # ---- use user-supplied date OR fall back to latest daily ----
-        if partial_date_str is None:
-            latest_daily_str = cur.execute("""
-                SELECT MAX(date) FROM equity_price_data 
-                WHERE timeframe='1d' AND is_final=1
-            """).fetchone()[0]
-        else:
-            latest_daily_str = partial_date_str
-
-        last_week = datetime.strptime(last_week_str, "%Y-%m-%d").date()
-        last_month = datetime.strptime(last_month_str, "%Y-%m-%d").date()
-
-        print(f"📌 Last completed weekly:  {last_week}")
-        print(f"📌 Last completed monthly: {last_month}")
-        print(f"📅 Partial candle date:   {latest_daily_str}")
-
-        # --------------------------------------------------------
-        # Always clear previous partial candles (is_final=False)
-        # --------------------------------------------------------
-        print("🧹 Clearing previous partial candles...")
-        cur.execute("DELETE FROM equity_price_data WHERE is_final=0")
-        conn.commit()
-
-        # --------------------------------------------------------
-        # Load daily rows from last completed weekly/monthly (inclusive) (is_final=True)
-        # --------------------------------------------------------
-        print("📥 Loading daily raw candles from last complete periods...")
-
-        daily_rows = cur.execute("""
-            SELECT symbol_id, date, open, high, low, close, adj_close
-            FROM equity_price_data
-            WHERE timeframe='1d' AND is_final=1
-            AND (date >= ? OR date >= ?)
-            ORDER BY symbol_id, date
-        """, (last_week_str, last_month_str)).fetchall()
-
-        # --------------------------------------------------------
-        # Aggregate into ONE partial weekly & ONE partial monthly candle
-        # --------------------------------------------------------
-        weekly = {}
-        monthly = {}
-
-        for sid, ds, o, h, l, c, adj in daily_rows:
-            d = datetime.strptime(ds, "%Y-%m-%d").date()
-
-            if d >= last_week:
-                w = weekly.setdefault(sid, dict(open=o, high=h, low=l, close=c, adj_close=adj))
-                w["high"] = max(w["high"], h)
-                w["low"]  = min(w["low"], l)
-                w["close"] = c
-                w["adj_close"] = adj
-
-            if d >= last_month:
-                m = monthly.setdefault(sid, dict(open=o, high=h, low=l, close=c, adj_close=adj))
-                m["high"] = max(m["high"], h)
-                m["low"]  = min(m["low"], l)
-                m["close"] = c
-                m["adj_close"] = adj
-
-        # --------------------------------------------------------
-        # Insert partial candles using **latest daily date** (is_final=False)
-        # --------------------------------------------------------
-        rows = []
-
-        for sid, v in weekly.items():
-            rows.append((sid, "1wk", latest_daily_str, v["open"], v["high"],
-                        v["low"], v["close"], v["adj_close"], 0))  # is_final=False
-
-        for sid, v in monthly.items():
-            rows.append((sid, "1mo", latest_daily_str, v["open"], v["high"],
-                        v["low"], v["close"], v["adj_close"], 0))  # is_final=False
-
-        print(f"💾 Partial weekly candles:  {len(weekly)}")
-        print(f"💾 Partial monthly candles: {len(monthly)}")
-
-        if rows:
-            cur.executemany("""
-                INSERT INTO equity_price_data
-                (symbol_id, timeframe, date, open, high, low, close, adj_close, is_final)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, rows)
-            conn.commit()
-
-        print("🎉 Partial price update COMPLETE – one partial candle per symbol!")
-
-    except Exception as e:
-        log(f"REFRESH PARTIAL PRICES FAILED | {e}")
-        traceback.print_exc()
-
+def compute_partial_indicators(conn, is_indexs, timeframe, partials):
+    if not partials:
+        return []
+    entries = resolve_indicators()
+    states = {
+        symbol_id: state
+        for symbol_id, state in load_indicator_states(conn, is_indexs, timeframe).items()
+        if symbol_id in partials and all(name in state.get("indicators", {}) for name in entries)
+    }
+    bounds = {symbol_id: state["last_date"] for symbol_id, state in states.items()}
+
+    # final bars past each state (usually none), full history without one
+    tails = dict(iter_symbol_bars(conn, is_indexs, timeframe, bounds, list(partials)))
+
+    rows = []
+    for symbol_id, partial in partials.items():
+        try:
+            state = states.get(symbol_id)
+            tail = tails.get(symbol_id, {"date": np.array([], dtype=str),
+                                         **{c: np.array([]) for c in BAR_COLUMNS}})
+            last_final = tail["date"][-1] if len(tail["date"]) else (state or {}).get("last_date")
+            if last_final is not None and partial["date"] <= last_final:
+                continue
+
+            bars = {"date": np.append(tail["date"], partial["date"])}
+            for name in BAR_COLUMNS:
+                bars[name] = np.append(tail[name], np.nan if partial[name] is None else partial[name])
+
+            record, _ = compute_last_indicators(bars, state=state)
+            values = [record[c] for c in INDICATOR_COLUMNS]
+            rows.append((symbol_id, partial["date"], [None if np.isnan(v) else v for v in values]))
+
+        except Exception as e:
+            print(f"❌ ERROR PARTIAL {symbol_id} T={timeframe} | {e}")
+            traceback.print_exc()
+    return rows
 
 # =========================================================
-# refresh_equity_partial_indicators Function
-# This function rebuilds partial weekly & monthly indicators and stores them
-# directly in equity_indicators with is_final = 0 (meaning: partial). 
+# refresh_partial_indicators Function
+# This function rebuilds partial weekly & monthly indicators for the
+# candles in the *_price_partial overlay and stores them in
+# *_indicator_partial. Each is seeded from the stored indicator state, so
+# only the partial bar itself is evaluated.
+# Scanners read final + partial rows through *_indicators_all.
 # =========================================================
-def refresh_equity_partial_indicators(conn):
+def refresh_partial_indicators(conn, is_indexs=False):
     """
-    Rebuild partial weekly & monthly indicators and store them directly in equity_indicators
-    with is_final = 0 (meaning: partial).
+    Rebuild partial weekly & monthly indicators into the *_indicator_partial
+    overlay (one row per id and timeframe); *_indicators is not touched.
+    Run after refresh_indicators so the stored states are at the last final bar.
     """
-    print("➡️ Refreshing partial indicators...")
-    cur = conn.cursor()
+    price_view = "index_price_all"         if is_indexs else "equity_price_all"
+    overlay    = "index_indicator_partial" if is_indexs else "equity_indicator_partial"
+    col_id     = "index_id"                if is_indexs else "symbol_id"
+    label      = "index"                   if is_indexs else "equity"
 
-    # ---- 1️⃣ Remove old partial indicators ----
-    try:
-        cur.execute("BEGIN")
-        cur.execute("DELETE FROM equity_indicators WHERE is_final = 0")
-        conn.commit()
-        print("🧹 Cleared old partial indicators from equity_indicators")
-    except Exception as e:
-        conn.rollback()
-        print(f"❌ Failed to clear partial indicators | {e}")
-        return
-
-    # ---- 2️⃣ Load weekly & monthly prices (full + partial) ----
-    df_prices = pd.read_sql("""
-        SELECT symbol_id, timeframe, date, open, high, low, close, adj_close, volume
-        FROM equity_price_data
-        WHERE timeframe IN ('1wk', '1mo')
-        ORDER BY symbol_id, timeframe, date
-    """, conn)
-
-    if df_prices.empty:
-        print("⚠️ No weekly or monthly price data available — nothing to compute.")
-        return
-
-    # ---- 3️⃣ Compute partial indicators grouped ----
-    calc_cols = ["date", "open", "high", "low", "close", "adj_close", "volume"]
-    groups = []
-
-    for (symbol_id, timeframe), group in df_prices.groupby(["symbol_id", "timeframe"]):
-        calc_group = group[calc_cols].copy().sort_values("date")
-
-        # Compute indicators but keep only latest row
-        ind = calculate_indicators(calc_group, latest_only=True)
-
-        ind["symbol_id"] = symbol_id
-        ind["timeframe"] = timeframe
-        ind["is_final"] = 0  # <---- IMPORTANT
-
-        groups.append(ind)
-
-    df_ind = pd.concat(groups, ignore_index=True)
-
-    # ---- 4️⃣ Restrict to allowed columns ----
-    allowed_columns = [
-        "symbol_id", "timeframe", "date", "is_final",
-        "sma_20", "sma_50", "sma_200",
-        "rsi_3", "rsi_9", "rsi_14",
-        "ema_rsi_9_3", "wma_rsi_9_21",
-        "pct_price_change",
-        "macd", "macd_signal",
-        "bb_upper", "bb_middle", "bb_lower",
-        "atr_14",
-        "supertrend", "supertrend_dir"
-    ]
-    df_out = df_ind[[c for c in allowed_columns if c in df_ind.columns]]
-
-    print(f"📌 {len(df_out)} latest partial indicator rows generated")
-    # ---- 5️⃣ Insert partial indicators into main table ----
+    print(f"➡️ Refreshing partial {label} indicators...")
+    start = time.time()
+    cur = conn.cursor()
+    create_derived_tables(cur)
+    conn.commit()
+
+    records = []
+    for timeframe in ("1wk", "1mo"):
+        # ---- 1️⃣ Partial candles visible in *_price_all ----
+        partials = {
+            row[0]: dict(zip(["date"] + BAR_COLUMNS, row[1:]))
+            for row in conn.execute(f"""
+                SELECT {col_id}, date, open, high, low, close, adj_close
+                FROM {price_view}
+                WHERE timeframe = ? AND is_final = 0
+            """, (timeframe,))
+        }
+
+        # ---- 2️⃣ Evaluate only the partial bar from stored state ----
+        rows = compute_partial_indicators(conn, is_indexs, timeframe, partials)
+        records.extend((symbol_id, timeframe, date, *values) for symbol_id, date, values in rows)
+        print(f"📌 {timeframe}: {len(rows)} partial indicator rows from {len(partials)} partial candles")
+
+    # ---- 3️⃣ Replace the overlay in one transaction ----
     try:
-        cur.execute("BEGIN")
-
-        insert_sql = """
-            INSERT OR REPLACE INTO equity_indicators (
-                symbol_id, timeframe, date, is_final,
-                sma_20, sma_50, sma_200,
-                rsi_3, rsi_9, rsi_14,
-                ema_rsi_9_3, wma_rsi_9_21,
-                pct_price_change,
-                macd, macd_signal,
-                bb_upper, bb_middle, bb_lower,
-                atr_14,
-                supertrend, supertrend_dir
-            ) VALUES (
-                :symbol_id, :timeframe, :date, :is_final,
-                :sma_20, :sma_50, :sma_200,
-                :rsi_3, :rsi_9, :rsi_14,
-                :ema_rsi_9_3, :wma_rsi_9_21,
-                :pct_price_change,
-                :macd, :macd_signal,
-                :bb_upper, :bb_middle, :bb_lower,
-                :atr_14,
-                :supertrend, :supertrend_dir
-            )
-        """
-
-        cur.executemany(insert_sql, df_out.to_dict(orient="records"))
+        cur.execute(f"DELETE FROM {overlay}")
+        cur.executemany(f"""
+            INSERT INTO {overlay} (
+                {col_id}, timeframe, date, {", ".join(INDICATOR_COLUMNS)}
+            ) VALUES ({",".join("?" * (len(INDICATOR_COLUMNS) + 3))})
+        """, records)
         conn.commit()
 
-        print(f"✅ {len(df_out)} partial indicator rows inserted/replaced successfully")
+        print(f"✅ {len(records)} partial {label} indicator rows written to the overlay ({time.time()-start:.1f}s)")
 
     except Exception as e:
         conn.rollback()
-        print(f"❌ Failed to insert partial indicators | {e}")
-        traceback.print_exc()
\ No newline at end of file
+        print(f"❌ Failed to write partial {label} indicators | {e}")
+        traceback.print_exc()
@@ -3,9 +3,150 @@ import numpy as np
 import traceback
 import time
 import sys
+from numpy.lib.stride_tricks import sliding_window_view
 from helper import (
     log
 )
+# ---------------------------------------------
+# Seedable Array Kernels
+# Each kernel works on plain NumPy arrays and can continue from a seed
+# (the recursive state / window tail left behind by the previous bar), so a
+# series advanced bar-by-bar gives exactly the same numbers as a full run.
+# Rolling windows are summed position-by-position so a window's value only
+# depends on the values inside it, never on where the array started.
+# ---------------------------------------------
+def ewm_mean(values, seed=None, min_periods=0, **ewm_kwargs):
+    """
+    adjust=False EWM of `values` continued from `seed`.
+    seed / returned state = [weighted, nobs, nan_run]
+    """
+    values = np.asarray(values, dtype=float)
+    weighted, nobs, nan_run = seed if seed is not None else (np.nan, 0, 0)
+
+    # Replaying the last weighted value (plus any trailing NaNs) reproduces
+    # pandas' internal recursion exactly, so the C implementation does the work
+    prefix = [] if np.isnan(weighted) else [weighted] + [np.nan] * nan_run
+    series = pd.Series(np.concatenate([prefix, values]))
+    out = series.ewm(adjust=False, **ewm_kwargs).mean().to_numpy(copy=True)[len(prefix):]
+
+    observed = ~np.isnan(values)
+    counts = nobs + np.cumsum(observed)
+    if observed.any():
+        last = np.flatnonzero(observed)[-1]
+        state = [float(out[last]), int(counts[-1]), int(len(values) - 1 - last)]
+    else:
+        state = [weighted, nobs, nan_run + len(values) if not np.isnan(weighted) else 0]
+
+    if min_periods:
+        out[counts < min_periods] = np.nan
+    return out, state
+
+def window_tail(values, tail, length):
+    """Last `length` values of tail + values (the window tail kept in state)."""
+    head = np.asarray(tail if tail is not None else [], dtype=float)
+    joined = np.concatenate([head, np.asarray(values, dtype=float)])
+    return joined[max(len(joined) - length, 0):]
+
+def _rolling_windows(values, period, tail):
+    head = window_tail([], tail, period - 1)
+    x = np.concatenate([head, np.asarray(values, dtype=float)])
+    windows = sliding_window_view(x, period) if len(x) >= period else np.empty((0, period))
+    return windows, len(head)
+
+def _align(window_values, n_head, n_values, period):
+    out = np.full(n_head + n_values, np.nan)
+    out[period - 1:] = window_values
+    return out[n_head:]
+
+def rolling_sum(values, period, tail=None, weights=None):
+    windows, n_head = _rolling_windows(values, period, tail)
+    total = windows[:, 0] * (weights[0] if weights is not None else 1.0)
+    for j in range(1, period):
+        total = total + windows[:, j] * (weights[j] if weights is not None else 1.0)
+    return _align(total, n_head, len(values), period)
+
+def rolling_mean(values, period, tail=None):
+    return rolling_sum(values, period, tail) / period
+
+def rolling_std(values, period, tail=None):
+    windows, n_head = _rolling_windows(values, period, tail)
+    mean = windows[:, 0].copy()
+    for j in range(1, period):
+        mean = mean + windows[:, j]
+    mean = mean / period
+    sq = (windows[:, 0] - mean) ** 2
+    for j in range(1, period):
+        sq = sq + (windows[:, j] - mean) ** 2
+    return _align(np.sqrt(sq / (period - 1)), n_head, len(values), period)
+
+def shift_with_seed(values, prev=np.nan):
+    values = np.asarray(values, dtype=float)
+    return np.concatenate([[prev], values[:-1]]) if len(values) else values
+
+def rsi_kernel(close, period, prev_close=np.nan, seed=None):
+    """RSI (Wilder) of `close`; seed / returned state = (gain_state, loss_state)."""
+    close = np.asarray(close, dtype=float)
+    delta = close - shift_with_seed(close, prev_close)
+    gain = np.clip(delta, 0, None)
+    loss = -np.clip(delta, None, 0)
+    gain_seed, loss_seed = seed if seed is not None else (None, None)
+    avg_gain, gain_state = ewm_mean(gain, gain_seed, min_periods=period, alpha=1 / period)
+    avg_loss, loss_state = ewm_mean(loss, loss_seed, min_periods=period, alpha=1 / period)
+    # avoid division by zero; where avg_loss == 0, RSI should be 100 (all gains)
+    rs = avg_gain / np.where(avg_loss == 0, np.nan, avg_loss)
+    rsi = 100 - (100 / (1 + rs))
+    rsi = np.where(np.isnan(rsi), 100.0, rsi)
+    return np.round(rsi, 2), [gain_state, loss_state]
+
+def atr_kernel(high, low, close, period, prev_close=np.nan, seed=None):
+    high, low, close = (np.asarray(a, dtype=float) for a in (high, low, close))
+    prev = shift_with_seed(close, prev_close)
+    tr = np.fmax(np.fmax(high - low, np.abs(high - prev)), np.abs(low - prev))
+    # Wilder's smoothing (EMA with adjust=False)
+    atr, state = ewm_mean(tr, seed, min_periods=period, alpha=1 / period)
+    return np.round(atr, 2), state
+
+def supertrend_kernel(high, low, close, atr, multiplier=3, seed=None):
+    """
+    SuperTrend from a (rounded) ATR series.
+    seed / returned state = [final_ub, final_lb, supertrend, prev_close]
+    """
+    high, low, close, atr = (np.asarray(a, dtype=float) for a in (high, low, close, atr))
+    hl2 = (high + low) / 2
+    basic_ub = hl2 + multiplier * atr
+    basic_lb = hl2 - multiplier * atr
+
+    n = len(close)
+    supertrend = np.full(n, np.nan)
+    direction = np.full(n, np.nan)
+    prev_ub, prev_lb, prev_st, prev_close = seed if seed is not None else (np.nan,) * 4
+
+    for i in range(n):
+        if i == 0 and seed is None:
+            final_ub, final_lb = basic_ub[0], basic_lb[0]
+            supertrend[0], direction[0] = final_ub, -1   # initial trend is down
+        else:
+            # ---- ADJUST BANDS (a band still warming up takes the basic band) ----
+            if np.isnan(prev_ub) or basic_ub[i] < prev_ub or prev_close > prev_ub:
+                final_ub = basic_ub[i]
+            else:
+                final_ub = prev_ub
+            if np.isnan(prev_lb) or basic_lb[i] > prev_lb or prev_close < prev_lb:
+                final_lb = basic_lb[i]
+            else:
+                final_lb = prev_lb
+
+            # ---- direction based on prev supertrend ----
+            if close[i] > prev_st:
+                direction[i], supertrend[i] = 1, final_lb     # uptrend
+            else:
+                direction[i], supertrend[i] = -1, final_ub    # downtrend
+
+        prev_ub, prev_lb, prev_st, prev_close = final_ub, final_lb, supertrend[i], close[i]
+
+    state = [float(prev_ub), float(prev_lb), float(prev_st), float(prev_close)]
+    return np.round(supertrend, 2), direction, state
+
 # ---------------------------------------------
 # Indicator Calculations
 # ---------------------------------------------
@@ -15,17 +156,8 @@ from helper import (
 def calculate_rsi_series(close, period):
     try:
         # Use Wilder's smoothing (adjust=False) for RSI as commonly expected
-        delta = close.diff()
-        gain = delta.clip(lower=0)
-        loss = -delta.clip(upper=0)
-        avg_gain = gain.ewm(alpha=1 / period, adjust=False, min_periods=period).mean()
-        avg_loss = loss.ewm(alpha=1 / period, adjust=False, min_periods=period).mean()
-        # avoid division by zero
-        rs = avg_gain / avg_loss.replace(0, np.nan)
-        rsi = 100 - (100 / (1 + rs))
-        # where avg_loss == 0, RSI should be 100 (all gains)
-        rsi = rsi.fillna(100)
-        return rsi.round(2)
+        rsi, _ = rsi_kernel(close.to_numpy(dtype=float), period)
+        return pd.Series(rsi, index=close.index)
     except Exception as e:
         log(f"RSI CALC FAILED | period={period} | {e}")
         traceback.print_exc()
@@ -35,11 +167,12 @@ def calculate_rsi_series(close, period):
 # ---------------------------------------------
 def calculate_bollinger(close, period=20, std_mult=2):
     try:
-        mid = close.rolling(period).mean()
-        std = close.rolling(period).std()
+        values = close.to_numpy(dtype=float)
+        mid = rolling_mean(values, period)
+        std = rolling_std(values, period)
         upper = mid + std_mult * std
         lower = mid - std_mult * std
-        return upper.round(2), mid.round(2), lower.round(2)
+        return tuple(pd.Series(np.round(s, 2), index=close.index) for s in (upper, mid, lower))
     except Exception as e:
         log(f"BOLLINGER CALC FAILED | {e}")
         traceback.print_exc()
@@ -50,13 +183,8 @@ def calculate_bollinger(close, period=20, std_mult=2):
 # ---------------------------------------------
 def calculate_atr(df, period=14):
     try:
-        high_low = df["high"] - df["low"]
-        high_close = (df["high"] - df["close"].shift()).abs()
-        low_close = (df["low"] - df["close"].shift()).abs()
-        tr = pd.concat([high_low, high_close, low_close], axis=1).max(axis=1)
-        # Use Wilder's smoothing (EMA with adjust=False) for ATR
-        atr = tr.ewm(alpha=1 / period, adjust=False, min_periods=period).mean()
-        return atr.round(2)
+        atr, _ = atr_kernel(df["high"], df["low"], df["close"], period)
+        return pd.Series(atr, index=df.index)
     except Exception as e:
         log(f"ATR CALC FAILED | period={period} | {e}")
         traceback.print_exc()
@@ -66,11 +194,14 @@ def calculate_atr(df, period=14):
 # ---------------------------------------------
 def calculate_macd(close):
     try:
-        ema_12 = close.ewm(span=12, adjust=False).mean()
-        ema_26 = close.ewm(span=26, adjust=False).mean()
+        ema_12, _ = ewm_mean(close, span=12)
+        ema_26, _ = ewm_mean(close, span=26)
         macd = ema_12 - ema_26
-        signal = macd.ewm(span=9, adjust=False).mean()
-        return macd.round(2), signal.round(2)
+        signal, _ = ewm_mean(macd, span=9)
+        return (
+            pd.Series(np.round(macd, 2), index=close.index),
+            pd.Series(np.round(signal, 2), index=close.index),
+        )
     except Exception as e:
         log(f"MACD CALC FAILED | {e}")
         traceback.print_exc()
@@ -83,48 +214,11 @@ def calculate_macd(close):
 # ---------------------------------------------
 def calculate_supertrend(df, atr_period=10, multiplier=3):
     try:
-        atr = calculate_atr(df, atr_period)
-        hl2 = (df["high"] + df["low"]) / 2
-
-        basic_ub = hl2 + multiplier * atr
-        basic_lb = hl2 - multiplier * atr
-
-        final_ub = basic_ub.copy()
-        final_lb = basic_lb.copy()
-
-        # ---- ADJUST BANDS (correct as-is) ----
-        for i in range(1, len(df)):
-            if basic_ub.iloc[i] < final_ub.iloc[i - 1] or df["close"].iloc[i - 1] > final_ub.iloc[i - 1]:
-                final_ub.iloc[i] = basic_ub.iloc[i]
-            else:
-                final_ub.iloc[i] = final_ub.iloc[i - 1]
-
-            if basic_lb.iloc[i] > final_lb.iloc[i - 1] or df["close"].iloc[i - 1] < final_lb.iloc[i - 1]:
-                final_lb.iloc[i] = basic_lb.iloc[i]
-            else:
-                final_lb.iloc[i] = final_lb.iloc[i - 1]
-
-
-        # ---- CORRECT SUPER TREND SELECTION ----
-        supertrend = pd.Series(index=df.index, dtype=float)
-        direction = pd.Series(index=df.index, dtype=int)
-
-        # initialize
-        supertrend.iloc[0] = final_ub.iloc[0]
-        direction.iloc[0] = -1   # initial trend is down
-
-        for i in range(1, len(df)):
-            prev_st = supertrend.iloc[i - 1]
-
-            # Determine direction based on prev supertrend
-            if df["close"].iloc[i] > prev_st:
-                direction.iloc[i] = 1      # uptrend
-                supertrend.iloc[i] = final_lb.iloc[i]
-            else:
-                direction.iloc[i] = -1     # downtrend
-                supertrend.iloc[i] = final_ub.iloc[i]
-
-        return supertrend.round(2), direction
+        atr, _ = atr_kernel(df["high"], df["low"], df["close"], atr_period)
+        supertrend, direction, _ = supertrend_kernel(
+            df["high"], df["low"], df["close"], atr, multiplier
+        )
+        return pd.Series(supertrend, index=df.index), pd.Series(direction, index=df.index)
 
     except Exception as e:
         log(f"SUPERTREND CALC FAILED | {e}")
@@ -139,7 +233,8 @@ def calculate_supertrend(df, atr_period=10, multiplier=3):
 def calculate_ema(series, period):
     try:
         # Keep as-is (Wilder-style EMA behavior with adjust=False)
-        return series.ewm(span=period, adjust=False).mean().round(2)
+        ema, _ = ewm_mean(series, span=period)
+        return pd.Series(np.round(ema, 2), index=series.index)
     except Exception as e:
         log(f"EMA CALC FAILED | period={period} | {e}")
         traceback.print_exc()
@@ -150,9 +245,9 @@ def calculate_ema(series, period):
 def calculate_wma(series, period):
     try:
         weights = np.arange(1, period + 1)
-        wma = series.rolling(period).apply(lambda x: np.dot(x, weights)/weights.sum(), raw=True)
-        return wma.round(2)
+        wma = rolling_sum(series.to_numpy(dtype=float), period, weights=weights) / weights.sum()
+        return pd.Series(np.round(wma, 2), index=series.index)
     except Exception as e:
         log(f"WMA CALC FAILED | period={period} | {e}")
         traceback.print_exc()
-        return pd.Series(index=series.index, dtype=float)
\ No newline at end of file
+        return pd.Series(index=series.index, dtype=float)
@@ -4,7 +4,7 @@ from rich.table import Table
 from rich.prompt import Prompt
 from helper import (
     LOG_FILE, MAIN_MENU_ITEMS,
-    FREQ_COLORS
+    FREQ_COLORS, INDICATOR_WORKERS
 )
 from data_manager import (
     get_db_connection,
@@ -17,12 +17,12 @@ from data_manager import (
     # check_export_csv_missing_data
 )
 from create_db import create_stock_database
+from columnar_mirror import sync_columnar_mirror
 from indicators import (
     refresh_indicators, 
-    refresh_equity_partial_prices,
-    refresh_equity_partial_indicators,
-    refresh_equity_partial_prices_datewise
+    refresh_partial_indicators
 )
+from partial_prices import refresh_partial_prices
 
 console = Console()
 
@@ -106,10 +106,10 @@ def data_manager_user_input():
                     console.print("\n[bold green]End 52 weeks stat run for index...[/bold green]")
                 elif choice == "8":
                     # Update all Equity Indicators
-                    refresh_indicators(conn, is_indexs=False)
+                    refresh_indicators(conn, is_indexs=False, workers=INDICATOR_WORKERS)
                 elif choice == "9":
                     # Update all Index Indicators
-                    refresh_indicators(conn, is_indexs=True)
+                    refresh_indicators(conn, is_indexs=True, workers=INDICATOR_WORKERS)
                 elif choice == "10":
                     # Update Incremental Equity Indicators
                     refresh_indicators(conn, is_indexs=False, incremental=True)
@@ -117,15 +117,22 @@ def data_manager_user_input():
                     # Update Incremental Index Indicators
                     refresh_indicators(conn, is_indexs=True, incremental=True)
                 elif choice == "12":
-                    # Update partial equity prices for weekly and monthly
-                    refresh_equity_partial_prices(conn)
+                    # Update partial equity and index prices for weekly and monthly
+                    refresh_partial_prices(conn)
+                    refresh_partial_prices(conn, is_indexs=True)
                 elif choice == "13":
-                    # Update partial equity prices for weekly and monthly datewise
+                    # Update partial equity and index prices for weekly and monthly as of a date
                     run_dt = Prompt.ask("Enter Date (YYYY-MM-DD)")
-                    refresh_equity_partial_prices_datewise(conn,run_dt)
+                    refresh_partial_prices(conn, as_of=run_dt)
+                    refresh_partial_prices(conn, as_of=run_dt, is_indexs=True)
                 elif choice == "14":
-                    # Update Partial Equity Indicators for weekly and monthly
-                    refresh_equity_partial_indicators(conn)
+                    # Update Partial Equity and Index Indicators for weekly and monthly
+                    refresh_partial_indicators(conn)
+                    refresh_partial_indicators(conn, is_indexs=True)
+                elif choice == "15":
+                    # Sync the columnar mirror of price and indicator tables
+                    sync_columnar_mirror(conn, is_indexs=False)
+                    sync_columnar_mirror(conn, is_indexs=True)
                 else:
                     console.print("[bold red]❌ Invalid choice![/bold red]")
             finally:
@@ -0,0 +1,196 @@
+# =========================================================
+# THIS FILE CONTAINS THE FOLLOWING FUNCTIONS:
+# 1. refresh_mtf_daily
+# =========================================================
+# equity_mtf_daily is the aligned view every scanner used to re-derive:
+# one row per symbol and final trading day with
+#   close, daily MTF_COLUMNS            (equity_indicators + price, 1d)
+#   prev_<column>                       (previous trading day, LAG)
+#   w_<column> / m_<column>             (week / month in force that day,
+#                                        through equity_timeframe_map,
+#                                        partial candles included)
+#   close_<n>d                          (close n trading days ahead, LEAD)
+# Columns come from create_db.mtf_daily_columns().
+#
+# Maintenance follows the price change log (consumer equity_mtf_daily),
+# but only up to the equity_indicators cursor, so a price change is picked
+# up once refresh_indicators has turned it into indicator rows. A change at
+# min_date rewrites the symbol's rows from min_date on, plus the
+# max(MTF_FORWARD_DAYS) rows before it whose forward closes move. When the
+# partial overlays have moved since the last run, rows on partial candles
+# (is_partial) and the days from each current partial candle on are
+# rewritten; with nothing logged and no partial move a run writes nothing.
+# refresh_indicators runs it after every equity refresh, with rebuild=True
+# after writes the log does not carry (full rebuilds, columns= backfills);
+# the scanners' read paths run it again as a cheap up-to-date check.
+# =========================================================
+import time
+import traceback
+from helper import (
+    log,
+    MTF_FORWARD_DAYS,
+    TIMEFRAME_MAP_SYMBOLS
+)
+from create_db import (
+    create_derived_tables,
+    mtf_daily_columns
+)
+from change_log import (
+    read_price_changes,
+    advance_change_cursor,
+    compact_price_changes,
+    overlay_digest,
+    overlay_unchanged,
+    save_overlay_digest
+)
+from timeframe_map import refresh_timeframe_map
+
+MTF_CONSUMER = "equity_mtf_daily"
+# refresh_indicators' consumer name in the change log
+INDICATOR_CONSUMER = "equity_indicators"
+
+# =========================================================
+# _mtf_insert_sql Function
+# One INSERT ... SELECT for a batch in temp.mtf_bounds (id, warm, since):
+# daily rows are read from `warm` so LAG / LEAD see their neighbours, and
+# written from `since`. Weekly / monthly values are index seeks on the
+# final row of the mapped date, else the overlay row.
+# =========================================================
+def _mtf_insert_sql():
+    columns = mtf_daily_columns()
+    inner, outer = [], []
+    for column, (source, expr) in columns.items():
+        if source == "1d":
+            inner.append(f"{expr} AS {column}")
+            outer.append(f"d.{column}")
+        elif source == "lag":
+            inner.append(f"LAG({columns[expr][1]}) OVER w AS {column}")
+            outer.append(f"d.{column}")
+        elif source == "lead":
+            base, days = expr
+            inner.append(f"LEAD({columns[base][1]}, {days}) OVER w AS {column}")
+            outer.append(f"d.{column}")
+        else:
+            final, partial = ("wf", "wp") if source == "1wk" else ("mf", "mp")
+            outer.append(
+                f"CASE WHEN {final}.symbol_id IS NOT NULL THEN {final}.{expr} ELSE {partial}.{expr} END"
+            )
+
+    return f"""
+        INSERT INTO equity_mtf_daily (date, symbol_id, {", ".join(columns)}, is_partial)
+        SELECT d.date, d.symbol_id, {", ".join(outer)}, tm.is_partial
+        FROM (
+            SELECT i.symbol_id, i.date, b.since, {", ".join(inner)}
+            FROM temp.mtf_bounds b
+            CROSS JOIN equity_indicators i
+              ON i.symbol_id = b.id AND i.timeframe = '1d' AND i.date >= b.warm
+            JOIN equity_price_data p
+              ON p.symbol_id = i.symbol_id AND p.timeframe = i.timeframe AND p.date = i.date
+            WINDOW w AS (PARTITION BY i.symbol_id ORDER BY i.date)
+        ) d
+        JOIN equity_timeframe_map tm
+          ON tm.symbol_id = d.symbol_id AND tm.date = d.date
+        LEFT JOIN equity_indicators wf
+          ON wf.symbol_id = d.symbol_id AND wf.timeframe = '1wk' AND wf.date = tm.weekly_date
+        LEFT JOIN equity_indicator_partial wp
+          ON wp.symbol_id = d.symbol_id AND wp.timeframe = '1wk' AND wp.date = tm.weekly_date
+        LEFT JOIN equity_indicators mf
+          ON mf.symbol_id = d.symbol_id AND mf.timeframe = '1mo' AND mf.date = tm.monthly_date
+        LEFT JOIN equity_indicator_partial mp
+          ON mp.symbol_id = d.symbol_id AND mp.timeframe = '1mo' AND mp.date = tm.monthly_date
+        WHERE d.date >= d.since
+    """
+
+# =========================================================
+# _mtf_bounds Function
+# (id, warm, since) for a symbol whose rows change from `cutoff` on: rows
+# are rewritten from the max(MTF_FORWARD_DAYS)-th trading day before the
+# cutoff and read from one day earlier for LAG. '' = start of history.
+# =========================================================
+def _mtf_bounds(conn, symbol_id, cutoff):
+    if not cutoff:
+        return symbol_id, "", ""
+    back = max(MTF_FORWARD_DAYS, default=0)
+    dates = [row[0] for row in conn.execute("""
+        SELECT date FROM equity_indicators
+        WHERE symbol_id = ? AND timeframe = '1d' AND date < ?
+        ORDER BY date DESC LIMIT ?
+    """, (symbol_id, cutoff, back + 1))]
+    if len(dates) < back:
+        return symbol_id, "", ""
+    since = dates[back - 1] if back else cutoff
+    warm = dates[back] if len(dates) > back else ""
+    return symbol_id, warm, since
+
+# =========================================================
+# refresh_mtf_daily Function
+# Brings the timeframe map and equity_mtf_daily up to date. Symbols whose
+# indicators changed since the last run (change log, up to the indicator
+# stage's cursor) and symbols with partial candles are rewritten from the
+# earliest affected day. The first run, or rebuild=True, writes it all.
+# =========================================================
+def refresh_mtf_daily(conn, rebuild=False):
+    refresh_timeframe_map(conn)
+
+    cur = conn.cursor()
+    try:
+        start = time.time()
+        create_derived_tables(cur)
+        conn.commit()
+        change_seq, changes = read_price_changes(conn, False, MTF_CONSUMER, upstream=INDICATOR_CONSUMER)
+        partials = overlay_digest(conn, ("equity_price_partial", "equity_indicator_partial"))
+        moved = not overlay_unchanged(conn, MTF_CONSUMER, partials)
+        if not rebuild and changes == {} and not moved:
+            # nothing logged and the partial candles are as last mapped: no writes
+            print(f"✅ equity_mtf_daily | up to date | {time.time()-start:.1f}s")
+            return
+
+        if rebuild or changes is None:
+            print("🧹 Rebuilding equity_mtf_daily from full history...")
+            cur.execute("DELETE FROM equity_mtf_daily")
+            cutoffs = {row[0]: "" for row in cur.execute("SELECT symbol_id FROM equity_symbols")}
+        else:
+            # earliest affected daily date per symbol
+            cutoffs = {}
+            sources = [
+                (symbol_id, min_date)
+                for timeframe_changes in changes.values()
+                for symbol_id, min_date in timeframe_changes.items()
+            ]
+            if moved:
+                for overlay in ("equity_price_partial", "equity_indicator_partial"):
+                    sources += cur.execute(f"""
+                        SELECT symbol_id, MIN(date) FROM {overlay} GROUP BY symbol_id
+                    """).fetchall()
+                sources += cur.execute("""
+                    SELECT symbol_id, MIN(date) FROM equity_mtf_daily
+                    WHERE is_partial = 1 GROUP BY symbol_id
+                """).fetchall()
+            for symbol_id, since in sources:
+                cutoffs[symbol_id] = min(cutoffs.get(symbol_id, since), since)
+
+        insert_sql = _mtf_insert_sql()
+        symbol_ids = sorted(cutoffs)
+        written = 0
+        for i in range(0, len(symbol_ids), TIMEFRAME_MAP_SYMBOLS):
+            bounds = [_mtf_bounds(conn, symbol_id, cutoffs[symbol_id])
+                      for symbol_id in symbol_ids[i:i + TIMEFRAME_MAP_SYMBOLS]]
+            conn.execute("DROP TABLE IF EXISTS temp.mtf_bounds")
+            conn.execute("CREATE TEMP TABLE mtf_bounds (id INTEGER PRIMARY KEY, warm TEXT, since TEXT)")
+            conn.executemany("INSERT INTO temp.mtf_bounds (id, warm, since) VALUES (?, ?, ?)", bounds)
+            conn.executemany("""
+                DELETE FROM equity_mtf_daily WHERE symbol_id = ? AND date >= ?
+            """, [(symbol_id, since) for symbol_id, _, since in bounds])
+            written += conn.execute(insert_sql).rowcount
+            conn.commit()
+
+        advance_change_cursor(conn, False, MTF_CONSUMER, change_seq)
+        save_overlay_digest(conn, MTF_CONSUMER, partials)
+        compact_price_changes(conn, False)
+        conn.commit()
+        print(f"✅ equity_mtf_daily | {len(symbol_ids)} symbols | {written} rows written | {time.time()-start:.1f}s")
+
+    except Exception as e:
+        conn.rollback()
+        log(f"MTF DAILY REFRESH FAILED | {e}")
+        traceback.print_exc()
@@ -0,0 +1,97 @@
+# =========================================================
+# THIS FILE CONTAINS THE FOLLOWING FUNCTIONS:
+# 1. date_partitions
+# 2. parallel_scan_chunks
+# =========================================================
+# Parallel execution of the scanner queries (sql.SQL_MAP,
+# scanner_spec.compile_batch_sql) over a process pool.
+#
+# The :start / :end range is split into contiguous, disjoint date
+# partitions and each worker runs the unchanged query for one partition on
+# its own read-only connection (readers do not block each other or the
+# writer in WAL mode). No warm-up overlap is needed: equity_mtf_daily
+# already stores the previous-day (prev_*) and forward (close_<n>d)
+# columns on every row, so a row's result does not depend on the rows
+# around it. Every query orders by date first, so the partition results,
+# taken in date order (reversed for ORDER BY d.date DESC), are exactly the
+# rows and order of the single query.
+# =========================================================
+import time
+import sqlite3
+from datetime import date, timedelta
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from helper import SCANNER_WORKERS
+
+# =========================================================
+# date_partitions Function
+# [(start, end)] of up to `partitions` contiguous date ranges of equal
+# length covering start..end, clipped to the dates in equity_mtf_daily
+# (two index seeks). Empty when no date is in range.
+# =========================================================
+def date_partitions(conn, start, end, partitions):
+    first, last = conn.execute("SELECT MIN(date), MAX(date) FROM equity_mtf_daily").fetchone()
+    if first is None:
+        return []
+    first, last = max(str(first), start), min(str(last), end)
+    if first > last:
+        return []
+    first, last = date.fromisoformat(first[:10]), date.fromisoformat(last[:10])
+    span = (last - first).days + 1
+    count = max(min(partitions, span), 1)
+    bounds = [first + timedelta(days=span * i // count) for i in range(count + 1)]
+    return [(bounds[i].isoformat(), (bounds[i + 1] - timedelta(days=1)).isoformat()) for i in range(count)]
+
+# =========================================================
+# _scan_partition Function
+# Process-pool worker: runs the query for one partition on a read-only
+# connection and returns (columns, rows).
+# =========================================================
+def _scan_partition(db_path, sql, params):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=30)
+    try:
+        cur = conn.execute(sql, params)
+        return [desc[0] for desc in cur.description], cur.fetchall()
+    finally:
+        conn.close()
+
+# =========================================================
+# parallel_scan_chunks Function
+# Runs a scanner query (:start / :end / :forward params, ORDER BY date
+# first) over `workers` processes and yields one DataFrame per partition
+# in result order (at least one, possibly empty); a range of one
+# partition runs on conn without a pool. ascending=False for
+# ORDER BY d.date DESC. equity_mtf_daily must be refreshed and committed
+# first: the workers read the database file.
+# =========================================================
+def parallel_scan_chunks(conn, sql, params, ascending=True, workers=SCANNER_WORKERS):
+    begin = time.time()
+    db_path = conn.execute("PRAGMA database_list").fetchone()[2]
+    # several partitions per worker evens out busy and quiet periods
+    partitions = date_partitions(conn, params["start"], params["end"], workers * 4)
+    if len(partitions) <= 1:
+        # one day / one partition: no pool, the query runs on conn
+        cur = conn.execute(sql, params)
+        yield pd.DataFrame.from_records(cur.fetchall(), columns=[desc[0] for desc in cur.description])
+        return
+    if not ascending:
+        partitions.reverse()
+
+    rows = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_scan_partition, db_path, sql, {**params, "start": lo, "end": hi})
+            for lo, hi in partitions
+        ]
+        try:
+            # in partition order: later partitions keep running while earlier ones are consumed
+            for future in futures:
+                columns, found = future.result()
+                rows += len(found)
+                yield pd.DataFrame.from_records(found, columns=columns)
+        finally:
+            for future in futures:
+                future.cancel()
+
+    print(f"✅ Parallel scan | {len(partitions)} partitions | {workers} workers | "
+          f"{rows} rows | {time.time()-begin:.1f}s")
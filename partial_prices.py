@@ -0,0 +1,253 @@
+# =========================================================
+# THIS FILE CONTAINS THE FOLLOWING FUNCTIONS:
+# 1. period_start
+# 2. load_daily_bars
+# 3. partial_candles
+# 4. refresh_partial_prices
+# =========================================================
+# One as-of partial candle engine for weekly and monthly periods.
+# A partial candle as of date D covers the daily bars of D's period up to
+# and including D (NSE weeks start Monday like the 1wk bars, months start
+# on the 1st like the 1mo bars) and is stamped with date D:
+#   open = first open, high = max high, low = min low,
+#   close / adj_close = last, volume = sum
+# A single as-of date (the live snapshot) is aggregated set-based in SQL:
+# one statement, the symbol table as the outer loop of a CROSS JOIN (one
+# index seek per symbol and period), ROW_NUMBER ranks for the first open
+# and the last close. refresh_partial_prices runs it as INSERT ... SELECT,
+# so no daily row reaches Python.
+# A range of as-of dates (historical partial snapshots for backtests) is
+# bucketed and accumulated vectorized over the daily bars in one pass.
+# Live partial candles are stored in the equity_price_partial /
+# index_price_partial overlays, never in the price tables.
+# =========================================================
+import time
+import traceback
+import numpy as np
+import pandas as pd
+from helper import (
+    log
+)
+from create_db import create_derived_tables
+
+PARTIAL_TIMEFRAMES = ("1wk", "1mo")
+
+# =========================================================
+# period_start Function
+# First calendar day of the 1wk (Monday) / 1mo period of each date.
+# `dates` is array-like of ISO strings or datetime64; returns datetime64[D].
+# =========================================================
+def period_start(dates, timeframe):
+    days = np.asarray(dates, dtype="datetime64[D]")
+    if timeframe == "1wk":
+        # 1970-01-01 was a Thursday: (days + 3) % 7 is the weekday, Monday = 0
+        return days - (days.astype(np.int64) + 3) % 7
+    if timeframe == "1mo":
+        return days.astype("datetime64[M]").astype("datetime64[D]")
+    raise ValueError(f"No partial period for timeframe {timeframe}")
+
+# =========================================================
+# load_daily_bars Function
+# Final daily bars between start and end (inclusive) for every symbol in
+# one ordered scan, one index seek per symbol. Index tables carry no
+# volume (NaN) and have no partial rows.
+# =========================================================
+def load_daily_bars(conn, is_indexs, start, end):
+    table_symbols = "index_symbols"    if is_indexs else "equity_symbols"
+    price_table   = "index_price_data" if is_indexs else "equity_price_data"
+    col_id        = "index_id"         if is_indexs else "symbol_id"
+    volume        = "NULL"             if is_indexs else "p.volume"
+    final_only    = ""                 if is_indexs else "AND p.is_final=1"
+
+    df = pd.read_sql(f"""
+        SELECT sym.{col_id} AS {col_id}, p.date, p.open, p.high, p.low, p.close, p.adj_close,
+               {volume} AS volume
+        FROM {table_symbols} sym
+        CROSS JOIN {price_table} p
+          ON p.{col_id} = sym.{col_id} AND p.timeframe = '1d' AND p.date BETWEEN ? AND ?
+        WHERE 1=1 {final_only}
+        ORDER BY sym.{col_id}, p.date
+    """, conn, params=(str(start), str(end)))
+    value_columns = ["open", "high", "low", "close", "adj_close", "volume"]
+    df[value_columns] = df[value_columns].astype(float)
+    return df
+
+# =========================================================
+# _snapshot_sql Function
+# SELECT of the partial candles as of :as_of, one row per id and
+# timeframe; :since_<timeframe> is the start of each as-of period. Same
+# aggregation as the vectorized pass: open = first non-NULL open, NULL
+# high / low / volume are skipped, close / adj_close are the last bar's.
+# =========================================================
+def _snapshot_sql(is_indexs, timeframes):
+    table_symbols = "index_symbols"    if is_indexs else "equity_symbols"
+    price_table   = "index_price_data" if is_indexs else "equity_price_data"
+    col_id        = "index_id"         if is_indexs else "symbol_id"
+    volume        = "NULL"             if is_indexs else "p.volume"
+    final_only    = ""                 if is_indexs else "AND p.is_final=1"
+    periods = ", ".join(f"('{timeframe}', :since_{timeframe})" for timeframe in timeframes)
+
+    return f"""
+        WITH periods(timeframe, since) AS (
+            VALUES {periods}
+        ),
+        daily AS (
+            SELECT pr.timeframe, p.{col_id} AS id, p.open, p.high, p.low, p.close, p.adj_close,
+                   {volume} AS volume,
+                   ROW_NUMBER() OVER (PARTITION BY pr.timeframe, p.{col_id} ORDER BY p.open IS NULL, p.date) AS first_rank,
+                   ROW_NUMBER() OVER (PARTITION BY pr.timeframe, p.{col_id} ORDER BY p.date DESC)            AS last_rank
+            FROM periods pr
+            CROSS JOIN {table_symbols} s
+            CROSS JOIN {price_table} p
+              ON p.{col_id} = s.{col_id} AND p.timeframe = '1d' AND p.date BETWEEN pr.since AND :as_of
+            WHERE 1=1 {final_only}
+        )
+        SELECT id AS {col_id}, timeframe, :as_of AS date,
+               MAX(CASE WHEN first_rank = 1 THEN open END)     AS open,
+               MAX(high)                                       AS high,
+               MIN(low)                                        AS low,
+               MAX(CASE WHEN last_rank = 1 THEN close END)     AS close,
+               MAX(CASE WHEN last_rank = 1 THEN adj_close END) AS adj_close,
+               SUM(volume)                                     AS volume
+        FROM daily
+        GROUP BY id, timeframe
+    """
+
+def _snapshot_params(as_of, timeframes):
+    params = {f"since_{timeframe}": str(period_start([as_of], timeframe)[0]) for timeframe in timeframes}
+    params["as_of"] = str(np.datetime64(as_of, "D"))
+    return params
+
+def _latest_daily(conn, is_indexs):
+    price_table = "index_price_data" if is_indexs else "equity_price_data"
+    final_only  = ""                 if is_indexs else "AND is_final=1"
+    return conn.execute(f"""
+        SELECT MAX(date) FROM {price_table} WHERE timeframe='1d' {final_only}
+    """).fetchone()[0]
+
+# =========================================================
+# partial_candles Function
+# Partial 1wk / 1mo candles as of `as_of` (None = latest final daily date)
+# for every symbol with bars in the as-of period. With as_of_end, one
+# candle per symbol, timeframe and trading day in [as_of, as_of_end].
+# Returns a DataFrame: id, timeframe, date (as-of), open, high, low, close,
+# adj_close, volume.
+# =========================================================
+def partial_candles(conn, as_of=None, timeframes=PARTIAL_TIMEFRAMES, is_indexs=False, as_of_end=None):
+    col_id  = "index_id" if is_indexs else "symbol_id"
+    columns = [col_id, "timeframe", "date", "open", "high", "low", "close", "adj_close", "volume"]
+
+    if as_of is None:
+        as_of = _latest_daily(conn, is_indexs)
+        if as_of is None:
+            return pd.DataFrame(columns=columns)
+    if as_of_end is None or as_of_end == as_of:
+        # --- Live snapshot: one set-based statement ---
+        candles = pd.read_sql(_snapshot_sql(is_indexs, timeframes), conn,
+                              params=_snapshot_params(as_of, timeframes))
+        candles[columns[3:]] = candles[columns[3:]].astype(float)
+        return candles.sort_values([col_id, "timeframe", "date"]).reset_index(drop=True)
+
+    # --- One scan from the earliest period start any as-of date needs ---
+    first = min(period_start([as_of], tf)[0] for tf in timeframes)
+    daily = load_daily_bars(conn, is_indexs, first, as_of_end)
+    if daily.empty:
+        return pd.DataFrame(columns=columns)
+    dates = daily["date"].to_numpy(dtype="datetime64[D]")
+
+    # --- As-of dates: the trading days of the range ---
+    as_of_dates = np.unique(dates[dates >= np.datetime64(as_of, "D")])
+    ids = daily[col_id].unique()
+
+    candles = []
+    for timeframe in timeframes:
+        # --- Running candle of every daily bar within its (symbol, period) ---
+        period = period_start(dates, timeframe)
+        groups = daily.groupby([daily[col_id], period], sort=False)
+        # first non-NaN open so far (transform("first") would look ahead in the period)
+        opened = daily["open"].notna().groupby([daily[col_id], period], sort=False).cumsum()
+        running = pd.DataFrame({
+            col_id: daily[col_id],
+            "period": period,
+            "date": dates,
+            "open": daily["open"].where(opened.eq(1) & daily["open"].notna()),
+            "high": groups["high"].cummax(),
+            "low": groups["low"].cummin(),
+            "close": daily["close"],
+            "adj_close": daily["adj_close"],
+            "volume": groups["volume"].cumsum(),
+        })
+        # NaN bars don't reset the running open / high / low / volume (like SQL MAX/MIN/SUM)
+        running[["open", "high", "low", "volume"]] = (
+            running[["open", "high", "low", "volume"]].groupby([running[col_id], running["period"]]).ffill()
+        )
+
+        # --- Each (symbol, as-of date) takes the last running candle on or before it ---
+        wanted = pd.DataFrame({
+            col_id: np.repeat(ids, len(as_of_dates)),
+            "as_of": np.tile(as_of_dates, len(ids)),
+        })
+        wanted["as_of_period"] = period_start(wanted["as_of"].to_numpy(), timeframe)
+        matched = pd.merge_asof(
+            wanted.sort_values("as_of"), running.sort_values("date"),
+            left_on="as_of", right_on="date", by=col_id, direction="backward",
+        )
+        # ...but only if that bar belongs to the as-of period
+        matched = matched[matched["period"] == matched["as_of_period"]]
+
+        matched = matched.assign(timeframe=timeframe, date=matched["as_of"].dt.strftime("%Y-%m-%d"))
+        candles.append(matched[columns])
+
+    result = pd.concat(candles, ignore_index=True)
+    return result.sort_values([col_id, "timeframe", "date"]).reset_index(drop=True)
+
+# =========================================================
+# refresh_partial_prices Function
+# Rewrites the *_price_partial overlay with the 1wk / 1mo candles as of
+# `as_of` (None = latest final daily date), one row per id and timeframe,
+# in one DELETE + INSERT ... SELECT transaction; the price table itself is
+# not touched. Read final + partial through *_price_all, where a final
+# candle under the same date wins.
+# =========================================================
+def refresh_partial_prices(conn, as_of=None, timeframes=PARTIAL_TIMEFRAMES, is_indexs=False):
+    overlay = "index_price_partial" if is_indexs else "equity_price_partial"
+    col_id  = "index_id"            if is_indexs else "symbol_id"
+    volume  = ""                    if is_indexs else ", volume"
+    label   = "index"               if is_indexs else "equity"
+
+    cur = conn.cursor()
+    try:
+        start = time.time()
+        create_derived_tables(cur)
+        as_of = as_of or _latest_daily(conn, is_indexs)
+        print(f"📅 Partial {label} candle date: {as_of}")
+
+        # --------------------------------------------------------
+        # Overlay holds only the current snapshot: a few thousand rows
+        # --------------------------------------------------------
+        print("🧹 Clearing previous partial candles...")
+        cur.execute(f"""
+            DELETE FROM {overlay}
+            WHERE timeframe IN ({",".join("?" * len(timeframes))})
+        """, tuple(timeframes))
+
+        if as_of is not None and timeframes:
+            cur.execute(f"""
+                INSERT INTO {overlay}
+                ({col_id}, timeframe, date, open, high, low, close, adj_close{volume})
+                SELECT {col_id}, timeframe, date, open, high, low, close, adj_close{volume}
+                FROM ({_snapshot_sql(is_indexs, timeframes)})
+            """, _snapshot_params(as_of, timeframes))
+        conn.commit()
+
+        for timeframe, count in cur.execute(f"""
+            SELECT timeframe, COUNT(*) FROM {overlay} GROUP BY timeframe
+        """).fetchall():
+            if timeframe in timeframes:
+                print(f"💾 Partial {timeframe} candles: {count}")
+        print(f"🎉 Partial {label} price update COMPLETE – one partial candle per symbol! ({time.time()-start:.1f}s)")
+
+    except Exception as e:
+        conn.rollback()
+        log(f"REFRESH PARTIAL PRICES FAILED | {label} | {e}")
+        traceback.print_exc()
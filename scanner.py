@@ -1,7 +1,10 @@
 
 from helper import (
     log, LOG_FILE,
-    SCANNER_FOLDER
+    SCANNER_FOLDER,
+    SCANNER_FETCH_ROWS,
+    SCANNER_OUTPUT_FORMAT,
+    SCANNER_WORKERS
 )
 from data_manager import (
     get_db_connection,
@@ -16,76 +19,263 @@ from rich.table import Table
 from rich.panel import Panel
 from rich.text import Text
 from sql import (
-    SQL_MAP
+    SQL_MAP,
+    SCANNERS
 )
+from mtf_daily import refresh_mtf_daily
+from vector_scanner import (
+    scan_vectorized,
+    scan_vectorized_batch,
+    split_scanner_hits,
+    scan_params
+)
+from scanner_spec import compile_batch_sql
+from scanner_cache import (
+    data_version,
+    scan_cache_key,
+    load_cached_scan,
+    save_cached_scan,
+    iter_cached_scan,
+    tee_cached_scan
+)
+from scanner_stream import (
+    write_scan_chunks,
+    preview_rows,
+    format_value
+)
+from backtest_stats import backtest_report
+from parallel_scanner import parallel_scan_chunks
 
 console = Console()
 
-def export_to_csv(df, filename_prefix):
-    try:
-        ts = datetime.now().strftime("%d%b%Y")
-        filename = f"Scanner_{filename_prefix}_{ts}.csv"
-        filepath = os.path.join(SCANNER_FOLDER, filename)
-        df.to_csv(filepath, index=False)
-        return filepath
-    except Exception as e:
-        log(f"I❌ CSV Failed | {e}")
-        traceback.print_exc()
+def scan_output_path(filename_prefix, fmt=SCANNER_OUTPUT_FORMAT):
+    ts = datetime.now().strftime("%d%b%Y")
+    filename = f"Scanner_{filename_prefix}_{ts}.{fmt}"
+    return os.path.join(SCANNER_FOLDER, filename)
 
 def create_scanner_menu():
     console = Console()
 
     menu = Text()
-    
-    menu.append("1. ", style="bold cyan")
-    menu.append("SCANNER 1\n", style="bold yellow")
-    menu.append("   ▸ DAILY rsi(9)/ DAILY ema(rsi(9),3) greater than 1.1\n")
-    menu.append("   ▸ DAILY ema(rsi(9),3)/ DAILY wma(rsi(9),21) greater than 1.1\n")
-    menu.append("   ▸ DAILY rsi(3) crossed over 60\n")
-    menu.append("   ▸ MONTHLY rsi(3) greater than 50\n")
-    menu.append("   ▸ WEEKLY rsi(3) greater than 50\n")
-    menu.append("   ▸ DAILY PRICE CHANGE is less than equal to 5\n")
-    menu.append("   ▸ DAILY CLOSE >= 100\n\n")
-
-    menu.append("2. ", style="bold cyan")
-    menu.append("SCANNER 2\n", style="bold yellow")
-    menu.append("   ▸ DAILY CLOSE >= 100\n")
-    menu.append("   ▸ MONTHLY rsi(3) > 60\n")
-    menu.append("   ▸ WEEKLY rsi(3) > 60\n")
-    menu.append("   ▸ DAILY rsi(3) crossed above 55 (yesterday < 55, today >= 55\n")
-    menu.append("   ▸ DAILY rsi(9) >= daily ema(rsi(9),3)\n")
-    menu.append("   ▸ DAILY ema(rsi(9),3) >= daily wma(rsi(9),21)\n")
-    menu.append("   ▸ DAILY rsi(9) / ema(rsi(9),3) >= 1.2\n")
-    menu.append("   ▸ WEEKLY rsi(9) >= WEEKLY ema(rsi(9),3)\n")
-    menu.append("   ▸ WEEKLY ema(rsi(9),3) >= WEEKLY wma(rsi(9),21)\n")
-    menu.append("   ▸ Daily percentage change less than 10%\n\n")
-    
+
+    # criteria lines are generated from scanner_specs.json
+    for scanner_id, spec in SCANNERS.items():
+        menu.append(f"{scanner_id}. ", style="bold cyan")
+        menu.append(f"{spec['name']}\n", style="bold yellow")
+        for line in spec["menu"]:
+            menu.append(f"   ▸ {line}\n")
+        menu.append("\n")
+
     console.print(Panel(menu, title="[bold]SCANNER[/bold]", border_style="blue"))
             
-def scanner(conn,choice):
-    try:
-        cur = conn.cursor()
-        sql = SQL_MAP.get(int(choice))
+# ---------------------------------------------
+# Scan modes
+#   backtest -> full history, only signals with 5d / 10d forward returns
+#   latest   -> the last trading session only (pre-open signal run)
+#   range    -> signals between start and end (inclusive, None = open)
+# Engines
+#   sql      -> SQL_MAP over equity_mtf_daily (refreshed first)
+#   vector   -> vector_scanner, in-memory masks over the indicator tables
+# Each mode resolves to the query params in vector_scanner.scan_params.
+# Results are cached (scanner_cache) until the data version changes;
+# use_cache=False always recomputes.
+# ---------------------------------------------
+SCAN_ENGINES = ("sql", "vector")
 
-        print(f"✅ Scanner Started (SQL_SCANNER_{choice})")
-        cur.execute(sql)
+# ---------------------------------------------
+# Result chunks of one scanner run: cursor.fetchmany for sql (one chunk
+# per date partition with workers > 1), slices of the (matches only)
+# result for vector. At least one chunk, so the columns are known even
+# without matches.
+# ---------------------------------------------
+def _scan_chunks(conn, choice, mode, start, end, engine, fetch_rows, workers):
+    if engine == "vector":
+        params = scan_params(conn, mode, start, end, engine)
+        print(f"✅ Scanner Started (vector {choice}, {mode} {params['start'] or '…'} → {params['end']})")
+        result = scan_vectorized(conn, choice, **params)
+        if result is None:
+            raise RuntimeError(f"vector scan {choice} failed")
+        for i in range(0, max(len(result), 1), fetch_rows):
+            yield result.iloc[i:i + fetch_rows]
+        return
 
-        # DEFINE COLUMNS HERE
-        columns = [desc[0] for desc in cur.description]
-        
-        rows = cur.fetchall()
-        results = []
+    # aligned daily / weekly / monthly table the scanners read
+    refresh_mtf_daily(conn)
+    params = scan_params(conn, mode, start, end)
+    print(f"✅ Scanner Started ({SCANNERS[choice]['name']}, {mode} {params['start'] or '…'} → {params['end']})")
 
-        for row in rows:
-            row = dict(zip(columns, row))
-            results.append(row)
-            
+    if workers > 1:
+        yield from parallel_scan_chunks(conn, SQL_MAP[choice], params, SCANNERS[choice]["ascending"], workers)
+        return
+
+    cur = conn.cursor()
+    cur.execute(SQL_MAP[choice], params)
+    columns = [desc[0] for desc in cur.description]
+    while True:
+        rows = cur.fetchmany(fetch_rows)
+        yield pd.DataFrame.from_records(rows, columns=columns)
+        if len(rows) < fetch_rows:
+            break
+
+# ---------------------------------------------
+# Streams one scanner's results as DataFrame chunks: from the result cache
+# while the data version is unchanged, else from the scan (filling the
+# cache on the way). use_cache=False always recomputes. workers > 1 runs
+# the sql engine over date partitions in a process pool (parallel_scanner).
+# ---------------------------------------------
+def iter_scan_chunks(conn, choice, mode="backtest", start=None, end=None, engine="sql",
+                     use_cache=True, fetch_rows=SCANNER_FETCH_ROWS, workers=1):
+    choice = int(choice)
+    if not use_cache:
+        return _scan_chunks(conn, choice, mode, start, end, engine, fetch_rows, workers)
+
+    key, version = scan_cache_key(choice, mode, start, end, engine), data_version(conn)
+    cached = iter_cached_scan(key, version, fetch_rows)
+    if cached is not None:
+        print(f"⚡ Scanner {choice} served from cache")
+        return cached
+    return tee_cached_scan(conn, key, version, _scan_chunks(conn, choice, mode, start, end, engine, fetch_rows, workers))
+
+# ---------------------------------------------
+# Runs one scanner and writes its results to path (.csv / .parquet) chunk
+# by chunk. Returns the running aggregates (scanner_stream.new_scan_stats).
+# ---------------------------------------------
+def stream_scanner(conn, choice, path, mode="backtest", start=None, end=None, engine="sql", use_cache=True, workers=1):
+    try:
+        chunks = iter_scan_chunks(conn, choice, mode, start, end, engine, use_cache, workers=workers)
+        stats = write_scan_chunks(chunks, path)
+        print(f"✅ Scanner finished | Matches: {stats['matches']}")
+        return stats
+    except Exception as e:
+        log(f"I❌ Scanner failed | {e}")
+        traceback.print_exc()
+
+# ---------------------------------------------
+# Runs one scanner and returns all matches as a list of dicts.
+# ---------------------------------------------
+def scanner(conn, choice, mode="backtest", start=None, end=None, engine="sql", use_cache=True, workers=1):
+    try:
+        results = []
+        for chunk in iter_scan_chunks(conn, choice, mode, start, end, engine, use_cache, workers=workers):
+            results.extend(chunk.to_dict("records"))
         print(f"✅ Scanner finished | Matches: {len(results)}")
         return results
     except Exception as e:
         log(f"I❌ Scanner failed | {e}")
         traceback.print_exc()
-        
+
+# ---------------------------------------------
+# Print one scanner's win rates / max loss and the latest signals from
+# its running aggregates (scanner_stream)
+# ---------------------------------------------
+def show_scanner_results(choice, stats, path):
+    if not stats["matches"]:
+        console.print("[bold yellow]No backtest matches found.[/bold yellow]")
+        return
+
+    console.print(f"[bold cyan]📁 Backtest data exported to:[/bold cyan] {path}")
+
+    # Win definitions (latest / range signals may have no forward return yet)
+    for column, agg in stats["returns"].items():
+        win_rate = agg["wins"] / agg["count"] * 100 if agg["count"] else None
+        print(f"📈 Win Rate ({column[4:].upper()}):  {format_value(win_rate)}%")
+    for column, agg in stats["returns"].items():
+        print(f"❌ Max Loss ({column[4:].upper()}):  {format_value(agg['max_loss'])}%")
+
+    console.print(f"[bold green]Backtest Matches: {stats['matches']}[/bold green]")
+
+    table = Table(
+        title=f"Scanner_{choice} Backtest Results",
+        show_lines=True,
+        header_style="bold cyan"
+    )
+
+    returns = list(stats["returns"])
+    for col in ["symbol", "date"] + returns:
+        table.add_column(col.upper())
+
+    # Show last N signals only
+    for row in preview_rows(stats):
+        table.add_row(*row)
+
+    console.print(table)
+
+def _stats_table(title, stats):
+    table = Table(title=title, show_lines=True, header_style="bold cyan")
+    names = list(stats.index.names)
+    for col in names + list(stats.columns):
+        table.add_column(col.upper())
+    for index, row in stats.iterrows():
+        index = index if isinstance(index, tuple) else (index,)
+        table.add_row(
+            *(f"{value}D" if name == "horizon" else str(value) for name, value in zip(names, index)),
+            *(format_value(value, 0 if col == "trades" else 2) for col, value in row.items()),
+        )
+    console.print(table)
+
+# ---------------------------------------------
+# Backtest statistics (backtest_stats, BACKTEST_HORIZONS) of the signals
+# in one scanner's output file: overall, per year and per sector
+# ---------------------------------------------
+def show_backtest_report(conn, choice, path):
+    columns = ["symbol", "date"]
+    signals = pd.read_parquet(path, columns=columns) if path.endswith(".parquet") else pd.read_csv(path, usecols=columns)
+    report = backtest_report(conn, signals)
+    if report is None or report["overall"].empty:
+        return
+    _stats_table(f"Scanner_{choice} Backtest Statistics (%)", report["overall"])
+    _stats_table(f"Scanner_{choice} By Year", report["year"])
+    _stats_table(f"Scanner_{choice} By Sector", report["sector"])
+
+# ---------------------------------------------
+# Several scanners in one shared pass: one scan of equity_mtf_daily (sql)
+# (over date partitions in a process pool with workers > 1) or one load of
+# each symbol batch (vector), split per scanner. Returns {choice: matches}.
+# ---------------------------------------------
+def scanner_batch(conn, choices, mode="backtest", start=None, end=None, engine="sql", use_cache=True, workers=1):
+    try:
+        choices = [int(choice) for choice in choices]
+        matches = {}
+
+        # --- Cached scanners are served, the rest share one pass ---
+        if use_cache:
+            keys = {choice: scan_cache_key(choice, mode, start, end, engine) for choice in choices}
+            version = data_version(conn)
+            for choice in choices:
+                cached = load_cached_scan(keys[choice], version)
+                if cached is not None:
+                    print(f"⚡ Scanner {choice} served from cache | Matches: {len(cached)}")
+                    matches[choice] = cached.to_dict("records")
+        pending = [choice for choice in choices if choice not in matches]
+
+        if pending:
+            if engine == "vector":
+                params = scan_params(conn, mode, start, end, engine)
+                print(f"✅ Batch Scanner Started (vector {pending}, {mode} {params['start'] or '…'} → {params['end']})")
+                results = scan_vectorized_batch(conn, pending, **params)
+            else:
+                refresh_mtf_daily(conn)
+                params = scan_params(conn, mode, start, end)
+                print(f"✅ Batch Scanner Started (sql {pending}, {mode} {params['start'] or '…'} → {params['end']})")
+                batch_sql = compile_batch_sql({choice: SCANNERS[choice] for choice in pending})
+                if workers > 1:
+                    found = pd.concat(parallel_scan_chunks(conn, batch_sql, params, True, workers), ignore_index=True)
+                else:
+                    found = pd.read_sql(batch_sql, conn, params=params)
+                results = split_scanner_hits(found, pending)
+
+            print("✅ Batch Scanner finished | " + ", ".join(f"{choice}: {len(df)}" for choice, df in results.items()))
+            cacheable = use_cache and data_version(conn) == version
+            for choice, df in results.items():
+                if cacheable:
+                    save_cached_scan(keys[choice], version, df)
+                matches[choice] = df.to_dict("records")
+
+        return {choice: matches[choice] for choice in choices}
+    except Exception as e:
+        log(f"I❌ Batch Scanner failed | {e}")
+        traceback.print_exc()
+
 if __name__ == "__main__":
     try:
         with open(LOG_FILE, "w") as f:
@@ -96,7 +286,7 @@ if __name__ == "__main__":
             create_scanner_menu()
 
             try:
-                choice = input("Enter choice ('0', 'q', 'quit', 'exit' to exit): ").strip()
+                choice = input("Enter choice (e.g. 1, '1,2' or 'all'; '0', 'q', 'quit', 'exit' to exit): ").strip()
             except EOFError:
                 print("\nInput closed. Exiting.")
                 break
@@ -107,58 +297,40 @@ if __name__ == "__main__":
             # allow several ways to exit
             if choice in ("0", "q", "quit", "exit"):
                 break
+            # several scanners ("1,2" or "all") run in one shared pass
+            try:
+                choices = list(SCANNERS) if choice.lower() == "all" else [int(c) for c in choice.split(",") if c.strip()]
+            except ValueError:
+                choices = []
+            if not choices or any(c not in SCANNERS for c in choices):
+                console.print(f"[bold red]Unknown scanner choice: {choice}[/bold red]")
+                continue
+            mode = input("Mode: backtest / latest / range (Enter = backtest): ").strip().lower() or "backtest"
+            start = end = None
+            if mode == "range":
+                start = input("Start date (YYYY-MM-DD, Enter = open): ").strip() or None
+                end = input("End date (YYYY-MM-DD, Enter = open): ").strip() or None
+            engine = input("Engine: sql / vector (Enter = sql): ").strip().lower() or "sql"
+            # a latest run is one day: not worth a process pool
+            workers = 1 if mode == "latest" else SCANNER_WORKERS
+
             conn = get_db_connection()
-            matches = scanner(conn,choice)
             try:
-                if not matches:
-                    console.print("[bold yellow]No backtest matches found.[/bold yellow]")
+                if len(choices) == 1:
+                    # one scanner streams straight to its output file
+                    path = scan_output_path(choices[0])
+                    stats = stream_scanner(conn, choices[0], path, mode, start, end, engine, workers=workers)
+                    if stats is not None:
+                        show_scanner_results(choices[0], stats, path)
+                        if stats["matches"]:
+                            show_backtest_report(conn, choices[0], path)
                 else:
-                    df = pd.DataFrame(matches)
-
-                    # Optional: sort
-                    df.sort_values(["date", "symbol"], inplace=True)
-                    # ✅ EXPORT TO CSV
-                    csv_file = export_to_csv(df,choice)
-                    console.print(f"[bold cyan]📁 Backtest data exported to:[/bold cyan] {csv_file}")
-                    
-                    df = pd.DataFrame(matches)
-
-                    # Win definitions
-                    df["win_5d"] = df["ret_5d"] > 0
-                    df["win_10d"] = df["ret_10d"] > 0
-
-                    win_rate_5d = df["win_5d"].mean() * 100
-                    win_rate_10d = df["win_10d"].mean() * 100
-
-                    print(f"📈 Win Rate (5D):  {win_rate_5d:.2f}%")
-                    print(f"📈 Win Rate (10D): {win_rate_10d:.2f}%")
-                    max_loss_5d = df["ret_5d"].min()
-                    max_loss_10d = df["ret_10d"].min()
-
-                    print(f"❌ Max Loss (5D):  {max_loss_5d:.2f}%")
-                    print(f"❌ Max Loss (10D): {max_loss_10d:.2f}%")
-
-                    console.print(f"[bold green]Backtest Matches: {len(df)}[/bold green]")
-
-                    table = Table(
-                        title=f"Scanner_{choice} Backtest Results",
-                        show_lines=True,
-                        header_style="bold cyan"
-                    )
-
-                    for col in ["symbol", "date", "ret_5d", "ret_10d"]:
-                        table.add_column(col.upper())
-
-                    # Show last N signals only
-                    for _, row in df.head(10).iterrows():
-                        table.add_row(
-                            row["symbol"],
-                            str(row["date"]),
-                            f"{row['ret_5d']:.2f}",
-                            f"{row['ret_10d']:.2f}",
-                        )
-
-                    console.print(table)
+                    results = scanner_batch(conn, choices, mode, start, end, engine, workers=workers) or {}
+                    for choice, matches in results.items():
+                        path = scan_output_path(choice)
+                        show_scanner_results(choice, write_scan_chunks([pd.DataFrame(matches)], path), path)
+                        if matches:
+                            show_backtest_report(conn, choice, path)
             finally:
                 close_db_connection(conn)
 
@@ -0,0 +1,197 @@
+# =========================================================
+# THIS FILE CONTAINS THE FOLLOWING FUNCTIONS:
+# 1. data_version
+# 2. scan_cache_key
+# 3. load_cached_scan
+# 4. save_cached_scan
+# 5. iter_cached_scan
+# 6. tee_cached_scan
+# 7. clear_scanner_cache
+# =========================================================
+# Persistent scanner result cache: one Parquet file per (scanner, mode,
+# start, end) in SCANNER_CACHE_DIR, stamped with the data version it was
+# computed at. A scan is served from the file while the data version is
+# unchanged; any price download, indicator refresh or partial candle
+# refresh changes the version and the next run recomputes and overwrites.
+#
+# The data version hashes what the scanners are derived from, all cheap
+# lookups (no scans of the big tables):
+#   prices      -> newest equity_price_changes seq (every ingest batch and
+#                  final row update / delete appends one, see change_log)
+#   indicators  -> the equity_indicators stage's change log cursor, the
+#                  indicator state watermark (rows, last date) and the
+#                  indicator write generations (columns= backfills and
+#                  rebuilds change values without any price change)
+#   symbols     -> equity_symbols rows / max id
+#   partials    -> digest of the partial overlays (one row per symbol and
+#                  timeframe, rewritten intraday)
+# The key includes the compiled scanner SQL, so editing a spec misses, and
+# the engine: sql and vector results only agree to rounding.
+#
+# pyarrow is optional: without it nothing is cached.
+# =========================================================
+import os
+import json
+import hashlib
+from helper import (
+    log,
+    SCANNER_CACHE_DIR
+)
+from create_db import create_derived_tables
+from change_log import overlay_digest
+from indicator_state import indicator_generations
+from sql import SCANNERS
+from scanner_stream import result_schema
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# refresh_indicators' consumer name in the change log
+INDICATOR_CONSUMER = "equity_indicators"
+
+# =========================================================
+# data_version Function
+# Token identifying the state of the data the scanners read.
+# =========================================================
+def data_version(conn):
+    if not conn.execute("""
+        SELECT 1 FROM sqlite_master WHERE type='table' AND name='equity_indicator_generation'
+    """).fetchone():
+        create_derived_tables(conn.cursor())
+        conn.commit()
+    seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name='equity_price_changes'").fetchone()
+    cursor = conn.execute("""
+        SELECT last_seq FROM equity_price_change_cursors WHERE consumer=?
+    """, (INDICATOR_CONSUMER,)).fetchone()
+    version = [
+        seq[0] if seq else 0,
+        cursor[0] if cursor else None,
+        conn.execute("SELECT COUNT(*), MAX(last_date) FROM equity_indicator_state").fetchone(),
+        indicator_generations(conn, False),
+        conn.execute("SELECT COUNT(*), MAX(symbol_id) FROM equity_symbols").fetchone(),
+    ]
+    version.append(overlay_digest(conn, ("equity_price_partial", "equity_indicator_partial")))
+    return hashlib.sha1(json.dumps(version, default=str).encode()).hexdigest()
+
+# =========================================================
+# scan_cache_key Function
+# Cache key of one scanner run: the compiled query, the engine and the
+# unresolved mode / dates (a "latest" run follows the data version).
+# =========================================================
+def scan_cache_key(choice, mode="backtest", start=None, end=None, engine="sql"):
+    key = [int(choice), SCANNERS[int(choice)]["sql"], engine, mode, start, end]
+    return hashlib.sha1(json.dumps(key).encode()).hexdigest()
+
+def _cache_path(key):
+    return os.path.join(SCANNER_CACHE_DIR, f"{key}.parquet")
+
+# =========================================================
+# load_cached_scan Function
+# Cached DataFrame for key at data version `version`, or None.
+# =========================================================
+def load_cached_scan(key, version):
+    path = _cache_path(key)
+    if pa is None or not os.path.exists(path):
+        return None
+    try:
+        table = pq.read_table(path)
+        if (table.schema.metadata or {}).get(b"data_version", b"").decode() != version:
+            return None
+        return table.to_pandas()
+    except Exception as e:
+        log(f"SCANNER CACHE READ FAILED | {path} | {e}")
+        return None
+
+# =========================================================
+# save_cached_scan Function
+# Writes df for key, stamped with data version `version`.
+# =========================================================
+def save_cached_scan(key, version, df):
+    if pa is None:
+        return
+    os.makedirs(SCANNER_CACHE_DIR, exist_ok=True)
+    path = _cache_path(key)
+    tmp_path = path + ".tmp"
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[b"data_version"] = version.encode()
+        pq.write_table(table.replace_schema_metadata(metadata), tmp_path)
+        os.replace(tmp_path, path)   # readers never see a half-written file
+    except Exception as e:
+        log(f"SCANNER CACHE WRITE FAILED | {path} | {e}")
+
+# =========================================================
+# iter_cached_scan Function
+# The cached result for key at data version `version` as a generator of
+# DataFrame chunks of batch_rows rows (at least one, possibly empty), or
+# None when there is no current entry.
+# =========================================================
+def iter_cached_scan(key, version, batch_rows):
+    path = _cache_path(key)
+    if pa is None or not os.path.exists(path):
+        return None
+    try:
+        cached = pq.ParquetFile(path)
+        if (cached.schema_arrow.metadata or {}).get(b"data_version", b"").decode() != version:
+            return None
+    except Exception as e:
+        log(f"SCANNER CACHE READ FAILED | {path} | {e}")
+        return None
+
+    def chunks():
+        yield cached.schema_arrow.empty_table().to_pandas()
+        for batch in cached.iter_batches(batch_size=batch_rows):
+            yield batch.to_pandas()
+    return chunks()
+
+# =========================================================
+# tee_cached_scan Function
+# Passes scan chunks through while writing them to the cache file for key.
+# The file is published once the scan is exhausted and the data version
+# is still `version`; otherwise it is discarded.
+# =========================================================
+def tee_cached_scan(conn, key, version, chunks):
+    if pa is None:
+        yield from chunks
+        return
+    path = _cache_path(key)
+    tmp_path = path + ".tmp"
+    writer, schema, complete = None, None, False
+    try:
+        for chunk in chunks:
+            try:
+                if schema is None:
+                    os.makedirs(SCANNER_CACHE_DIR, exist_ok=True)
+                    schema = result_schema(chunk.columns)
+                    writer = pq.ParquetWriter(tmp_path, schema.with_metadata({b"data_version": version.encode()}))
+                if writer is not None:
+                    writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            except Exception as e:
+                log(f"SCANNER CACHE WRITE FAILED | {path} | {e}")
+                if writer is not None:
+                    writer.close()
+                writer = None
+            yield chunk
+        complete = True
+    finally:
+        if writer is not None:
+            writer.close()
+            if complete and data_version(conn) == version:
+                os.replace(tmp_path, path)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+# =========================================================
+# clear_scanner_cache Function
+# Deletes every cached scanner result.
+# =========================================================
+def clear_scanner_cache():
+    if os.path.isdir(SCANNER_CACHE_DIR):
+        for name in os.listdir(SCANNER_CACHE_DIR):
+            if name.endswith(".parquet"):
+                os.remove(os.path.join(SCANNER_CACHE_DIR, name))
+        print(f"🧹 Cleared scanner cache {SCANNER_CACHE_DIR}")
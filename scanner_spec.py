@@ -0,0 +1,245 @@
+# =========================================================
+# THIS FILE CONTAINS THE FOLLOWING FUNCTIONS:
+# 1. column_label
+# 2. compile_scanner
+# 3. load_scanners
+# 4. compile_batch_sql
+# =========================================================
+# Scanners are declared once in SCANNER_SPECS (JSON) and compiled into
+#   sql    -> one filtered scan of equity_mtf_daily (sql.SQL_MAP), with the
+#             :start / :end / :forward parameters pushed into the WHERE
+#   mask   -> a vectorized predicate over the aligned frame (vector_scanner)
+#   menu   -> the criteria lines shown by scanner.create_scanner_menu
+#
+# Spec format, per scanner id:
+#   name        menu title
+#   conditions  list, all must hold:
+#     {"left": REF, "op": OP, "value": N}          threshold
+#     {"left": REF, "op": OP, "right": REF}        compare two series
+#     {"ratio": [REF, REF], "op": OP, "value": N}  ratio threshold
+#     {"cross": REF, "op": OP, "value": N | "right": REF}
+#                 holds today and did not hold on the previous trading day
+#                 (> / >= cross above, < / <= cross below)
+#   columns     {result column: "symbol" | "symbol_id" | "date" | REF}
+#   order       "asc" / "desc" by date (then symbol)
+# REF is "<timeframe>.<column>" with timeframe 1d / 1wk / 1mo, e.g.
+# "1wk.rsi_3"; it must be a column of equity_mtf_daily (MTF_COLUMNS).
+# ret_<n>d forward returns (MTF_FORWARD_DAYS) are appended to every scanner.
+# compile_batch_sql runs several scanners in one scan of equity_mtf_daily,
+# with a hit_<id> flag per scanner.
+# =========================================================
+import json
+import operator
+from helper import (
+    SCANNER_SPECS,
+    MTF_FORWARD_DAYS
+)
+from create_db import mtf_daily_columns
+
+OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "=": operator.eq,
+    "!=": operator.ne,
+}
+# a cross holds today with `op` and yesterday with its negation
+NEGATED = {">": "<=", ">=": "<", "<": ">=", "<=": ">"}
+TIMEFRAME_PREFIX = {"1d": "", "1wk": "w_", "1mo": "m_"}
+TIMEFRAME_LABEL = {"1d": "DAILY", "1wk": "WEEKLY", "1mo": "MONTHLY"}
+# result columns that are not indicator references
+ROW_COLUMNS = {"symbol": "s.symbol", "symbol_id": "d.symbol_id", "date": "d.date"}
+
+# =========================================================
+# column_label Function
+# Readable name of an indicator column: rsi_9 -> rsi(9),
+# ema_rsi_9_3 -> ema(rsi(9),3), pct_price_change -> pct price change.
+# =========================================================
+def column_label(column):
+    tokens = column.split("_")
+    if len(tokens) > 1 and tokens[-1].isdigit():
+        inner = tokens[1] if len(tokens) == 2 else column_label("_".join(tokens[1:-1])) + "," + tokens[-1]
+        return f"{tokens[0]}({inner})"
+    return " ".join(tokens)
+
+def _ref(scanner_id, ref, prev=False):
+    # "1wk.rsi_3" -> ("w_rsi_3", "WEEKLY rsi(3)")
+    timeframe, _, name = str(ref).partition(".")
+    if timeframe not in TIMEFRAME_PREFIX or not name:
+        raise ValueError(f"Scanner {scanner_id}: bad reference {ref!r} (expected 1d/1wk/1mo.<column>)")
+    column = ("prev_" if prev else "") + TIMEFRAME_PREFIX[timeframe] + name
+    if column not in mtf_daily_columns():
+        raise ValueError(f"Scanner {scanner_id}: {column} is not a column of equity_mtf_daily (see MTF_COLUMNS)")
+    return column, f"{TIMEFRAME_LABEL[timeframe]} {column_label(name)}"
+
+def _number(scanner_id, value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"Scanner {scanner_id}: {value!r} is not a number")
+    return value
+
+# =========================================================
+# _predicates Function
+# One condition -> ([(left, op, right)], menu line), where a term is
+# ("col", column), ("num", value) or ("ratio", column, column).
+# =========================================================
+def _predicates(scanner_id, condition):
+    op = condition.get("op")
+    if op not in OPERATORS:
+        raise ValueError(f"Scanner {scanner_id}: bad operator {op!r} in {condition}")
+
+    if "ratio" in condition:
+        (a, a_label), (b, b_label) = (_ref(scanner_id, ref) for ref in condition["ratio"])
+        value = _number(scanner_id, condition.get("value"))
+        return [(("ratio", a, b), op, ("num", value))], f"{a_label} / {b_label} {op} {value}"
+
+    if "cross" in condition:
+        if op not in NEGATED:
+            raise ValueError(f"Scanner {scanner_id}: a cross needs > >= < or <=, not {op!r}")
+        left, label = _ref(scanner_id, condition["cross"])
+        prev_left, _ = _ref(scanner_id, condition["cross"], prev=True)
+        if "right" in condition:
+            right, right_label = _ref(scanner_id, condition["right"])
+            prev_right = ("col", _ref(scanner_id, condition["right"], prev=True)[0])
+            right = ("col", right)
+        else:
+            right_label = _number(scanner_id, condition.get("value"))
+            right = prev_right = ("num", right_label)
+        direction = "above" if op in (">", ">=") else "below"
+        line = (f"{label} crossed {direction} {right_label} "
+                f"(yesterday {NEGATED[op]} {right_label}, today {op} {right_label})")
+        return [(("col", left), op, right), (("col", prev_left), NEGATED[op], prev_right)], line
+
+    left, label = _ref(scanner_id, condition.get("left"))
+    if "right" in condition:
+        right, right_label = _ref(scanner_id, condition["right"])
+        return [(("col", left), op, ("col", right))], f"{label} {op} {right_label}"
+    value = _number(scanner_id, condition.get("value"))
+    return [(("col", left), op, ("num", value))], f"{label} {op} {value}"
+
+def _sql_term(term):
+    if term[0] == "num":
+        return str(term[1])
+    if term[0] == "ratio":
+        return f"(d.{term[1]} / d.{term[2]})"
+    return f"d.{term[1]}"
+
+# shared select / filter fragments of the scanner queries
+def _returns_sql():
+    return [f"ROUND((d.close_{days}d - d.close) / d.close * 100, 2) AS ret_{days}d" for days in MTF_FORWARD_DAYS]
+
+def _forward_sql():
+    forward = " AND ".join(f"d.close_{days}d IS NOT NULL" for days in MTF_FORWARD_DAYS) or "1"
+    return f"(:forward = 0 OR ({forward}))"
+
+def _frame_term(d, term):
+    if term[0] == "num":
+        return term[1]
+    if term[0] == "ratio":
+        # x / 0 is NULL in SQLite
+        return d[term[1]] / d[term[2]].where(d[term[2]] != 0)
+    return d[term[1]]
+
+# =========================================================
+# compile_scanner Function
+# One spec -> {"name", "menu", "sql", "predicate", "mask", "columns",
+# "ascending"}; predicate is the SQL condition alone, columns maps result
+# columns to frame columns for the vector backend.
+# =========================================================
+def compile_scanner(scanner_id, spec):
+    predicates, menu = [], []
+    for condition in spec.get("conditions", []):
+        terms, line = _predicates(scanner_id, condition)
+        predicates += terms
+        menu.append(line)
+    if not predicates:
+        raise ValueError(f"Scanner {scanner_id}: no conditions")
+
+    columns, selects = {}, []
+    for alias, ref in spec.get("columns", {}).items():
+        if ref in ROW_COLUMNS:
+            columns[alias], expr = ref, ROW_COLUMNS[ref]
+        else:
+            columns[alias] = _ref(scanner_id, ref)[0]
+            expr = f"d.{columns[alias]}"
+        selects.append(expr if expr.split(".")[1] == alias else f"{expr} AS {alias}")
+    selects += _returns_sql()
+
+    order = spec.get("order", "asc")
+    if order not in ("asc", "desc"):
+        raise ValueError(f"Scanner {scanner_id}: order must be 'asc' or 'desc', not {order!r}")
+
+    select = ",\n    ".join(selects)
+    predicate = "\n    AND ".join(
+        f"{_sql_term(left)} {op} {_sql_term(right)}" for left, op, right in predicates
+    )
+    sql = f"""
+SELECT
+    {select}
+FROM equity_mtf_daily d
+JOIN equity_symbols s ON s.symbol_id = d.symbol_id
+WHERE
+    d.date BETWEEN :start AND :end
+    AND {predicate}
+    AND {_forward_sql()}
+ORDER BY d.date{" DESC" if order == "desc" else ""}, s.symbol;
+"""
+
+    def mask(d):
+        hit = None
+        for left, op, right in predicates:
+            term = OPERATORS[op](_frame_term(d, left), _frame_term(d, right))
+            hit = term if hit is None else hit & term
+        return hit
+
+    return {
+        "name": spec.get("name", f"SCANNER {scanner_id}"),
+        "menu": menu,
+        "sql": sql,
+        "predicate": predicate,
+        "mask": mask,
+        "columns": columns,
+        "ascending": order == "asc",
+    }
+
+# =========================================================
+# load_scanners Function
+# Compiles every scanner in the spec file: {scanner id: compiled scanner}.
+# =========================================================
+def load_scanners(path=SCANNER_SPECS):
+    with open(path) as f:
+        specs = json.load(f)
+    return {int(scanner_id): compile_scanner(scanner_id, spec) for scanner_id, spec in specs.items()}
+
+# =========================================================
+# compile_batch_sql Function
+# One scan of equity_mtf_daily for several compiled scanners ({id:
+# scanner}): the union of their result columns, the forward returns and a
+# hit_<id> flag (1 / 0 / NULL) per scanner, keeping the rows any of them
+# matches, ordered by date, symbol. Same :start / :end / :forward
+# parameters.
+# =========================================================
+def compile_batch_sql(scanners):
+    selects = ["s.symbol", "d.symbol_id", "d.date", "d.close"]
+    for scanner in scanners.values():
+        for column in scanner["columns"].values():
+            if f"d.{column}" not in selects and column != "symbol":
+                selects.append(f"d.{column}")
+    selects += _returns_sql()
+    selects += [f"({scanner['predicate']}) AS hit_{scanner_id}" for scanner_id, scanner in scanners.items()]
+
+    select = ",\n    ".join(selects)
+    any_hit = " OR ".join(f"hit_{scanner_id}" for scanner_id in scanners)
+    return f"""
+SELECT * FROM (
+SELECT
+    {select}
+FROM equity_mtf_daily d
+JOIN equity_symbols s ON s.symbol_id = d.symbol_id
+WHERE
+    d.date BETWEEN :start AND :end
+    AND {_forward_sql()}
+)
+WHERE {any_hit}
+ORDER BY date, symbol;
+"""
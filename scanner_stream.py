@@ -0,0 +1,137 @@
+# =========================================================
+# THIS FILE CONTAINS THE FOLLOWING FUNCTIONS:
+# 1. result_schema
+# 2. new_scan_stats
+# 3. update_scan_stats
+# 4. write_scan_chunks
+# 5. preview_rows
+# =========================================================
+# Streaming scanner output: results arrive as DataFrame chunks (cursor
+# fetchmany, cached Parquet batches) and each chunk is
+#   written   -> appended to the CSV / Parquet output file
+#   counted   -> running match count, per-horizon win counts and max loss
+#   previewed -> merged into a bounded buffer of the latest
+#                SCANNER_PREVIEW_ROWS signals
+# and dropped, so memory stays flat whatever the number of matches.
+#
+# pyarrow is optional: only Parquet output needs it.
+# =========================================================
+import os
+import pandas as pd
+from helper import (
+    MTF_FORWARD_DAYS,
+    SCANNER_PREVIEW_ROWS
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("pyarrow is required for Parquet scanner output: pip install pyarrow")
+
+# =========================================================
+# result_schema Function
+# Arrow schema of scanner result columns: symbol / date as text,
+# symbol_id as integer, everything else (indicators, returns) as float.
+# =========================================================
+def result_schema(columns):
+    _require_pyarrow()
+    types = {"symbol": pa.string(), "date": pa.string(), "symbol_id": pa.int64()}
+    return pa.schema([(column, types.get(column, pa.float64())) for column in columns])
+
+# =========================================================
+# new_scan_stats Function
+# Empty running aggregates: {"matches", "returns": {ret_<n>d: {"count",
+# "wins", "max_loss"}}, "preview": latest signals DataFrame}.
+# =========================================================
+def new_scan_stats():
+    return {
+        "matches": 0,
+        "returns": {
+            f"ret_{days}d": {"count": 0, "wins": 0, "max_loss": None} for days in MTF_FORWARD_DAYS
+        },
+        "preview": None,
+    }
+
+# =========================================================
+# update_scan_stats Function
+# Folds one chunk into the aggregates. Signals without a forward return
+# yet (latest / range runs) are not counted for that horizon.
+# =========================================================
+def update_scan_stats(stats, chunk, preview_rows=SCANNER_PREVIEW_ROWS):
+    stats["matches"] += len(chunk)
+    for column, agg in stats["returns"].items():
+        if column not in chunk:
+            continue
+        values = pd.to_numeric(chunk[column], errors="coerce").dropna()
+        if values.empty:
+            continue
+        agg["count"] += len(values)
+        agg["wins"] += int((values > 0).sum())
+        low = float(values.min())
+        agg["max_loss"] = low if agg["max_loss"] is None else min(agg["max_loss"], low)
+
+    # --- Latest preview_rows signals by (date, symbol), newest first ---
+    if preview_rows and len(chunk):
+        latest = chunk.sort_values(["date", "symbol"], ascending=False, kind="stable").head(preview_rows)
+        if stats["preview"] is not None:
+            latest = pd.concat([stats["preview"], latest], ignore_index=True)
+            latest = latest.sort_values(["date", "symbol"], ascending=False, kind="stable").head(preview_rows)
+        stats["preview"] = latest.reset_index(drop=True)
+    return stats
+
+# =========================================================
+# write_scan_chunks Function
+# Streams DataFrame chunks to `path` (.csv or .parquet, None = no file)
+# and returns the running aggregates (new_scan_stats).
+# =========================================================
+def write_scan_chunks(chunks, path=None, preview_rows=SCANNER_PREVIEW_ROWS):
+    stats = new_scan_stats()
+    parquet = path is not None and path.endswith(".parquet")
+    writer, header = None, True
+    tmp_path = None if path is None else path + ".tmp"
+    try:
+        for chunk in chunks:
+            if path is not None:
+                if parquet:
+                    if writer is None:
+                        schema = result_schema(chunk.columns)
+                        writer = pq.ParquetWriter(tmp_path, schema)
+                    writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+                else:
+                    chunk.to_csv(tmp_path, mode="w" if header else "a", header=header, index=False)
+                    header = False
+            update_scan_stats(stats, chunk, preview_rows)
+        if writer is not None:
+            writer.close()
+            writer = None
+        if path is not None and os.path.exists(tmp_path):
+            os.replace(tmp_path, path)   # a failed scan leaves no half-written file
+        return stats
+    finally:
+        if writer is not None:
+            writer.close()
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def format_value(value, digits=2):
+    # NULL / NaN (e.g. no forward close yet) prints as "-"
+    return "-" if pd.isna(value) else f"{value:.{digits}f}"
+
+# =========================================================
+# preview_rows Function
+# The preview signals of the aggregates as display rows:
+# (symbol, date, ret_<n>d ...) strings.
+# =========================================================
+def preview_rows(stats):
+    if stats["preview"] is None:
+        return []
+    returns = list(stats["returns"])
+    return [
+        (str(row["symbol"]), str(row["date"]), *(format_value(row[column]) for column in returns))
+        for _, row in stats["preview"].iterrows()
+    ]
@@ -0,0 +1,50 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+import pytest
+from create_db import create_stock_database
+from change_log import log_price_changes
+from helper import DB_FILE
+
+
+@pytest.fixture
+def make_database(tmp_path, monkeypatch):
+    """Factory for a fresh database/stocks.db under tmp_path.
+
+    Every symbol gets a random walk of bars per (timeframe, periods, freq)
+    in `bars`, starting at `start` (`stagger` days later per symbol).
+    `log_changes` records the bars in the change log like a download does.
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "database").mkdir()
+    conns = []
+
+    def make(symbols=3, seed=0, bars=(("1d", 400, "B"),), start="2020-01-01", stagger=0,
+             base=100, scale=1, log_changes=False):
+        create_stock_database(drop_existing=True)
+        conn = sqlite3.connect(DB_FILE)
+        conns.append(conn)
+
+        rng = np.random.default_rng(seed)
+        rows, first = [], []
+        for symbol_id in range(1, symbols + 1):
+            conn.execute("INSERT INTO equity_symbols (symbol_id, symbol) VALUES (?, ?)",
+                         (symbol_id, f"SYM{symbol_id:02d}"))
+            listed = pd.Timestamp(start) + pd.Timedelta(days=stagger * (symbol_id - 1))
+            for timeframe, periods, freq in bars:
+                dates = pd.date_range(listed, periods=periods, freq=freq).strftime("%Y-%m-%d")
+                close = np.round(base + np.cumsum(rng.normal(scale=scale, size=periods)), 2)
+                rows += [(symbol_id, timeframe, d, c, c + 1, c - 1, c, c, 1000.0) for d, c in zip(dates, close)]
+                first.append((symbol_id, timeframe, dates[0]))
+        conn.executemany("""
+            INSERT INTO equity_price_data (symbol_id, timeframe, date, open, high, low, close, adj_close, volume)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        if log_changes:
+            log_price_changes(conn, False, first)
+        conn.commit()
+        return conn
+
+    yield make
+    for conn in conns:
+        conn.close()
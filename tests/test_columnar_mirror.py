@@ -0,0 +1,97 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+from change_log import log_price_changes
+from helper import COLUMNAR_DIR
+from indicators import refresh_indicators
+from indicator_state import indicator_generations
+import columnar_mirror
+from columnar_mirror import sync_columnar_mirror, read_columnar_pandas
+
+
+BARS = (("1d", 500, "B"),)
+
+
+def assert_mirrored(conn, table_name, column):
+    mirror = read_columnar_pandas(table_name, "1d", columns=[column])
+    mirror = mirror.sort_values(["symbol_id", "date"]).reset_index(drop=True)
+    final_only = "AND is_final = 1" if table_name == "equity_price_data" else ""
+    db = pd.read_sql(f"""
+        SELECT symbol_id, date, {column} FROM {table_name}
+        WHERE timeframe = '1d' {final_only} ORDER BY symbol_id, date
+    """, conn)
+    assert list(mirror["date"].dt.strftime("%Y-%m-%d")) == list(db["date"])
+    np.testing.assert_array_equal(mirror["symbol_id"].to_numpy(), db["symbol_id"].to_numpy())
+    np.testing.assert_allclose(mirror[column].to_numpy(), db[column].to_numpy())
+
+
+def test_mirror_follows_back_dated_corrections(make_database):
+    conn = make_database(symbols=3, seed=5, bars=BARS, start="2019-06-01", log_changes=True)
+    refresh_indicators(conn)
+    sync_columnar_mirror(conn)
+    assert_mirrored(conn, "equity_price_data", "close")
+    assert_mirrored(conn, "equity_indicators", "rsi_14")
+
+    # correct a bar in an earlier year partition, append a new one
+    conn.execute("""
+        UPDATE equity_price_data SET close = close + 4, adj_close = adj_close + 4
+        WHERE symbol_id = 2 AND timeframe = '1d' AND date = '2019-09-02'
+    """)
+    conn.execute("""
+        INSERT INTO equity_price_data (symbol_id, timeframe, date, open, high, low, close, adj_close, volume)
+        VALUES (1, '1d', '2022-01-03', 90, 91, 89, 90, 90, 1000.0)
+    """)
+    log_price_changes(conn, False, [(1, "1d", "2022-01-03")])
+    conn.commit()
+    refresh_indicators(conn, incremental=True)
+
+    sync_columnar_mirror(conn)
+    assert_mirrored(conn, "equity_price_data", "close")
+    assert_mirrored(conn, "equity_indicators", "rsi_14")
+    conn.close()
+
+
+def test_mirror_rebuilds_after_indicator_rewrite(make_database):
+    conn = make_database(symbols=2, seed=5, bars=BARS, start="2019-06-01", log_changes=True)
+    refresh_indicators(conn)
+    conn.execute("UPDATE equity_indicators SET rsi_14 = 0")
+    conn.commit()
+    sync_columnar_mirror(conn)
+    assert_mirrored(conn, "equity_indicators", "rsi_14")
+
+    # an incremental refresh goes through the change log, not the generation
+    generations = indicator_generations(conn, False)
+    conn.execute("""
+        INSERT INTO equity_price_data (symbol_id, timeframe, date, open, high, low, close, adj_close, volume)
+        VALUES (1, '1d', '2022-01-03', 90, 91, 89, 90, 90, 1000.0)
+    """)
+    log_price_changes(conn, False, [(1, "1d", "2022-01-03")])
+    conn.commit()
+    refresh_indicators(conn, incremental=True)
+    assert indicator_generations(conn, False) == generations
+
+    # a columns= backfill rewrites every value without a logged change
+    refresh_indicators(conn, columns=["rsi_14"])
+    assert indicator_generations(conn, False) != generations
+    sync_columnar_mirror(conn)
+    assert_mirrored(conn, "equity_indicators", "rsi_14")
+    assert read_columnar_pandas("equity_indicators", "1d", columns=["rsi_14"])["rsi_14"].max() > 0
+    conn.close()
+
+
+def test_failed_sync_leaves_no_partial_parts(make_database, monkeypatch):
+    conn = make_database(symbols=1, seed=5, bars=BARS, start="2019-06-01", log_changes=True)
+    refresh_indicators(conn)
+
+    def broken_batch(*args, **kwargs):
+        raise RuntimeError("disk full")
+    monkeypatch.setattr(columnar_mirror.pa, "record_batch", broken_batch)
+    sync_columnar_mirror(conn)
+
+    leftovers = [name for _, _, files in os.walk(COLUMNAR_DIR) for name in files if name.endswith(".tmp")]
+    assert leftovers == []
+    conn.close()
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+import indicator_query
+from indicator_query import price_watermark, query_indicator, clear_indicator_cache
+from indicator_registry import make_indicator, compute_indicators
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    clear_indicator_cache()
+
+
+def expected(conn, kind, params):
+    bars = pd.read_sql("""
+        SELECT date, open, high, low, close, adj_close FROM equity_price_data
+        WHERE symbol_id = 1 AND timeframe = '1d' AND is_final = 1 ORDER BY date
+    """, conn)
+    columns, _ = compute_indicators(bars, registry=make_indicator(kind, params))
+    return bars["date"].to_numpy(), columns
+
+
+def test_query_matches_full_computation_and_slices(make_database, monkeypatch):
+    conn = make_database(symbols=1, seed=11, start="2018-01-01")
+    dates, columns = expected(conn, "rsi", {"period": 5})
+
+    df = query_indicator(conn, "SYM01", "1d", "rsi", {"period": 5}, start=dates[100], end=dates[199])
+    assert list(df["date"]) == list(dates[100:200])
+    for name, values in columns.items():
+        np.testing.assert_array_equal(df[name].to_numpy(), values[100:200], err_msg=name)
+
+    # served from the disk cache once the memory cache is gone
+    clear_indicator_cache()
+    monkeypatch.setattr(indicator_query, "compute_indicators", None)
+    cached = query_indicator(conn, 1, "1d", "rsi", {"period": 5}, start=dates[100], end=dates[199])
+    pd.testing.assert_frame_equal(cached, df)
+    conn.close()
+
+
+def test_back_dated_correction_invalidates_cache(make_database):
+    conn = make_database(symbols=1, seed=11, start="2018-01-01")
+    before = query_indicator(conn, "SYM01", "1d", "rsi", {"period": 5})
+    watermark = price_watermark(conn, False, 1, "1d")
+
+    # same dates and bar count, one close corrected mid-history
+    conn.execute("""
+        UPDATE equity_price_data SET close = close + 3
+        WHERE symbol_id = 1 AND timeframe = '1d' AND date = ?
+    """, (before["date"].iloc[200],))
+    conn.commit()
+    moved = price_watermark(conn, False, 1, "1d")
+    assert moved[:2] == watermark[:2] and moved != watermark
+
+    after = query_indicator(conn, "SYM01", "1d", "rsi", {"period": 5})
+    _, columns = expected(conn, "rsi", {"period": 5})
+    for name, values in columns.items():
+        np.testing.assert_array_equal(after[name].to_numpy(), values, err_msg=name)
+    assert not np.allclose(after["rsi"].iloc[200:210], before["rsi"].iloc[200:210])
+
+    # a value moved to another date keeps the plain sums, not the checksum
+    conn.execute("""
+        UPDATE equity_price_data SET close = close - 3
+        WHERE symbol_id = 1 AND timeframe = '1d' AND date = ?
+    """, (before["date"].iloc[200],))
+    conn.execute("""
+        UPDATE equity_price_data SET close = close + 3
+        WHERE symbol_id = 1 AND timeframe = '1d' AND date = ?
+    """, (before["date"].iloc[201],))
+    conn.commit()
+    assert price_watermark(conn, False, 1, "1d") not in (watermark, moved)
+    conn.close()
+
+
+def test_unknown_symbol_and_params(make_database):
+    conn = make_database(symbols=1, seed=11, bars=(("1d", 50, "B"),), start="2018-01-01")
+    with pytest.raises(KeyError):
+        query_indicator(conn, "NOPE", "1d", "rsi")
+    with pytest.raises(KeyError):
+        query_indicator(conn, "SYM01", "1d", "rsi", {"length": 5})
+    conn.close()
@@ -0,0 +1,63 @@
+import json
+import numpy as np
+import pandas as pd
+from indicators import advance_indicators
+from indicator_registry import compute_last_indicators
+
+
+def make_bars(n=600, seed=7):
+    rng = np.random.default_rng(seed)
+    close = np.round(100 + np.cumsum(rng.normal(size=n)), 2)
+    close[120] = np.nan          # missing bar inside history
+    close[300:310] = close[299]  # flat stretch
+    return pd.DataFrame({
+        "date": pd.date_range("2010-01-01", periods=n).strftime("%Y-%m-%d"),
+        "open": close,
+        "high": np.round(close + rng.random(n), 2),
+        "low": np.round(close - rng.random(n), 2),
+        "close": close,
+        "adj_close": close,
+    })
+
+
+def test_incremental_state_matches_full_rebuild():
+    bars = make_bars()
+    full, _ = advance_indicators(bars)
+
+    state, parts = None, []
+    edges = [0, 1, 2, 19, 121, 200, 201, 350, 599, len(bars)]
+    for start, end in zip(edges, edges[1:]):
+        out, state = advance_indicators(bars.iloc[start:end].reset_index(drop=True), state)
+        state = json.loads(json.dumps(state))   # round-trip through the state table format
+        parts.append(out)
+
+    for name, values in full.items():
+        advanced = np.concatenate([p[name] for p in parts])
+        np.testing.assert_array_equal(advanced, values, err_msg=name)
+
+
+def test_indicator_subset_matches_full_run():
+    bars = make_bars()
+    full, _ = advance_indicators(bars)
+    subset, state = advance_indicators(bars, names=["wma_rsi_9_21", "bb_upper"])
+
+    assert list(subset) == ["bb_upper", "bb_middle", "bb_lower", "wma_rsi_9_21"]
+    assert set(state["indicators"]) == {"rsi_9", "bollinger", "wma_rsi_9_21"}
+    for name, values in subset.items():
+        np.testing.assert_array_equal(values, full[name], err_msg=name)
+
+
+def test_last_value_matches_full_run():
+    bars = make_bars()
+    full, full_state = advance_indicators(bars)
+
+    record, state = compute_last_indicators(bars)
+    assert json.dumps(state) == json.dumps(full_state)
+
+    _, seeded = advance_indicators(bars.iloc[:-3].reset_index(drop=True))
+    seeded = json.loads(json.dumps(seeded))
+    from_state, _ = compute_last_indicators(bars.iloc[-3:].reset_index(drop=True), state=seeded)
+
+    for name, values in full.items():
+        np.testing.assert_array_equal(record[name], values[-1], err_msg=name)
+        np.testing.assert_array_equal(from_state[name], values[-1], err_msg=name)
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+from indicators import refresh_indicators, refresh_partial_indicators
+from partial_prices import partial_candles, refresh_partial_prices
+
+
+def add_gaps_and_indexes(conn):
+    """Blank out a Monday's open / high / low / volume and a later open,
+    then copy the bars as indexes (no volume, no is_final)."""
+    dates = [d for (d,) in conn.execute("SELECT DISTINCT date FROM equity_price_data ORDER BY date")]
+    conn.execute("UPDATE equity_price_data SET open = NULL, high = NULL, low = NULL, volume = NULL WHERE date = ?",
+                 (dates[40],))
+    conn.execute("UPDATE equity_price_data SET open = NULL WHERE date = ?", (dates[45],))
+    conn.execute("""
+        INSERT INTO index_symbols (index_id, index_code, index_name, exchange, yahoo_symbol)
+        SELECT symbol_id, 'IDX' || symbol_id, 'Index ' || symbol_id, 'NSE', '^IDX' || symbol_id FROM equity_symbols
+    """)
+    conn.execute("""
+        INSERT INTO index_price_data (index_id, timeframe, date, open, high, low, close, adj_close)
+        SELECT symbol_id, timeframe, date, open, high, low, close, adj_close FROM equity_price_data
+    """)
+    conn.commit()
+    return dates
+
+
+def partial_database(make_database):
+    conn = make_database(symbols=3, seed=1, bars=(("1d", 90, "B"),), start="2023-01-02")
+    return conn, add_gaps_and_indexes(conn)
+
+
+def hand_built(conn, is_indexs, symbol_id, first, as_of):
+    """Candle of the daily bars first..as_of, folded bar by bar."""
+    price_table = "index_price_data" if is_indexs else "equity_price_data"
+    col_id      = "index_id"         if is_indexs else "symbol_id"
+    volume      = "NULL"             if is_indexs else "volume"
+    bars = conn.execute(f"""
+        SELECT open, high, low, close, adj_close, {volume} FROM {price_table}
+        WHERE {col_id} = ? AND timeframe = '1d' AND date BETWEEN ? AND ? ORDER BY date
+    """, (symbol_id, first, as_of)).fetchall()
+    candle = {"open": None, "high": None, "low": None, "volume": None}
+    for open_, high, low, close, adj_close, vol in bars:
+        if candle["open"] is None:
+            candle["open"] = open_
+        if high is not None:
+            candle["high"] = high if candle["high"] is None else max(candle["high"], high)
+        if low is not None:
+            candle["low"] = low if candle["low"] is None else min(candle["low"], low)
+        if vol is not None:
+            candle["volume"] = (candle["volume"] or 0) + vol
+        candle["close"], candle["adj_close"] = close, adj_close
+    return {name: np.nan if value is None else value for name, value in candle.items()}
+
+
+def test_snapshot_sql_matches_ranged_candles(make_database):
+    conn, dates = partial_database(make_database)
+    ranged = partial_candles(conn, dates[30], as_of_end=dates[-1])
+
+    for as_of in dates[30:]:
+        snapshot = partial_candles(conn, as_of)
+        expected = ranged[ranged["date"] == as_of].reset_index(drop=True)
+        pd.testing.assert_frame_equal(snapshot, expected, check_dtype=False, obj=as_of)
+
+    # the overlay holds the latest snapshot, written set-based
+    refresh_partial_prices(conn)
+    overlay = pd.read_sql("""
+        SELECT symbol_id, timeframe, date, open, high, low, close, adj_close, volume
+        FROM equity_price_partial ORDER BY symbol_id, timeframe
+    """, conn)
+    pd.testing.assert_frame_equal(overlay, partial_candles(conn), check_dtype=False)
+    conn.close()
+
+
+def test_candles_match_hand_built_week_and_month(make_database):
+    conn, dates = partial_database(make_database)
+    # (as-of, its Monday, its 1st): mid-week / mid-month, the NULL-open
+    # Monday 2023-02-27, a Friday, a month's first trading day
+    cases = [
+        ("2023-04-19", "2023-04-17", "2023-04-03"),
+        ("2023-02-27", "2023-02-27", "2023-02-01"),
+        ("2023-02-24", "2023-02-20", "2023-02-01"),
+        ("2023-03-01", "2023-02-27", "2023-03-01"),
+    ]
+    for is_indexs, col_id in ((False, "symbol_id"), (True, "index_id")):
+        for as_of, monday, first in cases:
+            candles = partial_candles(conn, as_of, is_indexs=is_indexs).set_index([col_id, "timeframe"])
+            assert (candles["date"] == as_of).all()
+            for symbol_id in (1, 2, 3):
+                for timeframe, start in (("1wk", monday), ("1mo", first)):
+                    expected = hand_built(conn, is_indexs, symbol_id, start, as_of)
+                    got = candles.loc[(symbol_id, timeframe)]
+                    for name, value in expected.items():
+                        np.testing.assert_equal(float(got[name]), value,
+                                                err_msg=f"{is_indexs} {as_of} {symbol_id} {timeframe} {name}")
+
+
+def test_index_overlay_and_partial_indicators(make_database):
+    conn, dates = partial_database(make_database)
+    refresh_indicators(conn, is_indexs=True)
+    refresh_partial_prices(conn, as_of="2023-04-19", is_indexs=True)
+
+    overlay = pd.read_sql("""
+        SELECT index_id, timeframe, date, open, high, low, close, adj_close
+        FROM index_price_partial ORDER BY index_id, timeframe
+    """, conn)
+    expected = partial_candles(conn, "2023-04-19", is_indexs=True).drop(columns="volume")
+    pd.testing.assert_frame_equal(overlay, expected, check_dtype=False)
+
+    # the overlay candle shows through index_price_all and gets its indicator row
+    assert conn.execute("""
+        SELECT COUNT(*) FROM index_price_all WHERE is_final = 0 AND date = '2023-04-19'
+    """).fetchone()[0] == 6
+    refresh_partial_indicators(conn, is_indexs=True)
+    rows = conn.execute("""
+        SELECT index_id, timeframe, date FROM index_indicator_partial ORDER BY index_id, timeframe
+    """).fetchall()
+    assert rows == [(i, tf, "2023-04-19") for i in (1, 2, 3) for tf in ("1mo", "1wk")]
+    conn.close()
@@ -0,0 +1,82 @@
+import pandas as pd
+from indicators import refresh_indicators, plan_indicator_refresh
+
+
+BARS = (("1d", 400, "B"), ("1wk", 80, "W-MON"), ("1mo", 20, "MS"))
+
+
+def indicator_rows(conn):
+    return pd.read_sql("SELECT * FROM equity_indicators ORDER BY symbol_id, timeframe, date", conn)
+
+
+def indicator_states(conn):
+    return pd.read_sql("SELECT * FROM equity_indicator_state ORDER BY symbol_id, timeframe", conn)
+
+
+def test_workers_rebuild_matches_serial(make_database):
+    conn = make_database(symbols=6, seed=9, bars=BARS)
+    refresh_indicators(conn)
+    serial, serial_states = indicator_rows(conn), indicator_states(conn)
+    assert len(serial) == 6 * (400 + 80 + 20)
+
+    conn.execute("DELETE FROM equity_indicators")
+    conn.execute("DELETE FROM equity_indicator_state")
+    conn.commit()
+    refresh_indicators(conn, workers=2, commit_rows=500)
+    pd.testing.assert_frame_equal(indicator_rows(conn), serial)
+    pd.testing.assert_frame_equal(indicator_states(conn), serial_states)
+    conn.close()
+
+
+def test_failed_batch_falls_back_to_row_inserts(make_database):
+    conn = make_database(symbols=3, seed=9, bars=BARS)
+    refresh_indicators(conn)
+    expected = indicator_rows(conn)
+
+    conn.execute("DELETE FROM equity_indicators")
+    conn.execute("DELETE FROM equity_indicator_state")
+    # one bad row fails its whole batch; the retry writes the rest one by one
+    conn.execute("""
+        CREATE TEMP TRIGGER reject_row BEFORE INSERT ON main.equity_indicators
+        WHEN NEW.symbol_id = 2 AND NEW.timeframe = '1d' AND NEW.date = '2020-06-01'
+        BEGIN SELECT RAISE(ABORT, 'rejected'); END
+    """)
+    conn.commit()
+    refresh_indicators(conn, commit_rows=500)
+
+    written = indicator_rows(conn)
+    rejected = (expected["symbol_id"] == 2) & (expected["timeframe"] == "1d") & (expected["date"] == "2020-06-01")
+    assert rejected.sum() == 1
+    pd.testing.assert_frame_equal(written, expected[~rejected].reset_index(drop=True))
+    assert len(indicator_states(conn)) == 3 * 3
+    conn.close()
+
+
+def test_watermark_plan_schedules_only_stale_pairs(make_database):
+    conn = make_database(symbols=4, seed=9, bars=BARS)
+    refresh_indicators(conn)
+    assert plan_indicator_refresh(conn, False) == {"1d": [], "1wk": [], "1mo": []}
+
+    # new bars for symbol 2, symbol 3's weekly indicators gone
+    conn.executemany("""
+        INSERT INTO equity_price_data (symbol_id, timeframe, date, open, high, low, close, adj_close, volume)
+        VALUES (2, '1d', ?, 90, 91, 89, 90, 90, 1000.0)
+    """, [("2021-09-01",), ("2021-09-02",)])
+    conn.execute("DELETE FROM equity_indicators WHERE symbol_id = 3 AND timeframe = '1wk'")
+    conn.execute("DELETE FROM equity_indicator_state WHERE symbol_id = 3 AND timeframe = '1wk'")
+    conn.commit()
+    assert plan_indicator_refresh(conn, False) == {"1d": [2], "1wk": [3], "1mo": []}
+
+    # without a change log cursor the incremental run follows the plan
+    conn.execute("DELETE FROM equity_price_change_cursors")
+    conn.commit()
+    refresh_indicators(conn, incremental=True)
+    incremental = indicator_rows(conn)
+    assert plan_indicator_refresh(conn, False) == {"1d": [], "1wk": [], "1mo": []}
+
+    conn.execute("DELETE FROM equity_indicators")
+    conn.execute("DELETE FROM equity_indicator_state")
+    conn.commit()
+    refresh_indicators(conn)
+    pd.testing.assert_frame_equal(incremental, indicator_rows(conn))
+    conn.close()
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+from change_log import log_price_changes
+from partial_prices import refresh_partial_prices
+from timeframe_map import map_period_dates, refresh_timeframe_map
+
+
+def insert_bars(conn, rows):
+    conn.executemany("""
+        INSERT INTO equity_price_data (symbol_id, timeframe, date, open, high, low, close, adj_close, volume)
+        VALUES (?, ?, ?, 100, 101, 99, 100, 100, 1000.0)
+    """, rows)
+    first = {}
+    for symbol_id, timeframe, date in rows:
+        first[symbol_id, timeframe] = min(first.get((symbol_id, timeframe), date), date)
+    log_price_changes(conn, False, [(s, tf, d) for (s, tf), d in first.items()])
+    conn.commit()
+
+
+# symbols listed on different days; weekly / monthly bars end early
+BARS = (("1d", 300, "B"), ("1wk", 50, "W-MON"), ("1mo", 11, "MS"))
+
+
+def timeframe_map(conn):
+    return pd.read_sql("SELECT * FROM equity_timeframe_map ORDER BY symbol_id, date", conn)
+
+
+def test_map_period_dates():
+    daily = np.array(["2021-01-01", "2021-01-04", "2021-01-08", "2021-01-11", "2021-02-01"])
+    weekly = np.array(["2021-01-04", "2021-01-11"])
+    assert list(map_period_dates(daily, weekly)) == [None, "2021-01-04", "2021-01-04", "2021-01-11", "2021-01-11"]
+
+
+def test_incremental_map_matches_rebuild(make_database):
+    conn = make_database(symbols=4, bars=BARS, start="2021-01-01", stagger=1, log_changes=True)
+    refresh_timeframe_map(conn)
+
+    # appended days, a back-dated weekly bar, a deleted monthly bar, a new symbol
+    insert_bars(conn, [(1, "1d", d) for d in pd.date_range("2022-02-28", periods=5, freq="B").strftime("%Y-%m-%d")])
+    insert_bars(conn, [(2, "1wk", "2021-03-03")])
+    conn.execute("DELETE FROM equity_price_data WHERE symbol_id = 3 AND timeframe = '1mo' AND date = '2021-05-01'")
+    conn.execute("INSERT INTO equity_symbols (symbol_id, symbol) VALUES (9, 'SYM09')")
+    conn.commit()
+    insert_bars(conn, [(9, "1d", "2021-06-01"), (9, "1d", "2021-06-02"), (9, "1wk", "2021-05-31")])
+    # partial week / month candles of the latest day
+    refresh_partial_prices(conn)
+
+    refresh_timeframe_map(conn)
+    incremental = timeframe_map(conn)
+    assert incremental["is_partial"].sum() > 0
+    assert len(incremental) == conn.execute("""
+        SELECT COUNT(*) FROM equity_price_data WHERE timeframe = '1d' AND is_final = 1
+    """).fetchone()[0]
+
+    refresh_timeframe_map(conn, rebuild=True)
+    pd.testing.assert_frame_equal(incremental, timeframe_map(conn))
+    conn.close()
@@ -0,0 +1,375 @@
+import importlib.util
+import json
+import sqlite3
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pytest
+from create_db import create_stock_database, create_derived_tables
+from change_log import log_price_changes
+from helper import DB_FILE, SCANNER_SPECS
+from indicators import refresh_indicators, refresh_partial_indicators
+from partial_prices import refresh_partial_prices
+from mtf_daily import refresh_mtf_daily
+from sql import SQL_MAP, SCANNERS
+from scanner_spec import compile_scanner, compile_batch_sql, load_scanners
+from scanner_cache import (data_version, scan_cache_key, load_cached_scan, save_cached_scan,
+                           iter_cached_scan, tee_cached_scan)
+from scanner_stream import write_scan_chunks, preview_rows
+from backtest_stats import backtest_report, backtest_stats
+import parallel_scanner
+from parallel_scanner import date_partitions, parallel_scan_chunks
+from vector_scanner import (scan_vectorized, scan_vectorized_batch, split_scanner_hits, latest_scan_date,
+                            scan_params)
+
+ARCHIVE = Path(__file__).resolve().parent.parent / "archive"
+
+
+# weekly / monthly bars end before the daily ones, so the last week and
+# month come from partial candles
+BARS = (("1d", 700, "B"), ("1wk", 135, "W-MON"), ("1mo", 31, "MS"))
+
+
+def scanner_database(make_database, symbols=12):
+    conn = make_database(symbols=symbols, seed=3, bars=BARS, start="2015-01-01", base=150, scale=3)
+    refresh_indicators(conn)
+    refresh_partial_prices(conn, as_of=latest_scan_date(conn))
+    refresh_partial_indicators(conn)
+    refresh_mtf_daily(conn)
+    return conn
+
+
+def test_vector_scanner_matches_sql(make_database):
+    conn = scanner_database(make_database)
+    last = latest_scan_date(conn)
+    runs = [
+        {"start": "", "end": "9999-12-31", "forward": 1},
+        {"start": "2016-01-01", "end": "2016-06-30", "forward": 0},
+        {"start": last, "end": last, "forward": 0},
+    ]
+    for choice in SQL_MAP:
+        for params in runs:
+            expected = pd.read_sql(SQL_MAP[choice], conn, params=params)
+            result = scan_vectorized(conn, choice, **params)
+            pd.testing.assert_frame_equal(result, expected, check_dtype=False, atol=0.01)
+        assert len(pd.read_sql(SQL_MAP[choice], conn, params=runs[0]))
+
+    # one shared pass for all scanners, split per scanner
+    batch_sql = compile_batch_sql({choice: SCANNERS[choice] for choice in SQL_MAP})
+    for params in runs:
+        from_sql = split_scanner_hits(pd.read_sql(batch_sql, conn, params=params), list(SQL_MAP))
+        from_frame = scan_vectorized_batch(conn, list(SQL_MAP), **params)
+        for choice in SQL_MAP:
+            expected = pd.read_sql(SQL_MAP[choice], conn, params=params)
+            pd.testing.assert_frame_equal(from_sql[choice], expected, check_dtype=False)
+            pd.testing.assert_frame_equal(from_frame[choice], expected, check_dtype=False, atol=0.01)
+    conn.close()
+
+
+def test_compiled_scanners_match_original_sql(make_database):
+    # archive/sql.py keeps the hand-written queries the specs replaced:
+    # same rows over the full history, before the spec compiler and
+    # equity_mtf_daily existed, in the (date, symbol) order the scanner
+    # has always exported
+    spec = importlib.util.spec_from_file_location("archive_sql", ARCHIVE / "sql.py")
+    original = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(original)
+
+    conn = scanner_database(make_database)
+    backtest = {"start": "", "end": "9999-12-31", "forward": 1}
+    for choice in original.SQL_MAP:
+        expected = pd.read_sql(original.SQL_MAP[choice], conn)
+        expected = expected.sort_values(["date", "symbol"], kind="stable", ignore_index=True)
+        assert len(expected)
+        pd.testing.assert_frame_equal(pd.read_sql(SQL_MAP[choice], conn, params=backtest), expected,
+                                      check_dtype=False)
+        pd.testing.assert_frame_equal(scan_vectorized(conn, choice, **backtest), expected,
+                                      check_dtype=False, atol=0.01)
+    conn.close()
+
+
+def test_scanner_spec_compiles_to_sql_mask_and_menu(tmp_path, monkeypatch):
+    # the spec file is found whatever the working directory
+    monkeypatch.chdir(tmp_path)
+    assert load_scanners().keys() == SCANNERS.keys()
+
+    scanner = compile_scanner("x", {
+        "name": "RSI CROSS",
+        "conditions": [
+            {"cross": "1d.rsi_9", "op": ">", "right": "1d.ema_rsi_9_3"},
+            {"ratio": ["1wk.rsi_9", "1wk.ema_rsi_9_3"], "op": ">=", "value": 1.2},
+        ],
+        "columns": {"symbol": "symbol", "date": "date", "weekly_rsi_9": "1wk.rsi_9"},
+        "order": "desc",
+    })
+    assert scanner["menu"] == [
+        "DAILY rsi(9) crossed above DAILY ema(rsi(9),3) "
+        "(yesterday <= DAILY ema(rsi(9),3), today > DAILY ema(rsi(9),3))",
+        "WEEKLY rsi(9) / WEEKLY ema(rsi(9),3) >= 1.2",
+    ]
+    assert "AND d.prev_rsi_9 <= d.prev_ema_rsi_9_3" in scanner["sql"]
+    assert "d.w_rsi_9 AS weekly_rsi_9" in scanner["sql"]
+    assert scanner["sql"].rstrip().endswith("ORDER BY d.date DESC, s.symbol;")
+
+    frame = pd.DataFrame({
+        "rsi_9": [60.0, 60.0, 60.0], "ema_rsi_9_3": [50.0, 50.0, 50.0],
+        "prev_rsi_9": [40.0, 55.0, np.nan], "prev_ema_rsi_9_3": [50.0, 50.0, 50.0],
+        "w_rsi_9": [60.0, 60.0, 60.0], "w_ema_rsi_9_3": [40.0, 40.0, 0.0],
+    })
+    assert scanner["mask"](frame).tolist() == [True, False, False]
+
+    with pytest.raises(ValueError):
+        compile_scanner("x", {"conditions": [{"left": "1wk.pct_price_change", "op": ">", "value": 1}]})
+    with pytest.raises(ValueError):
+        compile_scanner("x", {"conditions": [{"cross": "1d.rsi_3", "op": "=", "value": 50}]})
+
+
+def test_scanner_cache_follows_data_version(make_database):
+    conn = scanner_database(make_database, symbols=3)
+    key = scan_cache_key(1, "range", "2016-01-01", None)
+    version = data_version(conn)
+    result = pd.read_sql(SQL_MAP[1], conn, params={"start": "2016-01-01", "end": "9999-12-31", "forward": 0})
+
+    save_cached_scan(key, version, result)
+    assert data_version(conn) == version
+    pd.testing.assert_frame_equal(load_cached_scan(key, version), result)
+    assert load_cached_scan(scan_cache_key(1, "backtest"), version) is None
+    assert load_cached_scan(scan_cache_key(1, "range", "2016-01-01", None, engine="vector"), version) is None
+
+    # a price download moves the version, so does the indicator refresh after it
+    last = latest_scan_date(conn)
+    logged = conn.execute("SELECT COUNT(*) FROM equity_price_changes").fetchone()[0]
+    conn.execute("""
+        INSERT INTO equity_price_data (symbol_id, timeframe, date, open, high, low, close, adj_close, volume)
+        VALUES (1, '1d', date(?, '+3 day'), 150, 151, 149, 150, 150, 1000)
+    """, (last,))
+    assert conn.execute("SELECT COUNT(*) FROM equity_price_changes").fetchone()[0] == logged
+    log_price_changes(conn, False, [(1, "1d", last)])      # as the ingest does per batch
+    conn.commit()
+    after_download = data_version(conn)
+    assert after_download != version
+    assert load_cached_scan(key, after_download) is None
+
+    refresh_indicators(conn, incremental=True)
+    after_refresh = data_version(conn)
+    assert after_refresh != after_download
+
+    # a backfill rewrites indicator values without any price change
+    refresh_indicators(conn, columns=["rsi_3"])
+    assert data_version(conn) != after_refresh
+    conn.close()
+
+
+def test_scanner_output_streams_in_chunks(make_database, tmp_path):
+    conn = scanner_database(make_database)
+    params = {"start": "", "end": "9999-12-31", "forward": 1}
+    expected = pd.read_sql(SQL_MAP[1], conn, params=params)
+    assert len(expected) > 7
+
+    def chunks():
+        cur = conn.execute(SQL_MAP[1], params)
+        columns = [desc[0] for desc in cur.description]
+        while rows := cur.fetchmany(7):
+            yield pd.DataFrame.from_records(rows, columns=columns)
+
+    csv_stats = write_scan_chunks(chunks(), str(tmp_path / "out.csv"), preview_rows=5)
+    parquet_stats = write_scan_chunks(chunks(), str(tmp_path / "out.parquet"), preview_rows=5)
+    pd.testing.assert_frame_equal(pd.read_csv(tmp_path / "out.csv"), expected, check_dtype=False)
+    pd.testing.assert_frame_equal(pd.read_parquet(tmp_path / "out.parquet"), expected, check_dtype=False)
+
+    for stats in (csv_stats, parquet_stats):
+        assert stats["matches"] == len(expected)
+        for column, agg in stats["returns"].items():
+            assert agg["count"] == expected[column].notna().sum()
+            assert agg["wins"] == (expected[column] > 0).sum()
+            assert agg["max_loss"] == expected[column].min()
+        latest = expected.sort_values(["date", "symbol"], ascending=False).head(5)
+        pd.testing.assert_frame_equal(stats["preview"], latest.reset_index(drop=True))
+
+    # latest / range rows without a forward close yet print as "-"
+    latest = pd.DataFrame({"symbol": ["AAA", "BBB"], "date": ["2024-01-02", "2024-01-03"],
+                           "ret_5d": [1.234, None], "ret_10d": [None, None]})
+    stats = write_scan_chunks([latest.astype({"ret_5d": object, "ret_10d": object})])
+    assert preview_rows(stats) == [("BBB", "2024-01-03", "-", "-"), ("AAA", "2024-01-02", "1.23", "-")]
+    assert stats["returns"]["ret_10d"] == {"count": 0, "wins": 0, "max_loss": None}
+
+    # the cache file fills while the chunks stream past
+    key, version = scan_cache_key(1), data_version(conn)
+    assert iter_cached_scan(key, version, 7) is None
+    streamed = pd.concat(tee_cached_scan(conn, key, version, chunks()), ignore_index=True)
+    pd.testing.assert_frame_equal(streamed, expected)
+    cached = pd.concat(iter_cached_scan(key, version, 7), ignore_index=True)
+    pd.testing.assert_frame_equal(cached, expected, check_dtype=False)
+    conn.close()
+
+
+def test_backtest_report_matches_forward_returns(make_database):
+    conn = scanner_database(make_database)
+    conn.execute("UPDATE equity_symbols SET sector = 'IT' WHERE symbol_id % 2 = 0")
+    expected = pd.read_sql(SQL_MAP[1], conn, params={"start": "", "end": "9999-12-31", "forward": 0})
+    report = backtest_report(conn, expected[["symbol", "date"]], horizons=[5, 10, 30])
+    signals = report["signals"]
+
+    # same forward returns as the scanner query, plus horizons it does not store
+    for column in ("ret_5d", "ret_10d"):
+        np.testing.assert_allclose(signals[column].round(2), expected[column])
+    prices = pd.read_sql("SELECT symbol_id, date, close, low FROM equity_price_data WHERE timeframe = '1d'", conn)
+    for _, signal in signals.iterrows():
+        path = prices[(prices["symbol_id"] == signal["symbol_id"]) & (prices["date"] >= signal["date"])]
+        entry = path["close"].iloc[0]
+        if len(path) > 30:
+            assert signal["ret_30d"] == pytest.approx((path["close"].iloc[30] - entry) / entry * 100)
+            assert signal["mae_30d"] == pytest.approx(min((path["low"].iloc[1:31].min() - entry) / entry * 100, 0))
+        else:
+            assert np.isnan(signal["ret_30d"])
+
+    overall = report["overall"].loc[10]
+    assert overall["trades"] == len(signals)
+    assert overall["win_rate"] == pytest.approx((signals["ret_10d"] > 0).mean() * 100)
+    assert overall["expectancy"] == pytest.approx(signals["ret_10d"].mean())
+    assert overall["p50"] == pytest.approx(signals["ret_10d"].median())
+    assert overall["mae_worst"] == pytest.approx(signals["mae_10d"].min())
+    assert report["sector"].loc[("IT", 5), "trades"] == (signals["symbol_id"] % 2 == 0).sum()
+    assert report["sector"].loc[("Unknown", 5), "trades"] == (signals["symbol_id"] % 2 == 1).sum()
+    assert report["year"]["trades"].sum() == report["overall"]["trades"].sum()
+    conn.close()
+
+    # flat trades count as trades, neither wins nor losses
+    stats = backtest_stats(pd.DataFrame({"ret_5d": [2.0, 0.0, -1.0, -3.0, np.nan],
+                                         "mae_5d": [0.0, -1.0, -2.0, -4.0, np.nan]}), horizons=[5]).loc[5]
+    assert stats["trades"] == 4 and stats["win_rate"] == 25
+    assert stats["avg_win"] == 2 and stats["avg_loss"] == -2
+
+
+def test_parallel_scan_matches_single_query(make_database, monkeypatch):
+    conn = scanner_database(make_database)
+    parts = date_partitions(conn, "2016-01-01", "9999-12-31", 5)
+    assert len(parts) == 5 and parts[0][0] == "2016-01-01"
+    assert all(hi < lo for (_, hi), (lo, _) in zip(parts, parts[1:]))
+
+    runs = [
+        {"start": "", "end": "9999-12-31", "forward": 1},
+        {"start": "2015-06-01", "end": "2016-06-30", "forward": 0},
+        {"start": "2030-01-01", "end": "9999-12-31", "forward": 0},
+    ]
+    for params in runs:
+        for choice in SQL_MAP:
+            expected = pd.read_sql(SQL_MAP[choice], conn, params=params)
+            chunks = list(parallel_scan_chunks(conn, SQL_MAP[choice], params, SCANNERS[choice]["ascending"], workers=2))
+            pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), expected, check_dtype=False)
+        # a date-descending scanner gets its partitions in reverse
+        with open(SCANNER_SPECS) as f:
+            newest_first = compile_scanner("desc", {**json.load(f)["2"], "order": "desc"})
+        expected = pd.read_sql(newest_first["sql"], conn, params=params)
+        chunks = list(parallel_scan_chunks(conn, newest_first["sql"], params, ascending=False, workers=2))
+        pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), expected, check_dtype=False)
+
+        batch_sql = compile_batch_sql({choice: SCANNERS[choice] for choice in SQL_MAP})
+        expected = pd.read_sql(batch_sql, conn, params=params)
+        found = pd.concat(parallel_scan_chunks(conn, batch_sql, params, workers=3), ignore_index=True)
+        pd.testing.assert_frame_equal(found, expected, check_dtype=False)
+
+    # a single day is one partition: run on conn, no process pool
+    monkeypatch.setattr(parallel_scanner, "ProcessPoolExecutor", None)
+    last = latest_scan_date(conn)
+    params = {"start": last, "end": last, "forward": 0}
+    assert date_partitions(conn, last, last, 8) == [(last, last)]
+    found = pd.concat(parallel_scan_chunks(conn, SQL_MAP[1], params, workers=4), ignore_index=True)
+    pd.testing.assert_frame_equal(found, pd.read_sql(SQL_MAP[1], conn, params=params), check_dtype=False)
+    conn.close()
+
+
+def test_derived_schema_is_stable_on_read_paths(make_database):
+    conn = scanner_database(make_database, symbols=2)
+    version = conn.execute("PRAGMA schema_version").fetchone()[0]
+
+    # the scanners' read paths call create_derived_tables: a no-op, also read-only
+    reader = sqlite3.connect(f"file:{DB_FILE}?mode=ro", uri=True)
+    create_derived_tables(reader.cursor())
+    assert not reader.in_transaction
+    reader.close()
+    create_derived_tables(conn.cursor())
+    assert conn.execute("PRAGMA schema_version").fetchone()[0] == version
+
+    # a changed view definition (e.g. a new indicator column) is rebuilt
+    conn.execute("DROP VIEW equity_indicators_all")
+    conn.execute("CREATE VIEW equity_indicators_all AS SELECT symbol_id FROM equity_indicators")
+    create_derived_tables(conn.cursor())
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(equity_indicators_all)")]
+    assert columns[-1] == "is_final" and "rsi_9" in columns
+    conn.close()
+
+def test_mtf_refresh_skips_when_nothing_moved(make_database):
+    conn = scanner_database(make_database, symbols=3)
+    query = "SELECT * FROM equity_mtf_daily ORDER BY symbol_id, date"
+
+    # no logged change and the same partial candles: no writes at all
+    changes = conn.total_changes
+    refresh_mtf_daily(conn)
+    assert conn.total_changes == changes
+    assert not conn.in_transaction
+
+    # a moved partial candle is picked up, the same as a rebuild
+    conn.execute("UPDATE equity_price_partial SET close = close + 5 WHERE symbol_id = 2")
+    conn.commit()
+    refresh_mtf_daily(conn)
+    assert conn.total_changes > changes
+    incremental = pd.read_sql(query, conn)
+    refresh_mtf_daily(conn, rebuild=True)
+    pd.testing.assert_frame_equal(incremental, pd.read_sql(query, conn))
+    conn.close()
+
+
+def test_indicator_refresh_keeps_mtf_daily_current(make_database):
+    conn = scanner_database(make_database, symbols=2)
+    query = "SELECT * FROM equity_mtf_daily ORDER BY symbol_id, date"
+    last = conn.execute("SELECT MAX(date) FROM equity_price_data WHERE timeframe = '1d'").fetchone()[0]
+
+    # a new session reaches equity_mtf_daily with the indicator refresh
+    conn.execute("""
+        INSERT INTO equity_price_data (symbol_id, timeframe, date, open, high, low, close, adj_close, volume)
+        VALUES (1, '1d', date(?, '+3 day'), 150, 151, 149, 150, 150, 1000)
+    """, (last,))
+    log_price_changes(conn, False, [(1, "1d", last)])
+    conn.commit()
+    refresh_indicators(conn, incremental=True)
+    assert conn.execute("SELECT MAX(date) FROM equity_mtf_daily").fetchone()[0] > last
+
+    # so does a backfill, which the change log does not carry
+    conn.execute("UPDATE equity_indicators SET rsi_3 = 0")
+    conn.commit()
+    refresh_mtf_daily(conn, rebuild=True)
+    refresh_indicators(conn, columns=["rsi_3"])
+    refreshed = pd.read_sql(query, conn)
+    assert refreshed["rsi_3"].max() > 0
+    refresh_mtf_daily(conn, rebuild=True)
+    pd.testing.assert_frame_equal(refreshed, pd.read_sql(query, conn))
+    conn.close()
+
+
+def test_scan_params_per_mode(make_database, tmp_path, monkeypatch):
+    conn = scanner_database(make_database, symbols=2)
+    last_mtf = conn.execute("SELECT MAX(date) FROM equity_mtf_daily").fetchone()[0]
+
+    assert scan_params(conn, "backtest") == {"start": "", "end": "9999-12-31", "forward": 1}
+    assert scan_params(conn, "range") == {"start": "", "end": "9999-12-31", "forward": 0}
+    assert scan_params(conn, "range", "2016-01-01", "2016-03-31") == \
+        {"start": "2016-01-01", "end": "2016-03-31", "forward": 0}
+    assert scan_params(conn, "latest") == {"start": last_mtf, "end": last_mtf, "forward": 0}
+    assert scan_params(conn, "latest", engine="vector")["start"] == latest_scan_date(conn) == last_mtf
+    with pytest.raises(ValueError):
+        scan_params(conn, "intraday")
+    conn.close()
+
+    # nothing to scan yet: latest is open-ended None and both engines find nothing
+    (tmp_path / "empty" / "database").mkdir(parents=True)
+    monkeypatch.chdir(tmp_path / "empty")
+    create_stock_database(drop_existing=True)
+    conn = sqlite3.connect(DB_FILE)
+    create_derived_tables(conn.cursor())
+    for engine in ("sql", "vector"):
+        params = scan_params(conn, "latest", engine=engine)
+        assert params == {"start": None, "end": None, "forward": 0}
+        assert pd.read_sql(SQL_MAP[1], conn, params=params).empty
+        assert scan_vectorized(conn, 1, **params).empty
+    conn.close()
@@ -0,0 +1,177 @@
+# =========================================================
+# THIS FILE CONTAINS THE FOLLOWING FUNCTIONS:
+# 1. map_period_dates
+# 2. refresh_timeframe_map
+# =========================================================
+# equity_timeframe_map aligns every final daily bar with the weekly and
+# monthly bar in force on that day:
+#   weekly_date  = latest 1wk date <= daily date
+#   monthly_date = latest 1mo date <= daily date
+# over equity_price_all (final bars plus the partial overlay candle). The
+# scanners join weekly / monthly rows on these dates instead of running a
+# correlated MAX() subquery for every daily row.
+#
+# Maintenance follows the price change log (consumer equity_timeframe_map):
+# a change at min_date can only move the mapping of daily dates on or after
+# min_date, so each touched symbol is remapped from its earliest changed
+# date. Partial candles are not logged; when the partial overlay has moved
+# since the last run (change_log.overlay_digest), rows pointing at one
+# (is_partial) and the days from each current partial candle on are
+# remapped. With no logged change and no partial move a run writes nothing.
+# =========================================================
+import time
+import traceback
+import numpy as np
+from helper import (
+    log,
+    TIMEFRAME_MAP_SYMBOLS
+)
+from create_db import create_derived_tables
+from change_log import (
+    read_price_changes,
+    advance_change_cursor,
+    compact_price_changes,
+    overlay_digest,
+    overlay_unchanged,
+    save_overlay_digest
+)
+
+MAP_CONSUMER = "equity_timeframe_map"
+
+# =========================================================
+# map_period_dates Function
+# For each (sorted) daily date, the latest of the sorted period dates on or
+# before it, or None when the period series starts later.
+# =========================================================
+def map_period_dates(daily_dates, period_dates):
+    mapped = np.full(len(daily_dates), None, dtype=object)
+    if len(period_dates):
+        idx = np.searchsorted(period_dates, daily_dates, side="right") - 1
+        mapped[idx >= 0] = period_dates[idx[idx >= 0]]
+    return mapped
+
+# =========================================================
+# _map_batch Function
+# Remaps the daily dates from each symbol's cutoff on ({id: first date,
+# '' = whole history}) in one ordered scan. Caller commits.
+# =========================================================
+def _map_batch(conn, cutoffs):
+    conn.execute("DROP TABLE IF EXISTS temp.timeframe_map_bounds")
+    conn.execute("CREATE TEMP TABLE timeframe_map_bounds (id INTEGER PRIMARY KEY, since TEXT)")
+    conn.executemany("INSERT INTO temp.timeframe_map_bounds (id, since) VALUES (?, ?)", cutoffs.items())
+
+    # --- Weekly / monthly dates: final bars plus the overlay candle ---
+    periods, partial = {}, {}
+    for symbol_id, timeframe, date in conn.execute("""
+        SELECT b.id, p.timeframe, p.date
+        FROM temp.timeframe_map_bounds b
+        CROSS JOIN equity_price_data p
+          ON p.symbol_id = b.id AND p.timeframe IN ('1wk', '1mo')
+        WHERE p.is_final = 1
+    """):
+        periods.setdefault((symbol_id, timeframe), []).append(date)
+    for symbol_id, timeframe, date in conn.execute("""
+        SELECT o.symbol_id, o.timeframe, o.date
+        FROM equity_price_partial o
+        WHERE o.symbol_id IN (SELECT id FROM temp.timeframe_map_bounds)
+    """):
+        if date not in periods.get((symbol_id, timeframe), ()):
+            periods.setdefault((symbol_id, timeframe), []).append(date)
+            partial[(symbol_id, timeframe)] = date
+    periods = {key: np.unique(np.array(dates, dtype=str)) for key, dates in periods.items()}
+    empty = np.array([], dtype=str)
+
+    # --- Daily dates to (re)map, one index seek per symbol ---
+    daily = {}
+    for symbol_id, date in conn.execute("""
+        SELECT b.id, p.date
+        FROM temp.timeframe_map_bounds b
+        CROSS JOIN equity_price_data p
+          ON p.symbol_id = b.id AND p.timeframe = '1d' AND p.date >= b.since
+        WHERE p.is_final = 1
+        ORDER BY b.id, p.date
+    """):
+        daily.setdefault(symbol_id, []).append(date)
+
+    conn.executemany("""
+        DELETE FROM equity_timeframe_map WHERE symbol_id = ? AND date >= ?
+    """, cutoffs.items())
+
+    rows = []
+    for symbol_id, dates in daily.items():
+        dates = np.array(dates, dtype=str)
+        weekly = map_period_dates(dates, periods.get((symbol_id, "1wk"), empty))
+        monthly = map_period_dates(dates, periods.get((symbol_id, "1mo"), empty))
+        is_partial = np.zeros(len(dates), dtype=int)
+        for timeframe, mapped in (("1wk", weekly), ("1mo", monthly)):
+            if (symbol_id, timeframe) in partial:
+                is_partial |= mapped == partial[(symbol_id, timeframe)]
+        rows.extend(zip([symbol_id] * len(dates), dates.tolist(), weekly.tolist(),
+                        monthly.tolist(), is_partial.tolist()))
+    conn.executemany("""
+        INSERT INTO equity_timeframe_map (symbol_id, date, weekly_date, monthly_date, is_partial)
+        VALUES (?, ?, ?, ?, ?)
+    """, rows)
+    return len(rows)
+
+# =========================================================
+# refresh_timeframe_map Function
+# Brings equity_timeframe_map up to date: symbols whose prices changed
+# since the last run (change log) and symbols with partial candles are
+# remapped from the earliest affected date. The first run, or
+# rebuild=True, maps the whole history.
+# =========================================================
+def refresh_timeframe_map(conn, rebuild=False):
+    cur = conn.cursor()
+    try:
+        start = time.time()
+        create_derived_tables(cur)
+        conn.commit()
+        change_seq, changes = read_price_changes(conn, False, MAP_CONSUMER)
+        partials = overlay_digest(conn, ("equity_price_partial",))
+        moved = not overlay_unchanged(conn, MAP_CONSUMER, partials)
+        if not rebuild and changes == {} and not moved:
+            # nothing logged and the partial candles are as last mapped: no writes
+            print(f"✅ equity_timeframe_map | up to date | {time.time()-start:.1f}s")
+            return
+
+        if rebuild or changes is None:
+            print("🧹 Rebuilding equity_timeframe_map from full history...")
+            cur.execute("DELETE FROM equity_timeframe_map")
+            cutoffs = {row[0]: "" for row in cur.execute("SELECT symbol_id FROM equity_symbols")}
+        else:
+            # earliest affected daily date per symbol
+            cutoffs = {}
+            sources = [
+                (symbol_id, min_date)
+                for timeframe_changes in changes.values()
+                for symbol_id, min_date in timeframe_changes.items()
+            ]
+            if moved:
+                sources += cur.execute("""
+                    SELECT symbol_id, MIN(date) FROM equity_price_partial GROUP BY symbol_id
+                """).fetchall()
+                sources += cur.execute("""
+                    SELECT symbol_id, MIN(date) FROM equity_timeframe_map
+                    WHERE is_partial = 1 GROUP BY symbol_id
+                """).fetchall()
+            for symbol_id, since in sources:
+                cutoffs[symbol_id] = min(cutoffs.get(symbol_id, since), since)
+
+        symbol_ids = sorted(cutoffs)
+        mapped = 0
+        for i in range(0, len(symbol_ids), TIMEFRAME_MAP_SYMBOLS):
+            batch = symbol_ids[i:i + TIMEFRAME_MAP_SYMBOLS]
+            mapped += _map_batch(conn, {symbol_id: cutoffs[symbol_id] for symbol_id in batch})
+            conn.commit()
+
+        advance_change_cursor(conn, False, MAP_CONSUMER, change_seq)
+        save_overlay_digest(conn, MAP_CONSUMER, partials)
+        compact_price_changes(conn, False)
+        conn.commit()
+        print(f"✅ equity_timeframe_map | {len(symbol_ids)} symbols | {mapped} daily rows mapped | {time.time()-start:.1f}s")
+
+    except Exception as e:
+        conn.rollback()
+        log(f"TIMEFRAME MAP REFRESH FAILED | {e}")
+        traceback.print_exc()
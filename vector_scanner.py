@@ -0,0 +1,212 @@
+# =========================================================
+# THIS FILE CONTAINS THE FOLLOWING FUNCTIONS:
+# 1. latest_scan_date
+# 2. scan_params
+# 3. load_scan_frame
+# 4. split_scanner_hits
+# 5. scan_vectorized_batch
+# 6. scan_vectorized
+# =========================================================
+# In-memory scanner backend: the same scans as sql.SQL_MAP, evaluated as
+# vectorized boolean masks over NumPy columns instead of in SQLite.
+#
+# Per batch of TIMEFRAME_MAP_SYMBOLS symbols:
+#   daily rows      equity_indicators (1d) + close, one index seek per
+#                   symbol between the row before :start and the
+#                   max(MTF_FORWARD_DAYS)-th row after :end
+#   prev_* / close_<n>d   groupby(symbol).shift on the sorted rows
+#   w_* / m_*       weekly / monthly indicator rows (partial candles
+#                   included) joined with a sorted as-of merge (merge_asof
+#                   by symbol, latest period date <= daily date)
+# so the frame carries exactly the columns of equity_mtf_daily
+# (create_db.mtf_daily_columns) and the scanner masks compiled from
+# scanner_specs.json (sql.SCANNERS) apply to it as the SQL does to the table.
+# Nothing has to be materialized first: refresh_mtf_daily is not needed.
+# =========================================================
+import time
+import traceback
+import numpy as np
+import pandas as pd
+from helper import (
+    log,
+    MTF_FORWARD_DAYS,
+    TIMEFRAME_MAP_SYMBOLS
+)
+from create_db import (
+    create_derived_tables,
+    mtf_daily_columns
+)
+from sql import SCANNERS
+
+# =========================================================
+# latest_scan_date Function
+# Last daily indicator date over all symbols (one index seek per symbol).
+# =========================================================
+def latest_scan_date(conn):
+    return conn.execute("""
+        SELECT MAX((
+            SELECT MAX(i.date) FROM equity_indicators i
+            WHERE i.symbol_id = s.symbol_id AND i.timeframe = '1d'
+        ))
+        FROM equity_symbols s
+    """).fetchone()[0]
+
+# =========================================================
+# scan_params Function
+# :start / :end / :forward params of a scanner run in one of SCAN_MODES
+# (see scanner.py). "latest" is the last equity_mtf_daily date for the sql
+# engine and latest_scan_date for vector, which does not read that table;
+# None when there is nothing to scan yet.
+# =========================================================
+SCAN_MODES = ("backtest", "latest", "range")
+
+def scan_params(conn, mode="backtest", start=None, end=None, engine="sql"):
+    if mode == "backtest":
+        return {"start": "", "end": "9999-12-31", "forward": 1}
+    if mode == "latest":
+        if engine == "vector":
+            last = latest_scan_date(conn)
+        else:
+            last = conn.execute("SELECT MAX(date) FROM equity_mtf_daily").fetchone()[0]
+        return {"start": last, "end": last, "forward": 0}
+    if mode == "range":
+        return {"start": start or "", "end": end or "9999-12-31", "forward": 0}
+    raise ValueError(f"Unknown scan mode: {mode} (expected one of {SCAN_MODES})")
+
+# =========================================================
+# load_scan_frame Function
+# Aligned daily frame for symbol_ids with dates between start and end:
+# one row per symbol and final trading day, columns as equity_mtf_daily.
+# =========================================================
+def load_scan_frame(conn, symbol_ids, start="", end="9999-12-31"):
+    columns = mtf_daily_columns()
+    ahead = max(MTF_FORWARD_DAYS, default=1) - 1
+
+    # --- Per-symbol read window: the row before start .. forward rows after end ---
+    conn.execute("DROP TABLE IF EXISTS temp.scan_bounds")
+    conn.execute("CREATE TEMP TABLE scan_bounds (id INTEGER PRIMARY KEY, lo TEXT, hi TEXT)")
+    conn.executemany("INSERT INTO temp.scan_bounds (id) VALUES (?)", [(i,) for i in symbol_ids])
+    conn.execute("""
+        UPDATE temp.scan_bounds SET
+            lo = COALESCE((
+                SELECT MAX(i.date) FROM equity_indicators i
+                WHERE i.symbol_id = scan_bounds.id AND i.timeframe = '1d' AND i.date < :start
+            ), ''),
+            hi = COALESCE((
+                SELECT i.date FROM equity_indicators i
+                WHERE i.symbol_id = scan_bounds.id AND i.timeframe = '1d' AND i.date > :end
+                ORDER BY i.date LIMIT 1 OFFSET :ahead
+            ), '9999-12-31')
+    """, {"start": start, "end": end, "ahead": ahead})
+
+    # --- Daily rows, ordered per symbol for the lag / lead shifts ---
+    daily_exprs = [f"{expr} AS {column}" for column, (source, expr) in columns.items() if source == "1d"]
+    daily = pd.read_sql(f"""
+        SELECT i.symbol_id, i.date, {", ".join(daily_exprs)}
+        FROM temp.scan_bounds b
+        CROSS JOIN equity_indicators i
+          ON i.symbol_id = b.id AND i.timeframe = '1d' AND i.date BETWEEN b.lo AND b.hi
+        JOIN equity_price_data p
+          ON p.symbol_id = i.symbol_id AND p.timeframe = i.timeframe AND p.date = i.date
+        WHERE p.is_final = 1
+        ORDER BY i.symbol_id, i.date
+    """, conn)
+
+    by_symbol = daily.groupby("symbol_id", sort=False)
+    for column, (source, expr) in columns.items():
+        if source == "lag":
+            daily[column] = by_symbol[expr].shift(1)
+        elif source == "lead":
+            base, days = expr
+            daily[column] = by_symbol[base].shift(-days)
+    daily = daily[(daily["date"] >= start) & (daily["date"] <= end)]
+
+    # --- Weekly / monthly rows in force on each day (as-of merge) ---
+    daily = daily.assign(on=pd.to_datetime(daily["date"], format="%Y-%m-%d")).sort_values("on", kind="stable")
+    for timeframe in ("1wk", "1mo"):
+        period_columns = {column: expr for column, (source, expr) in columns.items() if source == timeframe}
+        selects = "".join(f", i.{expr} AS {column}" for column, expr in period_columns.items())
+        periods = pd.read_sql(f"""
+            SELECT p.symbol_id, p.date AS period_date{selects}
+            FROM equity_price_all p
+            LEFT JOIN equity_indicators_all i
+              ON i.symbol_id = p.symbol_id AND i.timeframe = p.timeframe AND i.date = p.date
+            WHERE p.symbol_id IN (SELECT id FROM temp.scan_bounds) AND p.timeframe = ?
+        """, conn, params=(timeframe,))
+        periods["on"] = pd.to_datetime(periods.pop("period_date"), format="%Y-%m-%d")
+        daily = pd.merge_asof(daily, periods.sort_values("on", kind="stable"),
+                              on="on", by="symbol_id", direction="backward")
+
+    return daily.drop(columns="on").reset_index(drop=True)
+
+# =========================================================
+# split_scanner_hits Function
+# Splits a batch result (rows with hit_<id> flags, see
+# scanner_spec.compile_batch_sql) into {id: DataFrame} with each scanner's
+# result columns, forward returns and ORDER BY.
+# =========================================================
+def split_scanner_hits(found, scanner_ids):
+    returns = [f"ret_{days}d" for days in MTF_FORWARD_DAYS]
+    results = {}
+    for scanner_id in scanner_ids:
+        scanner = SCANNERS[int(scanner_id)]
+        rows = found[found[f"hit_{scanner_id}"].fillna(0).astype(bool)]
+        rows = rows.sort_values(["date", "symbol"], ascending=[scanner["ascending"], True], kind="stable")
+        result = pd.DataFrame({alias: rows[column] for alias, column in scanner["columns"].items()})
+        for column in returns:
+            result[column] = rows[column]
+        results[scanner_id] = result.reset_index(drop=True)
+    return results
+
+# =========================================================
+# scan_vectorized_batch Function
+# Runs several scanners over one shared pass: each symbol batch is loaded
+# and aligned once and every scanner's mask is evaluated on it. Returns
+# {id: DataFrame} with the columns and order of each SQL_MAP query.
+# forward=1 keeps only rows whose forward closes exist (backtests), like
+# :forward in sql.py.
+# =========================================================
+def scan_vectorized_batch(conn, choices, start="", end="9999-12-31", forward=1):
+    choices = [int(choice) for choice in choices]
+    forward_columns = [f"close_{days}d" for days in MTF_FORWARD_DAYS]
+    try:
+        begin = time.time()
+        create_derived_tables(conn.cursor())
+        conn.commit()
+        symbols = pd.read_sql("SELECT symbol_id, symbol FROM equity_symbols ORDER BY symbol_id", conn)
+
+        matches = []
+        symbol_ids = symbols["symbol_id"].tolist()
+        for i in range(0, len(symbol_ids), TIMEFRAME_MAP_SYMBOLS):
+            d = load_scan_frame(conn, symbol_ids[i:i + TIMEFRAME_MAP_SYMBOLS], start, end)
+            hits = {f"hit_{choice}": SCANNERS[choice]["mask"](d).to_numpy() for choice in choices}
+            keep = np.logical_or.reduce(list(hits.values()))
+            if forward:
+                keep &= d[forward_columns].notna().all(axis=1).to_numpy()
+            matches.append(d.assign(**hits)[keep])
+
+        if not matches:
+            # no symbols: an empty frame still carries the result columns
+            matches.append(load_scan_frame(conn, [], start, end).assign(
+                **{f"hit_{choice}": False for choice in choices}))
+        found = pd.concat(matches, ignore_index=True).merge(symbols, on="symbol_id")
+        close = found["close"].where(found["close"] != 0)
+        for days in MTF_FORWARD_DAYS:
+            found[f"ret_{days}d"] = ((found[f"close_{days}d"] - close) / close * 100).round(2)
+
+        results = split_scanner_hits(found, choices)
+        counts = ", ".join(f"{choice}: {len(result)}" for choice, result in results.items())
+        print(f"✅ Vector scan | {len(symbol_ids)} symbols | matches {counts} | {time.time()-begin:.1f}s")
+        return results
+
+    except Exception as e:
+        log(f"VECTOR SCAN FAILED | {e}")
+        traceback.print_exc()
+
+# =========================================================
+# scan_vectorized Function
+# Runs one scanner: scan_vectorized_batch for `choice` alone.
+# =========================================================
+def scan_vectorized(conn, choice, start="", end="9999-12-31", forward=1):
+    results = scan_vectorized_batch(conn, [choice], start, end, forward)
+    return None if results is None else results[int(choice)]